@@ -0,0 +1,86 @@
+"""
+fermvault app
+benchmarks/bench_settings_get_set.py
+
+Micro-benchmark for SettingsManager.get/set: the indexed lookup and runtime
+store versus the previous linear category scan. Run from the repo root:
+
+    python3 benchmarks/bench_settings_get_set.py
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from settings_manager import SettingsManager, TRANSIENT_DEFAULTS
+
+ITERATIONS = 200000
+
+# Keys the monitor loop and UI hit most often, spread across the categories
+GET_KEYS = ["control_mode", "beer_hold_f", "temp_units", "cooling_dwell_time_s", "active_api_service", "frequency_hours"]
+SET_KEYS = ["beer_temp_actual", "amb_temp_actual", "beer_setpoint_current", "sensor_error_message"]
+
+
+class LinearScanSettingsManager(SettingsManager):
+    """The pre-index implementation, kept here only for comparison."""
+
+    def __init__(self, settings_file_path=None):
+        super().__init__(settings_file_path)
+        # Runtime values used to live inside system_settings
+        self.settings['system_settings'].update(TRANSIENT_DEFAULTS)
+
+    def get(self, key, default=None):
+        with self._data_lock:
+            for category in self.settings.values():
+                if isinstance(category, dict) and key in category:
+                    return category[key]
+        return default
+
+    def set(self, key, value):
+        with self._data_lock:
+            for category_name, category_data in self.settings.items():
+                if isinstance(category_data, dict) and key in category_data:
+                    category_data[key] = value
+                    transient_keys = [
+                        "beer_temp_actual", "amb_temp_actual", "beer_temp_timestamp", "amb_temp_timestamp",
+                        "og_timestamp_var", "sg_timestamp_var",
+                        "amb_min_setpoint", "amb_max_setpoint", "beer_setpoint_current", "amb_target_setpoint",
+                        "heat_state", "cool_state", "cool_restriction_status", "sensor_error_message",
+                        "cooling_delay_message", "fan_state", "monitoring_state",
+                        "og_display_var", "sg_display_var", "fg_status_var", "fg_value_var",
+                    ]
+                    if key not in transient_keys:
+                        self._save_all_settings()
+                    return True
+        return False
+
+
+def bench(manager):
+    get_s = timeit.timeit(lambda: [manager.get(k) for k in GET_KEYS], number=ITERATIONS // len(GET_KEYS))
+    values = itertools.count()
+    set_s = timeit.timeit(lambda: [manager.set(k, next(values)) for k in SET_KEYS], number=ITERATIONS // len(SET_KEYS))
+    return get_s / ITERATIONS * 1e9, set_s / ITERATIONS * 1e9
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        # SettingsManager always creates ~/fermvault_lite-data; keep that inside the temp dir
+        os.environ["HOME"] = tmp
+        path = os.path.join(tmp, "bench_settings.json")
+        old = LinearScanSettingsManager(settings_file_path=path)
+        new = SettingsManager(settings_file_path=path)
+
+        old_get, old_set = bench(old)
+        new_get, new_set = bench(new)
+
+    print(f"{'':14}{'linear scan':>14}{'indexed':>14}{'speedup':>10}")
+    print(f"{'get() ns/call':14}{old_get:14.0f}{new_get:14.0f}{old_get / new_get:9.1f}x")
+    print(f"{'set() ns/call':14}{old_set:14.0f}{new_set:14.0f}{old_set / new_set:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
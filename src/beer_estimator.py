@@ -0,0 +1,235 @@
+"""
+fermvault app
+beer_estimator.py
+"""
+
+import math
+import threading
+import time
+
+# --- MODEL DEFAULTS ---
+# Prior thermal coupling between chamber air and beer (1/s). A 5 gal fermenter in
+# a fridge has a time constant of several hours, so start from ~8 hours.
+DEFAULT_COUPLING_PER_S = 1.0 / (8 * 3600)
+MIN_COUPLING_PER_S = 1.0 / (72 * 3600)
+MAX_COUPLING_PER_S = 1.0 / (20 * 60)
+
+LEARN_INTERVAL_S = 300          # Fit on 5 min spans (DS18B20 quantisation is too coarse per tick)
+FORGETTING_FACTOR = 0.98        # Per learning span (~4 hours memory)
+RIDGE_WEIGHT = 4.0              # Pulls the fit towards the prior when data is thin
+PROBE_SIGMA_F = 0.2             # Variance seed when the probe was last seen
+PROCESS_SIGMA_F_PER_HOUR = 0.75 # Model drift while predicting blind
+MAX_TICK_GAP_S = 120            # Larger gaps are not integrated (loop was stopped)
+# --- END MODEL DEFAULTS ---
+
+
+def _solve_3x3(a, b):
+    """Gaussian elimination with partial pivoting. Returns None if singular."""
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(3):
+        pivot = max(range(col, 3), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-18:
+            return None
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(col + 1, 3):
+            f = m[r][col] / m[col][col]
+            for c in range(col, 4):
+                m[r][c] -= f * m[col][c]
+    x = [0.0, 0.0, 0.0]
+    for r in range(2, -1, -1):
+        x[r] = (m[r][3] - sum(m[r][c] * x[c] for c in range(r + 1, 3))) / m[r][r]
+    return x
+
+
+class BeerTempEstimator:
+    """
+    Keeps a running estimate of beer temperature so control can continue
+    when the beer probe is lost.
+
+    First-order model:  dBeer/dt = k * (Ambient - Beer) + h * HEAT + c * COOL
+    k, h and c are fitted online from probe history. While the probe is out the
+    last known beer value is propagated with the measured ambient and the real
+    relay states, the variance grows with time, and hydrometer temperatures are
+    fused in with a scalar Kalman update.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        # Fitted parameters [k, h, c]
+        self.params = [DEFAULT_COUPLING_PER_S, 0.0, 0.0]
+        self._ata = [[0.0] * 3 for _ in range(3)]
+        self._atb = [0.0, 0.0, 0.0]
+
+        # Learning span accumulators
+        self._anchor_time = None
+        self._anchor_beer = None
+        self._span_amb_integral = 0.0
+        self._span_beer_integral = 0.0
+        self._span_heat_s = 0.0
+        self._span_cool_s = 0.0
+        self._span_seconds = 0.0
+
+        # Estimate state
+        self.estimate = None
+        self.variance = 0.0
+        self.last_step_time = None
+        self.probe_lost_since = None
+        self.hydrometer_updates = 0
+        self._last_external_at = None # measured_at of the last fused reading
+
+    # --- LEARNING ---
+    def _reset_span(self, now, beer):
+        self._anchor_time = now
+        self._anchor_beer = beer
+        self._span_amb_integral = 0.0
+        self._span_beer_integral = 0.0
+        self._span_heat_s = 0.0
+        self._span_cool_s = 0.0
+        self._span_seconds = 0.0
+
+    def _learn(self, now, beer, amb, heat_on, cool_on, dt):
+        if self._anchor_time is None or dt is None:
+            self._reset_span(now, beer)
+            return
+
+        self._span_amb_integral += amb * dt
+        self._span_beer_integral += beer * dt
+        self._span_heat_s += dt if heat_on else 0.0
+        self._span_cool_s += dt if cool_on else 0.0
+        self._span_seconds += dt
+
+        if self._span_seconds < LEARN_INTERVAL_S:
+            return
+
+        span = self._span_seconds
+        y = (beer - self._anchor_beer) / span
+        x = [
+            (self._span_amb_integral - self._span_beer_integral) / span,
+            self._span_heat_s / span,
+            self._span_cool_s / span,
+        ]
+
+        for i in range(3):
+            self._atb[i] = FORGETTING_FACTOR * self._atb[i] + x[i] * y
+            for j in range(3):
+                self._ata[i][j] = FORGETTING_FACTOR * self._ata[i][j] + x[i] * x[j]
+
+        # Ridge towards the prior (k0, 0, 0), scaled to the regressor magnitudes
+        scale = max(1.0, self._ata[0][0])
+        prior = [DEFAULT_COUPLING_PER_S, 0.0, 0.0]
+        a = [row[:] for row in self._ata]
+        b = self._atb[:]
+        for i in range(3):
+            reg = RIDGE_WEIGHT * (scale if i == 0 else 1.0) * 1e-3
+            a[i][i] += reg
+            b[i] += reg * prior[i]
+
+        solution = _solve_3x3(a, b)
+        if solution is not None:
+            k, h, c = solution
+            k = max(MIN_COUPLING_PER_S, min(MAX_COUPLING_PER_S, k))
+            # Relays can only push their own direction
+            h = max(0.0, h)
+            c = min(0.0, c)
+            self.params = [k, h, c]
+
+        self._reset_span(now, beer)
+
+    # --- PREDICTION ---
+    def _propagate(self, amb, heat_on, cool_on, dt):
+        k, h, c = self.params
+        drive = (h if heat_on else 0.0) + (c if cool_on else 0.0)
+        equilibrium = amb + drive / k
+        self.estimate = equilibrium + (self.estimate - equilibrium) * math.exp(-k * dt)
+        self.variance += (PROCESS_SIGMA_F_PER_HOUR ** 2) * dt / 3600.0
+
+    def step(self, beer_temp, amb_temp, heat_on, cool_on, now=None):
+        """
+        Feeds one control tick. heat_on/cool_on are the relay states that were
+        applied since the previous tick. Returns the current estimate or None.
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            dt = None
+            if self.last_step_time is not None:
+                dt = now - self.last_step_time
+                if dt <= 0 or dt > MAX_TICK_GAP_S:
+                    dt = None
+            self.last_step_time = now
+
+            if beer_temp is not None:
+                # Probe healthy: the estimate IS the probe, learn from it
+                if amb_temp is not None:
+                    self._learn(now, beer_temp, amb_temp, heat_on, cool_on, dt)
+                else:
+                    self._anchor_time = None
+                self.estimate = beer_temp
+                self.variance = PROBE_SIGMA_F ** 2
+                self.probe_lost_since = None
+                return self.estimate
+
+            # Probe lost
+            self._anchor_time = None
+            if self.probe_lost_since is None:
+                self.probe_lost_since = now
+            if self.estimate is None or amb_temp is None:
+                # Nothing to propagate from (or no ambient to propagate with)
+                if amb_temp is None:
+                    self.estimate = None
+                return self.estimate
+            if dt is not None:
+                self._propagate(amb_temp, heat_on, cool_on, dt)
+            return self.estimate
+
+    def add_external_measurement(self, temp_f, sigma_f, measured_at, max_age_s=1800):
+        """
+        Fuses an independent beer temperature (e.g. a floating hydrometer).
+        Only used while the probe is lost. Readings of unknown age, stale
+        readings and readings already fused (the API repeats the latest one
+        on every poll) are ignored.
+        """
+        if temp_f is None or measured_at is None:
+            return False
+        now = time.time()
+        if (now - measured_at) > max_age_s:
+            return False
+        with self._lock:
+            if self.probe_lost_since is None:
+                return False
+            if self._last_external_at is not None and measured_at <= self._last_external_at:
+                return False
+            self._last_external_at = measured_at
+            if self.estimate is None:
+                # No history at all: the hydrometer becomes the starting point
+                self.estimate = float(temp_f)
+                self.variance = sigma_f ** 2
+            else:
+                r = sigma_f ** 2
+                gain = self.variance / (self.variance + r)
+                self.estimate += gain * (float(temp_f) - self.estimate)
+                self.variance *= (1.0 - gain)
+            self.hydrometer_updates += 1
+            return True
+
+    # --- QUERIES ---
+    def get_estimate(self, max_age_s, max_sigma_f, now=None):
+        """
+        Returns (estimate_f, sigma_f) while the probe is lost and the estimate is
+        still inside its time limit and uncertainty bound, otherwise None.
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            if self.probe_lost_since is None or self.estimate is None:
+                return None
+            if (now - self.probe_lost_since) > max_age_s:
+                return None
+            sigma = math.sqrt(self.variance)
+            if sigma > max_sigma_f:
+                return None
+            return self.estimate, sigma
+
+    def get_model_summary(self):
+        """Human readable fitted parameters (for logs)."""
+        k, h, c = self.params
+        return f"tau {1.0 / k / 3600.0:.1f} h, heat {h * 3600.0:+.2f} F/h, cool {c * 3600.0:+.2f} F/h"
@@ -0,0 +1,129 @@
+"""
+fermvault app
+eta_predictor.py
+"""
+
+from collections import deque
+
+# --- DEFAULTS ---
+DEFAULT_WINDOW_SAMPLES = 360    # 30 min at the 5 s monitor tick
+MIN_FIT_SAMPLES = 24            # 2 min of data before any prediction
+MIN_SLOPE_F_PER_HOUR = 0.05     # Slower than this is treated as "not moving"
+REBASE_AFTER_S = 100000.0       # Keep time offsets small for numerical stability
+# --- END DEFAULTS ---
+
+
+def format_duration(seconds):
+    """Formats a duration as '45m', '3h 20m' or '2d 4h'."""
+    seconds = max(0, int(seconds))
+    minutes = seconds // 60
+    if minutes < 60:
+        return f"{minutes}m"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 48:
+        return f"{hours}h {minutes:02d}m"
+    days, hours = divmod(hours, 24)
+    return f"{days}d {hours}h"
+
+
+class TempTrendEstimator:
+    """
+    Fits a straight line to the most recent beer temperatures over a fixed-size
+    window. Running sums are updated incrementally on every add/evict, so a
+    fit costs O(1) per tick regardless of the window length.
+    """
+
+    def __init__(self, window_samples=DEFAULT_WINDOW_SAMPLES):
+        self._samples = deque()
+        self._window = window_samples
+        self._t0 = None
+        self._reset_sums()
+
+    def _reset_sums(self):
+        self._n = 0
+        self._st = 0.0
+        self._sy = 0.0
+        self._stt = 0.0
+        self._sty = 0.0
+
+    def _rebase(self, new_t0):
+        """Re-centres the time origin and rebuilds the sums (rare, O(window))."""
+        self._t0 = new_t0
+        self._reset_sums()
+        for t_abs, y in self._samples:
+            t = t_abs - self._t0
+            self._n += 1
+            self._st += t
+            self._sy += y
+            self._stt += t * t
+            self._sty += t * y
+
+    def clear(self):
+        self._samples.clear()
+        self._t0 = None
+        self._reset_sums()
+
+    def add(self, timestamp, temp):
+        """Adds one sample (epoch seconds, degrees F)."""
+        if self._t0 is None:
+            self._t0 = timestamp
+
+        self._samples.append((timestamp, temp))
+        t = timestamp - self._t0
+        self._n += 1
+        self._st += t
+        self._sy += temp
+        self._stt += t * t
+        self._sty += t * temp
+
+        if len(self._samples) > self._window:
+            old_abs, old_y = self._samples.popleft()
+            old_t = old_abs - self._t0
+            self._n -= 1
+            self._st -= old_t
+            self._sy -= old_y
+            self._stt -= old_t * old_t
+            self._sty -= old_t * old_y
+
+        if (self._samples[0][0] - self._t0) > REBASE_AFTER_S:
+            self._rebase(self._samples[0][0])
+
+    def fit(self):
+        """Returns (slope_f_per_s, intercept_f) relative to the internal origin, or None."""
+        if self._n < MIN_FIT_SAMPLES:
+            return None
+        denom = self._n * self._stt - self._st * self._st
+        if denom <= 0:
+            return None
+        slope = (self._n * self._sty - self._st * self._sy) / denom
+        intercept = (self._sy - slope * self._st) / self._n
+        return slope, intercept
+
+    def slope_per_hour(self):
+        result = self.fit()
+        return None if result is None else result[0] * 3600.0
+
+    def predict(self, timestamp):
+        """Fitted temperature at a given time, or None."""
+        result = self.fit()
+        if result is None:
+            return None
+        slope, intercept = result
+        return intercept + slope * (timestamp - self._t0)
+
+    def seconds_to_target(self, target, now, tolerance=0.2):
+        """
+        Seconds until the fitted trajectory reaches target.
+        0 if already within tolerance, None if not heading there (or no fit yet).
+        """
+        result = self.fit()
+        if result is None:
+            return None
+        slope, intercept = result
+        current = intercept + slope * (now - self._t0)
+        gap = target - current
+        if abs(gap) <= tolerance:
+            return 0.0
+        if abs(slope) * 3600.0 < MIN_SLOPE_F_PER_HOUR or (gap * slope) <= 0:
+            return None
+        return gap / slope
@@ -0,0 +1,338 @@
+"""
+fermvault app
+export.py
+"""
+
+import argparse
+import csv
+import glob
+import json
+import math
+import os
+import sqlite3
+import struct
+import sys
+import time
+from array import array
+from datetime import datetime
+
+import history_db
+import telemetry_store
+from log_rotation import read_csv_range, parse_csv_time
+
+# --- DEFAULTS ---
+DEFAULT_DATA_DIR = os.path.join(os.path.expanduser('~'), 'fermvault_lite-data')
+ROW_GROUP_SIZE = 4096          # Rows buffered per columnar row group (the only buffering anywhere)
+HISTORY_FETCH_ROWS = 1000
+USB_MOUNT_GLOBS = ("/media/*/*", "/media/*", "/mnt/*")
+# --- END DEFAULTS ---
+
+FORMATS = {"csv": ".csv", "jsonl": ".jsonl", "columnar": ".fvcb"}
+
+# Column types: "f" float, "i" integer, "s" text. Every source's first column is "ts".
+PID_COLUMNS = (("ts", "i"), ("mode", "s"), ("setpoint", "f"), ("measured", "f"), ("pid_output", "f"),
+               ("amb_min", "f"), ("amb_max", "f"), ("beer", "f"), ("amb", "f"),
+               ("heat", "i"), ("cool", "i"), ("aux", "i"), ("session", "i"))
+_TEXT_COLUMNS = {"mode", "relay", "reason", "session_id", "source", "created_at", "status",
+                 "first_ts", "last_ts", "message"}
+_INT_COLUMNS = {"heat", "cool", "aux", "is_on", "n"}
+
+SOURCES = ("pid",) + tuple(history_db.TABLES)
+
+
+# --- SOURCES (generators of tuples in column order) ---
+def _pid_from_telemetry(path, start, end):
+    for record in telemetry_store.read_range(path, start, end):
+        timestamp, setpoint, measured, pid_output, amb_min, amb_max, beer, amb, relays, mode, session_no = record
+        yield (timestamp, telemetry_store.MODE_NAMES.get(mode, "Unknown"),
+               *(telemetry_store.from_milli(v) for v in (setpoint, measured, pid_output, amb_min, amb_max, beer, amb)),
+               int(bool(relays & telemetry_store.RELAY_HEAT)), int(bool(relays & telemetry_store.RELAY_COOL)),
+               int(bool(relays & telemetry_store.RELAY_AUX)), session_no or None)
+
+
+def _pid_from_csv(path, start, end):
+    for row in read_csv_range(path, start, end):
+        numbers = []
+        for value in row[2:7]:
+            try:
+                numbers.append(float(value))
+            except ValueError:
+                numbers.append(None)
+        yield (int(parse_csv_time(row[0])), row[1], *numbers, None, None,
+               int(row[8] == "ON"), int(row[7] == "ON"), None, None)
+
+
+def _history_rows(db_path, table, start, end):
+    """Streams a history table through a read-only connection (safe while the app is writing)."""
+    columns = history_db.TABLES[table][1]
+    clauses, args = history_db.HistoryDB._time_clauses(start, end)
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(sql + " ORDER BY ts", args)
+        while True:
+            batch = cursor.fetchmany(HISTORY_FETCH_ROWS)
+            if not batch:
+                return
+            yield from batch
+    finally:
+        conn.close()
+
+
+def open_source(source, start=None, end=None, data_dir=DEFAULT_DATA_DIR):
+    """Returns (columns, row generator). columns: [(name, type)]."""
+    if source == "pid":
+        bin_path = os.path.join(data_dir, "pid_log.bin")
+        csv_path = os.path.join(data_dir, "pid_log.csv")
+        # pid_log_format decides which one is being written; use whichever has data
+        if os.path.exists(bin_path) or glob.glob(os.path.join(data_dir, "pid_log.*.bin*")):
+            return list(PID_COLUMNS), _pid_from_telemetry(bin_path, start, end)
+        return list(PID_COLUMNS), _pid_from_csv(csv_path, start, end)
+    if source not in history_db.TABLES:
+        raise ValueError(f"unknown export source '{source}'")
+    db_path = os.path.join(data_dir, history_db.HISTORY_DB_NAME)
+    if not os.path.exists(db_path):
+        raise ValueError(f"no history database at {db_path}")
+    columns = [(name, "s" if name in _TEXT_COLUMNS else "i" if name in _INT_COLUMNS else "f")
+               for name in history_db.TABLES[source][1]]
+    return columns, _history_rows(db_path, source, start, end)
+
+
+def downsample(rows, columns, step_s):
+    """
+    One row per step_s bucket (ts = bucket start): float columns are averaged,
+    the others keep the bucket's last value. Holds one bucket at a time.
+    """
+    types = [kind for _, kind in columns]
+    bucket, sums, counts, last = None, None, None, None
+    for row in rows:
+        start = row[0] - row[0] % step_s
+        if start != bucket:
+            if bucket is not None:
+                yield _bucket_row(bucket, types, sums, counts, last)
+            bucket, sums, counts = start, [0.0] * len(types), [0] * len(types)
+        for i, kind in enumerate(types):
+            if kind == "f" and row[i] is not None:
+                sums[i] += row[i]
+                counts[i] += 1
+        last = row
+    if bucket is not None:
+        yield _bucket_row(bucket, types, sums, counts, last)
+
+
+def _bucket_row(bucket, types, sums, counts, last):
+    out = [bucket]
+    for i in range(1, len(types)):
+        if types[i] == "f":
+            out.append(sums[i] / counts[i] if counts[i] else None)
+        else:
+            out.append(last[i])
+    return tuple(out)
+
+
+# --- WRITERS (stream rows to an open binary/text file; return rows written) ---
+def write_csv(rows, columns, f):
+    writer = csv.writer(f)
+    writer.writerow([name for name, _ in columns])
+    count = 0
+    for row in rows:
+        writer.writerow(["" if value is None else value for value in row])
+        count += 1
+    return count
+
+
+def write_jsonl(rows, columns, f):
+    names = [name for name, _ in columns]
+    count = 0
+    for row in rows:
+        f.write(json.dumps(dict(zip(names, row)), separators=(",", ":")) + "\n")
+        count += 1
+    return count
+
+
+# --- COLUMNAR FORMAT ("Parquet-lite") ---
+# header:    b"FVCB" | uint16 version | uint32 n | n bytes schema JSON {"columns": [[name, type], ...]}
+# row group: uint32 rows, then per column uint32 n | n bytes:
+#              "f" float64 (NaN = missing), "i" int64 (INT_MISSING = missing),
+#              "s" uint32 lengths (STR_MISSING = missing) followed by the UTF-8 bytes
+# footer:    JSON {"rows": total, "row_groups": [[offset, rows], ...]} | uint32 footer length | b"FVCB"
+COLUMNAR_MAGIC = b"FVCB"
+COLUMNAR_VERSION = 1
+INT_MISSING = -2 ** 63
+STR_MISSING = 2 ** 32 - 1
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+
+
+def _little_endian(arr):
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _encode_column(values, kind):
+    if kind == "f":
+        return _little_endian(array("d", (math.nan if v is None else float(v) for v in values)))
+    if kind == "i":
+        return _little_endian(array("q", (INT_MISSING if v is None else int(v) for v in values)))
+    encoded = [None if v is None else str(v).encode("utf-8") for v in values]
+    lengths = array("I", (STR_MISSING if v is None else len(v) for v in encoded))
+    return _little_endian(lengths) + b"".join(v for v in encoded if v is not None)
+
+
+def write_columnar(rows, columns, f):
+    schema = json.dumps({"columns": [list(c) for c in columns]}).encode("utf-8")
+    f.write(COLUMNAR_MAGIC + _U16.pack(COLUMNAR_VERSION) + _U32.pack(len(schema)) + schema)
+    row_groups, group, total = [], [], 0
+
+    def write_group():
+        row_groups.append([f.tell(), len(group)])
+        f.write(_U32.pack(len(group)))
+        for i, (_, kind) in enumerate(columns):
+            payload = _encode_column([row[i] for row in group], kind)
+            f.write(_U32.pack(len(payload)) + payload)
+
+    for row in rows:
+        group.append(row)
+        total += 1
+        if len(group) >= ROW_GROUP_SIZE:
+            write_group()
+            group = []
+    if group:
+        write_group()
+    footer = json.dumps({"rows": total, "row_groups": row_groups}).encode("utf-8")
+    f.write(footer + _U32.pack(len(footer)) + COLUMNAR_MAGIC)
+    return total
+
+
+class ColumnarReader:
+    """Reads .fvcb exports one row group at a time."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(4) != COLUMNAR_MAGIC:
+                raise ValueError(f"{path}: not a columnar export")
+            version = _U16.unpack(f.read(2))[0]
+            if version != COLUMNAR_VERSION:
+                raise ValueError(f"{path}: unsupported columnar version {version}")
+            schema_len = _U32.unpack(f.read(4))[0]
+            self.columns = [tuple(c) for c in json.loads(f.read(schema_len))["columns"]]
+            f.seek(-8, os.SEEK_END)
+            footer_len = _U32.unpack(f.read(4))[0]
+            if f.read(4) != COLUMNAR_MAGIC:
+                raise ValueError(f"{path}: truncated columnar export")
+            f.seek(-8 - footer_len, os.SEEK_END)
+            footer = json.loads(f.read(footer_len))
+        self.rows = footer["rows"]
+        self._row_groups = footer["row_groups"]
+
+    def row_groups(self):
+        """Yields {column name: list of values} per row group."""
+        with open(self.path, "rb") as f:
+            for offset, count in self._row_groups:
+                f.seek(offset + _U32.size)
+                group = {}
+                for name, kind in self.columns:
+                    payload = f.read(_U32.unpack(f.read(4))[0])
+                    group[name] = self._decode(payload, kind, count)
+                yield group
+
+    @staticmethod
+    def _decode(payload, kind, count):
+        if kind in ("f", "i"):
+            arr = array("d" if kind == "f" else "q")
+            arr.frombytes(payload)
+            if sys.byteorder == "big":
+                arr.byteswap()
+            if kind == "f":
+                return [None if math.isnan(v) else v for v in arr]
+            return [None if v == INT_MISSING else v for v in arr]
+        lengths = array("I")
+        lengths.frombytes(payload[:count * 4])
+        if sys.byteorder == "big":
+            lengths.byteswap()
+        values, pos = [], count * 4
+        for length in lengths:
+            if length == STR_MISSING:
+                values.append(None)
+            else:
+                values.append(payload[pos:pos + length].decode("utf-8"))
+                pos += length
+        return values
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "columnar": write_columnar}
+
+
+# --- PIPELINE ---
+def export(source, fmt, dest_path, start=None, end=None, step_s=0, data_dir=DEFAULT_DATA_DIR):
+    """Streams source rows in [start, end) to dest_path. Returns the number of rows written."""
+    if fmt not in WRITERS:
+        raise ValueError(f"unknown export format '{fmt}'")
+    columns, rows = open_source(source, start, end, data_dir)
+    if step_s:
+        rows = downsample(rows, columns, step_s)
+    tmp_path = dest_path + ".part"
+    if fmt == "columnar":
+        f = open(tmp_path, "wb")
+    else:
+        f = open(tmp_path, "w", newline="", encoding="utf-8")
+    try:
+        with f:
+            count = WRITERS[fmt](rows, columns, f)
+            f.flush()
+            os.fsync(f.fileno()) # USB sticks get pulled as soon as the UI says "done"
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, dest_path)
+    return count
+
+
+def export_filename(source, fmt, now=None):
+    stamp = datetime.fromtimestamp(now or time.time()).strftime("%Y%m%d-%H%M")
+    return f"fermvault_{source}_{stamp}{FORMATS[fmt]}"
+
+
+def find_usb_targets():
+    """Mounted removable drives (Raspberry Pi OS mounts them under /media/<user>/<label>)."""
+    targets = []
+    for pattern in USB_MOUNT_GLOBS:
+        for path in sorted(glob.glob(pattern)):
+            if os.path.ismount(path) and os.access(path, os.W_OK) and path not in targets:
+                targets.append(path)
+    return targets
+
+
+def _parse_time(text):
+    if text is None:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+if __name__ == "__main__":
+    # python3 export.py pid --format columnar --start 2026-10-01 --step 60 -o batch.fvcb
+    parser = argparse.ArgumentParser(description="Export FermVault telemetry/history")
+    parser.add_argument("source", choices=SOURCES)
+    parser.add_argument("-f", "--format", choices=sorted(WRITERS), default="csv")
+    parser.add_argument("--start", help="ISO date/time or epoch seconds (default: beginning)")
+    parser.add_argument("--end", help="ISO date/time or epoch seconds (default: now)")
+    parser.add_argument("--step", type=float, default=0, help="downsample to one row per STEP seconds")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("-o", "--output", help="output file (default: generated name in the current directory)")
+    args = parser.parse_args()
+
+    output = args.output or export_filename(args.source, args.format)
+    try:
+        rows = export(args.source, args.format, output, _parse_time(args.start), _parse_time(args.end),
+                      args.step, args.data_dir)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"Export failed: {e}")
+        sys.exit(1)
+    print(f"Exported {rows} rows to {output}.")
@@ -9,6 +9,8 @@ import os
 from datetime import datetime
 import time
 
+import io_accounting
+
 class FGCalculator:
     
     # NOTE: output_file is now only used for debugging/local data storage, not as a core requirement.
@@ -29,6 +31,8 @@ class FGCalculator:
         # --- MODIFICATION: Set the output file path to be *inside* the data_dir ---
         self.output_file = os.path.join(self.data_dir, output_file)
         # --- END MODIFICATIONS ---
+        
+        self.history = None # HistoryDB, set by the app
 
 
     def _get_api_parameters(self):
@@ -66,7 +70,7 @@ class FGCalculator:
                 # --- END MODIFICATION ---
                 
                 # Save data for inspection/debugging
-                with open(self.output_file, "w") as f:
+                with io_accounting.counted_open(self.output_file, "w") as f:
                     json.dump(data, f)
                 return data
             except IOError as e:
@@ -169,9 +173,20 @@ class FGCalculator:
         print(f"FG Calc: Starting analysis for {brew_session_id}. Tolerance: {tolerance}")
         
         try:
-            data = self._fetch_and_save_data(active_service, brew_session_id)
+            try:
+                data = self._fetch_and_save_data(active_service, brew_session_id)
+                if self.history:
+                    self.history.add_gravity_readings(brew_session_id, data.get('readings', []))
+            except Exception:
+                # --- NEW: Offline fallback to the readings stored by earlier fetches ---
+                stored = self.history.gravity_readings(brew_session_id) if self.history else []
+                if not stored:
+                    raise
+                print(f"FG Calc: API fetch failed; using {len(stored)} stored readings.")
+                data = {"readings": stored}
             
             results = self._analyze_fermentation(data, tolerance, window_size, max_outliers)
+            self._record_result(results)
             
             return {
                 "results": results, 
@@ -186,3 +201,12 @@ class FGCalculator:
             error_msg = str(e) if str(e) == "API fetch failed" else "calculation error"
             return {"error": error_msg, "stable": False, "settings": settings_dict}
             # --- END MODIFICATION ---
+
+    def _record_result(self, results):
+        if not self.history:
+            return
+        if results.get("overall_stable"):
+            self.history.add_fg_result("Stable", results.get("average_sg"),
+                                       results.get("first_timestamp"), results.get("last_timestamp"))
+        else:
+            self.history.add_fg_result(results.get("error") or "Pending")
@@ -0,0 +1,363 @@
+"""
+fermvault app
+gpio_backend.py
+"""
+
+import glob
+import os
+import time
+from collections import deque
+
+# Backend-neutral levels and modes. RelayControl only talks to these and the
+# methods below, so the relay logic runs on any machine with the mock backend.
+HIGH = 1
+LOW = 0
+IN = "in"
+OUT = "out"
+
+BACKEND_NAMES = ("auto", "lgpio", "rpi", "gpiod", "mock")
+DEFAULT_GPIOD_CHIP = "/dev/gpiochip0"
+MOCK_WRITE_HISTORY = 100000
+
+
+class GPIOBackend:
+    """
+    Minimal pin interface used by RelayControl (BCM numbering).
+    Hardware libraries are imported in __init__, never at module import.
+    """
+    name = "base"
+    is_hardware = False
+    supports_group_write = False
+    HIGH = HIGH
+    LOW = LOW
+    IN = IN
+    OUT = OUT
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, mode, initial=None):
+        raise NotImplementedError
+
+    def output(self, pin, level):
+        raise NotImplementedError
+
+    def input(self, pin):
+        raise NotImplementedError
+
+    def setup_group(self, pins, initial_levels):
+        """Claims several output pins together. Fallback: one setup per pin."""
+        for pin, level in zip(pins, initial_levels):
+            self.setup(pin, OUT, initial=level)
+
+    def output_many(self, pin_levels):
+        """
+        Writes several pins. Backends with grouped writes commit the whole
+        vector in one call; the fallback writes in the given order.
+        """
+        for pin, level in pin_levels:
+            self.output(pin, level)
+
+    def cleanup(self):
+        pass
+
+
+def _chip_number(chip_path):
+    digits = "".join(ch for ch in str(chip_path) if ch.isdigit())
+    return int(digits) if digits else 0
+
+
+class LgpioBackend(GPIOBackend):
+    """lgpio directly (Pi 5 / Bookworm). Relay pins claimed as a group are written in one call."""
+    name = "lgpio"
+    is_hardware = True
+    supports_group_write = True
+
+    def __init__(self, chip_path=DEFAULT_GPIOD_CHIP):
+        import lgpio
+        self._lgpio = lgpio
+        self._handle = lgpio.gpiochip_open(_chip_number(chip_path))
+        self._claimed = {}      # pin -> IN/OUT
+        self._groups = {}       # leader pin -> [pins]
+        self._group_of = {}     # pin -> leader pin
+
+    def _free(self, pin):
+        leader = self._group_of.get(pin)
+        if leader is not None:
+            # Break the group up; the other members are re-claimed singly at their current level
+            members = self._groups.pop(leader)
+            levels = {p: self._lgpio.gpio_read(self._handle, p) for p in members}
+            self._lgpio.group_free(self._handle, leader)
+            for p in members:
+                del self._group_of[p]
+                self._claimed.pop(p, None)
+                if p != pin:
+                    self._lgpio.gpio_claim_output(self._handle, p, levels[p])
+                    self._claimed[p] = OUT
+        elif pin in self._claimed:
+            self._lgpio.gpio_free(self._handle, pin)
+            del self._claimed[pin]
+
+    def setup(self, pin, mode, initial=None):
+        pin = int(pin)
+        if mode == OUT and initial is None:
+            initial = self._lgpio.gpio_read(self._handle, pin) if pin in self._claimed else LOW
+        self._free(pin)
+        if mode == OUT:
+            self._lgpio.gpio_claim_output(self._handle, pin, HIGH if initial else LOW)
+        else:
+            self._lgpio.gpio_claim_input(self._handle, pin)
+        self._claimed[pin] = mode
+
+    def setup_group(self, pins, initial_levels):
+        pins = [int(p) for p in pins]
+        for pin in pins:
+            self._free(pin)
+        levels = [HIGH if level else LOW for level in initial_levels]
+        self._lgpio.group_claim_output(self._handle, pins, levels)
+        leader = pins[0]
+        self._groups[leader] = pins
+        for pin in pins:
+            self._group_of[pin] = leader
+            self._claimed[pin] = OUT
+
+    def output(self, pin, level):
+        self._lgpio.gpio_write(self._handle, int(pin), HIGH if level else LOW)
+
+    def output_many(self, pin_levels):
+        pin_levels = [(int(pin), level) for pin, level in pin_levels]
+        leaders = {self._group_of.get(pin) for pin, _level in pin_levels}
+        if len(leaders) != 1 or None in leaders:
+            return GPIOBackend.output_many(self, pin_levels)
+        members = self._groups[leaders.pop()]
+        bits = 0
+        mask = 0
+        for pin, level in pin_levels:
+            bit = 1 << members.index(pin)
+            mask |= bit
+            if level:
+                bits |= bit
+        self._lgpio.group_write(self._handle, members[0], bits, mask)
+
+    def input(self, pin):
+        return HIGH if self._lgpio.gpio_read(self._handle, int(pin)) else LOW
+
+    def cleanup(self):
+        # Freeing a line returns it to the kernel (input); then release the chip
+        for leader in list(self._groups):
+            self._lgpio.group_free(self._handle, leader)
+        for pin in [p for p in self._claimed if p not in self._group_of]:
+            self._lgpio.gpio_free(self._handle, pin)
+        self._groups.clear()
+        self._group_of.clear()
+        self._claimed.clear()
+        self._lgpio.gpiochip_close(self._handle)
+
+
+class RPiGPIOBackend(GPIOBackend):
+    """RPi.GPIO API (the rpi-lgpio shim on Pi 5 / Bookworm, or classic RPi.GPIO)."""
+    name = "rpi"
+    is_hardware = True
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self._gpio = GPIO
+        self._gpio.setmode(GPIO.BCM)
+
+    def setwarnings(self, flag):
+        self._gpio.setwarnings(flag)
+
+    def setup(self, pin, mode, initial=None):
+        if mode == OUT:
+            if initial is None:
+                self._gpio.setup(pin, self._gpio.OUT)
+            else:
+                self._gpio.setup(pin, self._gpio.OUT, initial=self._gpio.HIGH if initial else self._gpio.LOW)
+        else:
+            self._gpio.setup(pin, self._gpio.IN)
+
+    def output(self, pin, level):
+        self._gpio.output(pin, self._gpio.HIGH if level else self._gpio.LOW)
+
+    def input(self, pin):
+        return HIGH if self._gpio.input(pin) else LOW
+
+    def cleanup(self):
+        self._gpio.cleanup()
+
+
+class GpiodBackend(GPIOBackend):
+    """libgpiod character device (python gpiod >= 2.0). Grouped pins share one multi-line request."""
+    name = "gpiod"
+    is_hardware = True
+    supports_group_write = True
+    CONSUMER = "fermvault"
+
+    def __init__(self, chip_path=DEFAULT_GPIOD_CHIP):
+        import gpiod
+        from gpiod.line import Direction, Value
+        if not hasattr(gpiod, "request_lines"):
+            raise ImportError("gpiod >= 2.0 is required")
+        if not os.path.exists(chip_path):
+            raise OSError(f"GPIO chip {chip_path} not found")
+        self._gpiod = gpiod
+        self._Direction = Direction
+        self._Value = Value
+        self.chip_path = chip_path
+        self._requests = {}  # pin -> LineRequest (grouped pins share one)
+        self._modes = {}     # pin -> IN/OUT
+
+    def _settings(self, mode, initial):
+        if mode == OUT:
+            value = self._Value.ACTIVE if initial else self._Value.INACTIVE
+            return self._gpiod.LineSettings(direction=self._Direction.OUTPUT, output_value=value)
+        return self._gpiod.LineSettings(direction=self._Direction.INPUT)
+
+    def setup(self, pin, mode, initial=None):
+        pin = int(pin)
+        request = self._requests.get(pin)
+        if mode == OUT and initial is None and request is not None:
+            # Keep the level the line currently has, like RPi.GPIO re-setup does
+            initial = request.get_value(pin) == self._Value.ACTIVE
+        if request is None:
+            config = {pin: self._settings(mode, bool(initial))}
+            self._requests[pin] = self._gpiod.request_lines(self.chip_path, config=config, consumer=self.CONSUMER)
+        else:
+            # Reconfigure the whole request so the other lines keep their settings
+            config = {}
+            for other in request.offsets:
+                if other == pin:
+                    config[other] = self._settings(mode, bool(initial))
+                else:
+                    other_mode = self._modes.get(other, IN)
+                    other_level = other_mode == OUT and request.get_value(other) == self._Value.ACTIVE
+                    config[other] = self._settings(other_mode, other_level)
+            request.reconfigure_lines(config)
+        self._modes[pin] = mode
+
+    def setup_group(self, pins, initial_levels):
+        pins = [int(p) for p in pins]
+        for pin in pins:
+            old = self._requests.get(pin)
+            if old is not None:
+                for other in old.offsets:
+                    self._requests.pop(other, None)
+                old.release()
+        config = {pin: self._settings(OUT, bool(level)) for pin, level in zip(pins, initial_levels)}
+        request = self._gpiod.request_lines(self.chip_path, config=config, consumer=self.CONSUMER)
+        for pin in pins:
+            self._requests[pin] = request
+            self._modes[pin] = OUT
+
+    def output(self, pin, level):
+        pin = int(pin)
+        self._requests[pin].set_value(pin, self._Value.ACTIVE if level else self._Value.INACTIVE)
+
+    def output_many(self, pin_levels):
+        pin_levels = [(int(pin), level) for pin, level in pin_levels]
+        requests = {id(self._requests[pin]) for pin, _level in pin_levels}
+        if len(requests) != 1:
+            return GPIOBackend.output_many(self, pin_levels)
+        request = self._requests[pin_levels[0][0]]
+        request.set_values({pin: self._Value.ACTIVE if level else self._Value.INACTIVE for pin, level in pin_levels})
+
+    def input(self, pin):
+        pin = int(pin)
+        return HIGH if self._requests[pin].get_value(pin) == self._Value.ACTIVE else LOW
+
+    def cleanup(self):
+        # Return the lines to inputs (high impedance) before releasing them
+        released = set()
+        for request in self._requests.values():
+            if id(request) in released:
+                continue
+            released.add(id(request))
+            try:
+                request.reconfigure_lines({pin: self._settings(IN, False) for pin in request.offsets})
+            finally:
+                request.release()
+        self._requests.clear()
+        self._modes.clear()
+
+
+class MockGPIOBackend(GPIOBackend):
+    """
+    In-memory pins. Every write is recorded as (timestamp, pin, level) in
+    self.writes so relay behaviour can be inspected and benchmarked anywhere.
+    """
+    name = "mock"
+    is_hardware = False
+    supports_group_write = True
+
+    def __init__(self, history=MOCK_WRITE_HISTORY):
+        self.levels = {}
+        self.modes = {}
+        self.writes = deque(maxlen=history)
+        self.read_count = 0
+        self.write_calls = 0 # Backend calls (a grouped write counts once)
+
+    def setup(self, pin, mode, initial=None):
+        self.modes[pin] = mode
+        if mode == OUT:
+            level = self.levels.get(pin, LOW) if initial is None else (HIGH if initial else LOW)
+            self._write(pin, level)
+
+    def _write(self, pin, level):
+        level = HIGH if level else LOW
+        self.levels[pin] = level
+        self.writes.append((time.time(), pin, level))
+
+    def output(self, pin, level):
+        if self.modes.get(pin) != OUT:
+            raise RuntimeError(f"Mock GPIO: pin {pin} is not set up as an output")
+        self.write_calls += 1
+        self._write(pin, level)
+
+    def output_many(self, pin_levels):
+        for pin, _level in pin_levels:
+            if self.modes.get(pin) != OUT:
+                raise RuntimeError(f"Mock GPIO: pin {pin} is not set up as an output")
+        self.write_calls += 1
+        for pin, level in pin_levels:
+            self._write(pin, level)
+
+    def input(self, pin):
+        self.read_count += 1
+        return self.levels.get(pin, HIGH)
+
+    def cleanup(self):
+        for pin in self.modes:
+            self.modes[pin] = IN
+
+
+def create_backend(name="auto", chip_path=DEFAULT_GPIOD_CHIP):
+    """
+    Returns a GPIO backend. "auto" tries lgpio, RPi.GPIO, then libgpiod. It falls
+    back to the mock only on a machine without GPIO chips; on real hardware a
+    missing library raises RuntimeError instead (the mock is then opt-in).
+    """
+    name = (name or "auto").lower()
+    if name == "mock":
+        return MockGPIOBackend()
+    if name == "lgpio":
+        return LgpioBackend(chip_path)
+    if name == "rpi":
+        return RPiGPIOBackend()
+    if name == "gpiod":
+        return GpiodBackend(chip_path)
+
+    errors = []
+    for factory in (lambda: LgpioBackend(chip_path), RPiGPIOBackend, lambda: GpiodBackend(chip_path)):
+        try:
+            return factory()
+        except Exception as e: # ImportError, missing chip, lgpio.error ...
+            print(f"[GPIO] Backend unavailable: {e}")
+            errors.append(str(e))
+    if glob.glob("/dev/gpiochip*"):
+        # Real GPIO hardware: never pretend to drive relays with the mock
+        raise RuntimeError(
+            "GPIO hardware found but no GPIO library could be loaded (" + "; ".join(errors) + "). "
+            "Install lgpio, RPi.GPIO or gpiod, or set gpio_backend to 'mock'."
+        )
+    print("[GPIO] WARNING: No GPIO hardware on this machine. Using MOCK backend - relays are NOT driven.")
+    return MockGPIOBackend()
@@ -0,0 +1,150 @@
+"""
+fermvault app
+history_chart.py
+"""
+
+from kivy.graphics import Color, Line, Mesh, Rectangle
+from kivy.properties import NumericProperty
+from kivy.uix.widget import Widget
+
+# --- DEFAULTS ---
+RELAY_STRIP_FRACTION = 0.18   # Bottom part of the chart used for relay duty bars
+Y_PADDING_F = 0.5             # Degrees added above/below the data range
+RANGES_H = (("6H", 6), ("24H", 24), ("3D", 72), ("7D", 168), ("30D", 720))
+# --- END DEFAULTS ---
+
+# (rollup column, rgba). Rows come from HistoryDB.series(), so raw samples and rollups look alike.
+SERIES = (
+    ("env_low_min", (0.45, 0.45, 0.45, 1)),
+    ("env_high_max", (0.45, 0.45, 0.45, 1)),
+    ("amb_mean", (1.0, 0.6, 0.2, 1)),
+    ("beer_mean", (0.2, 0.8, 1.0, 1)),
+)
+RELAYS = (
+    ("heat_duty", (0.9, 0.25, 0.2, 1)),
+    ("cool_duty", (0.2, 0.5, 1.0, 1)),
+    ("aux_duty", (0.6, 0.6, 0.6, 1)),
+)
+
+
+def lttb(xs, ys, threshold):
+    """
+    Largest-Triangle-Three-Buckets: picks `threshold` of the points that
+    best preserve the visual shape (peaks and dips survive, unlike plain
+    averaging or striding). Returns (xs, ys) lists.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(xs), list(ys)
+    out_x, out_y = [xs[0]], [ys[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        count = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / count
+        avg_y = sum(ys[avg_start:avg_end]) / count
+
+        ax, ay = xs[a], ys[a]
+        best, best_area = avg_start - 1, -1.0
+        for j in range(int(i * every) + 1, avg_start):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        out_x.append(xs[best])
+        out_y.append(ys[best])
+        a = best
+    out_x.append(xs[-1])
+    out_y.append(ys[-1])
+    return out_x, out_y
+
+
+class HistoryChart(Widget):
+    """
+    Temperature lines over relay duty bars. Each series is LTTB-decimated to
+    the widget's pixel width and drawn as a single Line, each relay as a
+    single Mesh, so even a 30-day range is a handful of canvas instructions.
+    """
+
+    y_min = NumericProperty(0.0)
+    y_max = NumericProperty(0.0)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.rows = []
+        self.start = None
+        self.end = None
+        self.bind(pos=self._redraw, size=self._redraw)
+
+    def set_rows(self, rows, start=None, end=None):
+        """rows: HistoryDB.series() rows, oldest first. start/end fix the time axis (default: the data)."""
+        self.start = start
+        self.end = end
+        self.rows = [row for row in rows if start is None or row["ts"] >= start]
+        self._redraw()
+
+    def _redraw(self, *args):
+        self.canvas.clear()
+        with self.canvas:
+            Color(0.1, 0.1, 0.1, 1)
+            Rectangle(pos=self.pos, size=self.size)
+        rows = self.rows
+        if len(rows) < 2 or self.width < 10 or self.height < 10:
+            return
+
+        t0 = rows[0]["ts"] if self.start is None else self.start
+        t1 = rows[-1]["ts"] if self.end is None else self.end
+        span = max(t1 - t0, 1.0)
+        strip_h = self.height * RELAY_STRIP_FRACTION
+        plot_y, plot_h = self.y + strip_h, self.height - strip_h
+        pixels = int(self.width)
+
+        values = [row[column] for row in rows for column, _ in SERIES if row[column] is not None]
+        if not values:
+            return
+        self.y_min = min(values) - Y_PADDING_F
+        self.y_max = max(values) + Y_PADDING_F
+        y_scale = plot_h / (self.y_max - self.y_min)
+        x_scale = self.width / span
+
+        with self.canvas:
+            for column, rgba in SERIES:
+                xs = [row["ts"] for row in rows if row[column] is not None]
+                ys = [row[column] for row in rows if row[column] is not None]
+                if len(xs) < 2:
+                    continue
+                xs, ys = lttb(xs, ys, pixels)
+                points = []
+                for x, y in zip(xs, ys):
+                    points += [self.x + (x - t0) * x_scale, plot_y + (y - self.y_min) * y_scale]
+                Color(*rgba)
+                Line(points=points)
+
+            band_h = strip_h / len(RELAYS)
+            for band, (column, rgba) in enumerate(RELAYS):
+                vertices, indices = self._duty_mesh(rows, column, t0, x_scale, pixels,
+                                                    self.y + band * band_h, band_h * 0.9)
+                if vertices:
+                    Color(*rgba)
+                    Mesh(vertices=vertices, indices=indices, mode='triangles')
+
+    def _duty_mesh(self, rows, column, t0, x_scale, pixels, base_y, band_h):
+        """One bar per pixel column, height = mean duty of the rows falling in it."""
+        totals = [0.0] * (pixels + 1)
+        counts = [0] * (pixels + 1)
+        for row in rows:
+            px = min(pixels, int((row["ts"] - t0) * x_scale))
+            totals[px] += row[column] or 0.0
+            counts[px] += 1
+        vertices, indices = [], []
+        for px in range(pixels + 1):
+            if not counts[px] or not totals[px]:
+                continue
+            top = base_y + band_h * totals[px] / counts[px]
+            x0, x1 = self.x + px, self.x + px + 1
+            i = len(vertices) // 4
+            vertices += [x0, base_y, 0, 0, x1, base_y, 0, 0, x1, top, 0, 0, x0, top, 0, 0]
+            indices += [i, i + 1, i + 2, i, i + 2, i + 3]
+        return vertices, indices
@@ -0,0 +1,413 @@
+"""
+fermvault app
+history_db.py
+"""
+
+import os
+import queue
+import sqlite3
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+
+import io_accounting
+import rollups
+
+# --- DEFAULTS ---
+HISTORY_DB_NAME = "history.db"
+HISTORY_QUEUE_SIZE = 5000
+HISTORY_BATCH_ROWS = 200          # Commit after this many queued rows...
+HISTORY_BATCH_INTERVAL_S = 30.0   # ...or this long after the first uncommitted row
+# --- END DEFAULTS ---
+
+SCHEMA_VERSION = 3 # 2: rollup_* tables, 3: session_id on samples and relay_events
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    ts REAL NOT NULL,
+    beer_temp REAL, amb_temp REAL,
+    amb_min REAL, amb_max REAL, beer_setpoint REAL,
+    mode TEXT, heat INTEGER, cool INTEGER, aux INTEGER, session_id TEXT
+);
+CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts);
+
+CREATE TABLE IF NOT EXISTS relay_events (
+    ts REAL NOT NULL, relay TEXT NOT NULL, is_on INTEGER NOT NULL, reason TEXT, session_id TEXT
+);
+CREATE INDEX IF NOT EXISTS relay_events_ts ON relay_events (ts);
+
+CREATE TABLE IF NOT EXISTS gravity (
+    ts REAL NOT NULL, session_id TEXT, sg REAL, temp_f REAL, source TEXT, created_at TEXT,
+    UNIQUE (session_id, ts)
+);
+CREATE INDEX IF NOT EXISTS gravity_ts ON gravity (ts);
+
+CREATE TABLE IF NOT EXISTS fg_results (
+    ts REAL NOT NULL, status TEXT, fg REAL, first_ts TEXT, last_ts TEXT
+);
+CREATE INDEX IF NOT EXISTS fg_results_ts ON fg_results (ts);
+
+CREATE TABLE IF NOT EXISTS system_log (
+    ts REAL NOT NULL, message TEXT
+);
+CREATE INDEX IF NOT EXISTS system_log_ts ON system_log (ts);
+"""
+
+# table -> (insert verb, columns). Gravity readings are re-fetched from the API, so duplicates are ignored.
+TABLES = {
+    "samples": ("INSERT", ("ts", "beer_temp", "amb_temp", "amb_min", "amb_max", "beer_setpoint", "mode", "heat", "cool", "aux", "session_id")),
+    "relay_events": ("INSERT", ("ts", "relay", "is_on", "reason", "session_id")),
+    "gravity": ("INSERT OR IGNORE", ("ts", "session_id", "sg", "temp_f", "source", "created_at")),
+    "fg_results": ("INSERT", ("ts", "status", "fg", "first_ts", "last_ts")),
+    "system_log": ("INSERT", ("ts", "message")),
+}
+# Columns added after the first release: (table, column, type) for ALTER TABLE on older databases
+MIGRATIONS = (
+    ("samples", "session_id", "TEXT"),
+    ("relay_events", "session_id", "TEXT"),
+)
+
+# Rollup windows are rewritten while open, so they are upserted on their start time
+for _res in rollups.RESOLUTIONS:
+    TABLES[rollups.table_name(_res)] = ("INSERT OR REPLACE", rollups.COLUMNS)
+AGGREGATE_COLUMNS = {
+    "samples": ("beer_temp", "amb_temp", "amb_min", "amb_max", "beer_setpoint", "heat", "cool", "aux"),
+    "gravity": ("sg", "temp_f"),
+}
+
+# WAL-index (-shm) header fields (https://www.sqlite.org/walformat.html), native byte order.
+# The -wal file is reused after a checkpoint without shrinking, so its size says nothing
+# about what a commit wrote; the frame counters do.
+_WAL_INDEX_HEADER_SIZE = 136
+_WAL_MX_FRAME_OFFSET = 16    # Frames in the WAL
+_WAL_SALT_OFFSET = 32        # Changes when the WAL restarts from its first frame
+_WAL_BACKFILL_OFFSET = 96    # Frames already checkpointed into the database file
+_WAL_FRAME_HEADER_SIZE = 24
+
+_FLUSH = "flush"
+_STOP = "stop"
+
+
+def _number(value):
+    """Runtime values may be '--.-' placeholders; store those as NULL."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_api_time(text):
+    """API timestamps (ISO 8601, UTC when no offset is given) -> epoch seconds, or None."""
+    if not text:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(text).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class HistoryDB:
+    """
+    Local SQLite (WAL) history of sensor samples, relay transitions, gravity
+    readings, FG results and system log messages. Samples are also rolled up
+    into 1 min / 15 min / 1 h windows (see rollups) for long-range charts.
+
+    add_*() only queue a row; a writer thread inserts in batches (one
+    transaction per batch). Queries open their own per-thread connection,
+    which WAL lets run alongside the writer.
+    """
+
+    def __init__(self, path, batch_rows=HISTORY_BATCH_ROWS, batch_interval_s=HISTORY_BATCH_INTERVAL_S):
+        self.path = path
+        self._batch_rows = batch_rows
+        self._batch_interval_s = batch_interval_s
+        self._queue = queue.Queue(maxsize=HISTORY_QUEUE_SIZE)
+        self._local = threading.local()
+        self.dropped = 0
+        self.available = False
+        self.rollups = None
+        self.session_id = None # Tag for new samples/relay events; set by sessions.SessionManager
+
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = self._connect()
+            conn.executescript(SCHEMA + rollups.schema_sql())
+            self._migrate(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+            self._page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            self._write_conn = conn
+            self.available = True
+        except sqlite3.Error as e:
+            print(f"[HistoryDB] Could not open {path}: {e}. History disabled.")
+            return
+
+        self.rollups = rollups.RollupAggregator()
+        self._restore_rollups()
+
+        self._thread = threading.Thread(target=self._run, name="history-db", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL") # WAL: durable at checkpoints, never corrupt
+        return conn
+
+    @staticmethod
+    def _migrate(conn):
+        for table, column, kind in MIGRATIONS:
+            existing = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+        conn.execute("CREATE INDEX IF NOT EXISTS samples_session ON samples (session_id)")
+
+    def _restore_rollups(self):
+        """Replays the samples of the current (coarsest) window so it continues after a restart."""
+        coarsest = max(rollups.RESOLUTIONS)
+        columns = ", ".join(TABLES["samples"][1])
+        try:
+            last = self._write_conn.execute("SELECT MAX(ts) FROM samples").fetchone()[0]
+            if last is None:
+                return
+            self.rollups.restore(self._write_conn.execute(
+                f"SELECT {columns} FROM samples WHERE ts >= ? ORDER BY ts", (last - last % coarsest,)
+            ))
+        except sqlite3.Error as e:
+            print(f"[HistoryDB] Could not restore rollups: {e}")
+
+    # --- PRODUCERS (any thread, never block) ---
+    def _put(self, table, row):
+        self._put_many(table, [row])
+
+    def _put_many(self, table, rows):
+        if not self.available or not rows:
+            return
+        try:
+            self._queue.put_nowait((table, rows))
+        except queue.Full:
+            self.dropped += len(rows)
+
+    def add_sample(self, beer_temp, amb_temp, amb_min, amb_max, beer_setpoint, mode, heat_on, cool_on, aux_on, timestamp=None):
+        self._put("samples", (
+            timestamp or time.time(), _number(beer_temp), _number(amb_temp), _number(amb_min),
+            _number(amb_max), _number(beer_setpoint), mode, int(bool(heat_on)), int(bool(cool_on)), int(bool(aux_on)),
+            self.session_id,
+        ))
+
+    def add_relay_transition(self, name, is_on, timestamp=None, reason=None):
+        """Signature matches RelayControl transition listeners."""
+        self._put("relay_events", (timestamp or time.time(), name, int(bool(is_on)), reason, self.session_id))
+
+    def add_gravity(self, created_at, sg, session_id=None, temp_f=None, source="api"):
+        """created_at: the API timestamp string. Readings already stored are ignored."""
+        self.add_gravity_readings(session_id, [{"created_at": created_at, "gravity": sg, "temperature": temp_f}], source)
+
+    def add_gravity_readings(self, session_id, readings, source="api"):
+        """Stores a list of API readings ({'gravity', 'created_at', ...}) as one queued batch."""
+        rows = []
+        for reading in readings:
+            ts = parse_api_time(reading.get("created_at"))
+            if ts is not None and reading.get("gravity") is not None:
+                rows.append((ts, session_id, _number(reading.get("gravity")),
+                             _number(reading.get("temperature")), source, reading.get("created_at")))
+        self._put_many("gravity", rows)
+
+    def add_fg_result(self, status, fg=None, first_ts=None, last_ts=None, timestamp=None):
+        self._put("fg_results", (timestamp or time.time(), status, _number(fg), first_ts, last_ts))
+
+    def add_log(self, message, timestamp=None):
+        self._put("system_log", (timestamp or time.time(), message))
+
+    def flush(self, timeout=5.0):
+        """Commits everything queued so far (waits at most timeout)."""
+        if not self.available:
+            return
+        done = threading.Event()
+        try:
+            self._queue.put((_FLUSH, done), timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        if not self.available:
+            return
+        try:
+            self._queue.put((_STOP, None), timeout=timeout)
+        except queue.Full:
+            print("[HistoryDB] Queue full at shutdown; unwritten rows lost.")
+            return
+        self._thread.join(timeout)
+        self.available = False
+
+    # --- WRITER THREAD ---
+    def _run(self):
+        pending = {}
+        pending_rows = 0
+        first_pending = 0.0
+        while True:
+            timeout = None
+            if pending_rows:
+                timeout = max(0.0, first_pending + self._batch_interval_s - time.monotonic())
+            try:
+                table, rows = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                table, rows = None, None
+
+            if table == _FLUSH or table == _STOP:
+                self._commit(pending)
+                pending, pending_rows = {}, 0
+                if table == _STOP:
+                    self._write_conn.close()
+                    return
+                rows.set()
+                continue
+            if table is not None:
+                pending.setdefault(table, []).extend(rows)
+                if not pending_rows:
+                    first_pending = time.monotonic()
+                pending_rows += len(rows)
+                if pending_rows < self._batch_rows:
+                    continue
+            if pending_rows:
+                self._commit(pending)
+                pending, pending_rows = {}, 0
+
+    def _commit(self, pending):
+        if not pending:
+            return
+        if self.dropped:
+            print(f"[HistoryDB] Queue full: {self.dropped} rows dropped so far.")
+        if pending.get("samples"):
+            # Rollups are written in the same transaction as the samples they summarise
+            for sample in pending["samples"]:
+                for table, row in self.rollups.add(sample):
+                    pending.setdefault(table, []).append(row)
+            for table, row in self.rollups.open_rows():
+                pending.setdefault(table, []).append(row)
+        wal_before = self._wal_state()
+        changes_before = self._write_conn.total_changes
+        try:
+            with self._write_conn: # One transaction per batch
+                for table, rows in pending.items():
+                    verb, columns = TABLES[table]
+                    placeholders = ", ".join("?" * len(columns))
+                    self._write_conn.executemany(
+                        f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows
+                    )
+        except sqlite3.Error as e:
+            print(f"[HistoryDB] Batch insert failed: {e}")
+            return
+        wal_after = self._wal_state()
+        if wal_before is not None and wal_after is not None:
+            nbytes = self._wal_bytes_written(wal_before, wal_after)
+        else:
+            # No readable WAL index: assume one page per changed row
+            nbytes = (self._write_conn.total_changes - changes_before) * self._page_size
+        io_accounting.record_write(self.path, nbytes)
+
+    def _wal_state(self):
+        """(salt, frames in WAL, frames checkpointed) from the -shm header, or None."""
+        try:
+            with open(self.path + "-shm", "rb") as f:
+                header = f.read(_WAL_INDEX_HEADER_SIZE)
+        except OSError:
+            return None
+        if len(header) < _WAL_INDEX_HEADER_SIZE:
+            return None
+        salt = header[_WAL_SALT_OFFSET:_WAL_SALT_OFFSET + 8]
+        mx_frame, = struct.unpack_from("=I", header, _WAL_MX_FRAME_OFFSET)
+        backfill, = struct.unpack_from("=I", header, _WAL_BACKFILL_OFFSET)
+        return salt, mx_frame, backfill
+
+    def _wal_bytes_written(self, before, after):
+        """Bytes a commit wrote: new WAL frames plus pages checkpointed into the database file."""
+        if after[0] == before[0]:
+            frames, backfilled = after[1] - before[1], after[2] - before[2]
+        else:
+            frames, backfilled = after[1], after[2] # The WAL restarted from frame 0
+        frames, backfilled = max(0, frames), max(0, backfilled)
+        return frames * (_WAL_FRAME_HEADER_SIZE + self._page_size) + backfilled * self._page_size
+
+    # --- QUERIES (any thread) ---
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _query(self, sql, params=()):
+        if not self.available:
+            return []
+        try:
+            return [dict(row) for row in self._reader().execute(sql, params)]
+        except sqlite3.Error as e:
+            print(f"[HistoryDB] Query failed: {e}")
+            return []
+
+    def range(self, table, start=None, end=None, where=None, params=()):
+        """Rows with start <= ts < end (either bound optional), oldest first."""
+        if table not in TABLES:
+            raise ValueError(f"unknown history table '{table}'")
+        clauses, args = self._time_clauses(start, end)
+        if where:
+            clauses.append(f"({where})")
+            args.extend(params)
+        sql = f"SELECT * FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return self._query(sql + " ORDER BY ts", args)
+
+    def latest(self, table, n=1, where=None, params=()):
+        """The newest n rows, newest first."""
+        if table not in TABLES:
+            raise ValueError(f"unknown history table '{table}'")
+        sql = f"SELECT * FROM {table}"
+        if where:
+            sql += f" WHERE {where}"
+        return self._query(sql + " ORDER BY ts DESC LIMIT ?", list(params) + [int(n)])
+
+    def aggregate(self, table, column, start=None, end=None):
+        """{count, min, max, avg} of a numeric column over a time range (NULLs ignored)."""
+        if column not in AGGREGATE_COLUMNS.get(table, ()):
+            raise ValueError(f"cannot aggregate {table}.{column}")
+        clauses, args = self._time_clauses(start, end)
+        clauses.append(f"{column} IS NOT NULL")
+        rows = self._query(
+            f"SELECT COUNT({column}) AS count, MIN({column}) AS min, MAX({column}) AS max, AVG({column}) AS avg "
+            f"FROM {table} WHERE " + " AND ".join(clauses), args
+        )
+        return rows[0] if rows else {"count": 0, "min": None, "max": None, "avg": None}
+
+    @staticmethod
+    def _time_clauses(start, end):
+        clauses, args = [], []
+        if start is not None:
+            clauses.append("ts >= ?")
+            args.append(start)
+        if end is not None:
+            clauses.append("ts < ?")
+            args.append(end)
+        return clauses, args
+
+    def series(self, start, end, points=rollups.DEFAULT_SERIES_POINTS):
+        """
+        Chart data for [start, end): returns (resolution, rows) using the coarsest
+        rollup that still yields about `points` rows (resolution None = raw samples).
+        Rows are dicts with rollups.COLUMNS either way.
+        """
+        res = rollups.pick_resolution(start, end, points)
+        if res is None:
+            return None, [rollups.sample_as_window(row) for row in self.range("samples", start, end)]
+        return res, self.range(rollups.table_name(res), start - start % res, end)
+
+    def gravity_readings(self, session_id):
+        """Stored readings for a brew session in the API 'readings' shape, oldest first."""
+        rows = self.range("gravity", where="session_id = ? AND sg IS NOT NULL", params=(session_id,))
+        return [{"gravity": row["sg"], "created_at": row["created_at"]} for row in rows]
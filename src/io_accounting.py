@@ -0,0 +1,204 @@
+"""
+fermvault app
+io_accounting.py
+"""
+
+import os
+import threading
+import time
+
+# --- DEFAULTS ---
+HOUR_S = 3600
+DAY_S = 24 * HOUR_S
+HISTORY_HOURS = 24              # Hourly buckets kept per file
+MIN_PROJECTION_WINDOW_S = 600   # Don't extrapolate a day from the first few seconds
+BUDGET_GRACE_S = HOUR_S         # Startup writes (settings load, headers) settle first
+BUDGET_WARN_INTERVAL_S = HOUR_S
+# --- END DEFAULTS ---
+
+# Process-wide accounting shared by every writer in the app.
+# path -> {"first": ts, "writes": n, "bytes": n, "fsyncs": n, "hours": {hour: [bytes, writes, fsyncs]}}
+_lock = threading.Lock()
+_files = {}
+_started = time.time()
+_budget_bytes_per_day = 0
+_budget_callback = None
+_last_budget_warning = 0.0
+
+
+def _entry(path, now):
+    entry = _files.get(path)
+    if entry is None:
+        entry = {"first": now, "writes": 0, "bytes": 0, "fsyncs": 0, "hours": {}}
+        _files[path] = entry
+    hour = int(now // HOUR_S)
+    bucket = entry["hours"].get(hour)
+    if bucket is None:
+        bucket = entry["hours"][hour] = [0, 0, 0]
+        for old in [h for h in entry["hours"] if h <= hour - HISTORY_HOURS]:
+            del entry["hours"][old]
+    return entry, bucket
+
+
+def record_write(path, nbytes, fsyncs=0):
+    """Accounts nbytes written (and optionally fsyncs issued) to path."""
+    now = time.time()
+    path = os.path.abspath(path)
+    with _lock:
+        entry, bucket = _entry(path, now)
+        entry["writes"] += 1
+        entry["bytes"] += nbytes
+        entry["fsyncs"] += fsyncs
+        bucket[0] += nbytes
+        bucket[1] += 1
+        bucket[2] += fsyncs
+    if _budget_bytes_per_day > 0:
+        _check_budget(now)
+
+
+def record_fsync(path):
+    now = time.time()
+    path = os.path.abspath(path)
+    with _lock:
+        entry, bucket = _entry(path, now)
+        entry["fsyncs"] += 1
+        bucket[2] += 1
+
+
+def fsync(fd, path):
+    """os.fsync() plus accounting. fd may be a file object or a descriptor."""
+    os.fsync(fd if isinstance(fd, int) else fd.fileno())
+    record_fsync(path)
+
+
+class CountedFile:
+    """
+    Context manager around open() that accounts the bytes the block added to
+    the file (measured from the file size, so csv writers, json.dump and
+    text encodings are all counted correctly).
+    """
+
+    def __init__(self, path, mode="a", **kwargs):
+        self.path = path
+        self._file = open(path, mode, **kwargs)
+        self._start = 0 if "w" in mode else os.fstat(self._file.fileno()).st_size
+
+    def __enter__(self):
+        return self._file
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._file.flush()
+            written = os.fstat(self._file.fileno()).st_size - self._start
+        finally:
+            self._file.close()
+        record_write(self.path, max(0, written))
+        return False
+
+
+def counted_open(path, mode="a", **kwargs):
+    return CountedFile(path, mode, **kwargs)
+
+
+# --- REPORTING ---
+def _projection(total_bytes, first, now):
+    window = min(DAY_S, max(MIN_PROJECTION_WINDOW_S, now - first))
+    return total_bytes * DAY_S / window
+
+
+def get_stats(now=None):
+    """
+    Returns {path: {bytes_total, writes_total, fsyncs_total, bytes_hour,
+    writes_hour, fsyncs_hour, bytes_24h, projected_bytes_day}}.
+    "_hour" is the last 60 minutes; the projection extrapolates the last 24 h
+    (or the time since the first write, if shorter) to a full day.
+    """
+    now = time.time() if now is None else now
+    current_hour = int(now // HOUR_S)
+    stats = {}
+    with _lock:
+        for path, entry in _files.items():
+            # Last hour = the current bucket plus the overlapping part of the previous one
+            cur = entry["hours"].get(current_hour, [0, 0, 0])
+            prev = entry["hours"].get(current_hour - 1, [0, 0, 0])
+            prev_share = 1.0 - (now % HOUR_S) / HOUR_S
+            day = [0, 0, 0]
+            for hour, bucket in entry["hours"].items():
+                if hour > current_hour - HISTORY_HOURS:
+                    day = [a + b for a, b in zip(day, bucket)]
+            stats[path] = {
+                "bytes_total": entry["bytes"],
+                "writes_total": entry["writes"],
+                "fsyncs_total": entry["fsyncs"],
+                "bytes_hour": cur[0] + prev[0] * prev_share,
+                "writes_hour": cur[1] + prev[1] * prev_share,
+                "fsyncs_hour": cur[2] + prev[2] * prev_share,
+                "bytes_24h": day[0],
+                "projected_bytes_day": _projection(day[0], entry["first"], now),
+            }
+    return stats
+
+
+def projected_bytes_per_day(now=None):
+    return sum(s["projected_bytes_day"] for s in get_stats(now).values())
+
+
+def format_size(nbytes):
+    for unit in ("B", "KB", "MB"):
+        if abs(nbytes) < 1024.0:
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024.0
+    return f"{nbytes:.2f} GB"
+
+
+def format_report(now=None):
+    """Text lines for the diagnostics screen, busiest file first."""
+    now = time.time() if now is None else now
+    stats = get_stats(now)
+    uptime_h = (now - _started) / HOUR_S
+    lines = [f"Uptime {uptime_h:.1f} h. Per file: last hour | last 24 h | projected/day | total"]
+    total_day = 0.0
+    for path, s in sorted(stats.items(), key=lambda item: -item[1]["projected_bytes_day"]):
+        total_day += s["projected_bytes_day"]
+        lines.append(
+            f"{os.path.basename(path)}: "
+            f"{format_size(s['bytes_hour'])} ({s['writes_hour']:.0f} writes, {s['fsyncs_hour']:.0f} fsyncs) | "
+            f"{format_size(s['bytes_24h'])} | {format_size(s['projected_bytes_day'])} | "
+            f"{format_size(s['bytes_total'])} ({s['writes_total']} writes, {s['fsyncs_total']} fsyncs)"
+        )
+    if not stats:
+        lines.append("No writes recorded yet.")
+    budget = _budget_bytes_per_day
+    budget_text = f" of {format_size(budget)} budget ({100.0 * total_day / budget:.0f}%)" if budget > 0 else " (no budget set)"
+    lines.append(f"Projected total: {format_size(total_day)}/day{budget_text}")
+    return lines
+
+
+# --- BUDGET ---
+def set_budget(bytes_per_day, callback=None):
+    """
+    callback(message) is called (at most once per hour) while the projected
+    daily write volume exceeds bytes_per_day. 0 disables the check.
+    """
+    global _budget_bytes_per_day, _budget_callback
+    _budget_bytes_per_day = max(0, bytes_per_day or 0)
+    if callback is not None:
+        _budget_callback = callback
+
+
+def _check_budget(now):
+    global _last_budget_warning
+    if now - _started < BUDGET_GRACE_S or now - _last_budget_warning < BUDGET_WARN_INTERVAL_S:
+        return
+    projected = projected_bytes_per_day(now)
+    budget = _budget_bytes_per_day
+    if budget <= 0 or projected <= budget:
+        return
+    _last_budget_warning = now
+    message = f"SD write budget exceeded: projected {format_size(projected)}/day (budget {format_size(budget)}/day)."
+    print(f"[IOAccounting] {message}")
+    if _budget_callback is not None:
+        try:
+            _budget_callback(message)
+        except Exception as e:
+            print(f"[IOAccounting] Budget callback failed: {e}")
@@ -0,0 +1,76 @@
+"""
+fermvault app
+log_buffer.py
+"""
+
+import itertools
+import time
+from collections import deque
+from datetime import datetime
+
+# --- DEFAULTS ---
+LOG_BUFFER_SIZE = 2000   # Messages kept for the log screen
+# --- END DEFAULTS ---
+
+SEVERITIES = ("INFO", "WARNING", "ERROR", "CRITICAL")
+SEVERITY_RANK = {name: rank for rank, name in enumerate(SEVERITIES)}
+
+# Messages are plain strings from all over the app; their wording sets the severity
+_SEVERITY_KEYWORDS = (
+    ("CRITICAL", "CRITICAL"), ("FATAL", "CRITICAL"),
+    ("ERROR", "ERROR"), ("FAILED", "ERROR"), ("FAILURE", "ERROR"),
+    ("WARNING", "WARNING"), ("WARN:", "WARNING"),
+)
+
+
+def severity_of(message):
+    upper = message.upper()
+    for keyword, severity in _SEVERITY_KEYWORDS:
+        if keyword in upper:
+            return severity
+    return "INFO"
+
+
+class LogEntry:
+    __slots__ = ("seq", "timestamp", "severity", "message")
+
+    def __init__(self, seq, timestamp, severity, message):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.severity = severity
+        self.message = message
+
+    def text(self):
+        return f"{datetime.fromtimestamp(self.timestamp):[%Y-%m-%d %H:%M:%S]} {self.message}"
+
+    def matches(self, min_severity="INFO", query=""):
+        if SEVERITY_RANK.get(self.severity, 0) < SEVERITY_RANK.get(min_severity, 0):
+            return False
+        return not query or query.lower() in self.message.lower()
+
+
+class LogBuffer:
+    """Bounded, in-memory message history; the oldest entries fall off at maxlen."""
+
+    def __init__(self, maxlen=LOG_BUFFER_SIZE):
+        self.maxlen = maxlen
+        self._entries = deque(maxlen=maxlen)
+        self._seq = itertools.count()
+
+    def append(self, message, severity=None, timestamp=None):
+        entry = LogEntry(next(self._seq), timestamp or time.time(), severity or severity_of(message), message)
+        self._entries.append(entry)
+        return entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    @property
+    def oldest_seq(self):
+        return self._entries[0].seq if self._entries else 0
+
+    def filter(self, min_severity="INFO", query=""):
+        return [entry for entry in self._entries if entry.matches(min_severity, query)]
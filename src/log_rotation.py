@@ -0,0 +1,280 @@
+"""
+fermvault app
+log_rotation.py
+"""
+
+import csv
+import glob
+import io
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import io_accounting
+
+# --- DEFAULTS ---
+DEFAULT_MAX_MB = 5.0
+DEFAULT_MAX_AGE_H = 24.0
+DEFAULT_RETENTION_DAYS = 90
+DEFAULT_COMPRESSION = "gzip"      # "gzip", "zstd" (needs the zstandard package) or "none"
+SEGMENT_TIME_FORMAT = "%Y%m%d-%H%M%S"
+CSV_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"   # First column of pid_log.csv and system_log.csv
+# --- END DEFAULTS ---
+
+COMPRESSED_SUFFIXES = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+
+class RotationPolicy:
+    """Rotation limits shared by the log writers; updated live from settings."""
+
+    def __init__(self, max_mb=DEFAULT_MAX_MB, max_age_h=DEFAULT_MAX_AGE_H,
+                 retention_days=DEFAULT_RETENTION_DAYS, compression=DEFAULT_COMPRESSION):
+        self.update(max_mb, max_age_h, retention_days, compression)
+
+    def update(self, max_mb, max_age_h, retention_days, compression):
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)   # 0 = no size limit
+        self.max_age_s = float(max_age_h) * 3600.0          # 0 = no time limit
+        self.retention_s = float(retention_days) * 86400.0  # 0 = keep forever
+        self.compression = compression if compression in COMPRESSED_SUFFIXES else DEFAULT_COMPRESSION
+
+    @classmethod
+    def from_settings(cls, settings_manager):
+        policy = cls()
+        policy.apply_settings(settings_manager)
+        return policy
+
+    def apply_settings(self, settings_manager, changes=None):
+        """Also usable as a SettingsManager subscriber via a lambda (changes is ignored)."""
+        self.update(
+            settings_manager.get("log_rotate_max_mb", DEFAULT_MAX_MB),
+            settings_manager.get("log_rotate_max_age_h", DEFAULT_MAX_AGE_H),
+            settings_manager.get("log_retention_days", DEFAULT_RETENTION_DAYS),
+            settings_manager.get("log_compression", DEFAULT_COMPRESSION),
+        )
+
+
+ROTATION_SETTING_KEYS = ("log_rotate_max_mb", "log_rotate_max_age_h", "log_retention_days", "log_compression")
+
+
+def _compressor(name):
+    """Returns (suffix, open_function) for a compression name, falling back to gzip."""
+    if name == "zstd":
+        try:
+            import zstandard
+            return ".zst", lambda path, mode: zstandard.open(path, mode)
+        except ImportError:
+            print("[LogRotation] zstandard not installed; using gzip.")
+            name = "gzip"
+    if name == "gzip":
+        return ".gz", lambda path, mode: gzip.open(path, mode)
+    return "", open
+
+
+def open_segment(path):
+    """Opens a (possibly compressed) segment for binary reading."""
+    if not os.path.exists(path):
+        # Compressed by the background thread since the index was read
+        for suffix in (".gz", ".zst"):
+            if os.path.exists(path + suffix):
+                path += suffix
+                break
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        import zstandard
+        return zstandard.open(path, "rb")
+    return open(path, "rb")
+
+
+class LogRotator:
+    """
+    Rotates one active log file (e.g. pid_log.csv) into time-stamped
+    segments next to it:
+
+        pid_log.20261019-000000.csv.gz   (name = segment start time)
+        pid_log.csv.segments.json        (index of segment time ranges)
+
+    Closed segments are compressed and old ones deleted on a background
+    thread, so the writer only pays for a rename.
+    """
+
+    def __init__(self, path, policy):
+        self.path = path
+        self.policy = policy
+        directory, name = os.path.split(path)
+        self.directory = directory or "."
+        self.stem, self.ext = os.path.splitext(name)
+        self.index_path = os.path.join(self.directory, f"{name}.segments.json")
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+
+    # --- INDEX ---
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                entries = json.load(f)
+            return [e for e in entries if os.path.exists(os.path.join(self.directory, e["file"]))]
+        except (OSError, ValueError, KeyError, TypeError):
+            return self._scan_segments()
+
+    def _scan_segments(self):
+        """Rebuilds the index from file names (start time) and mtimes (end time)."""
+        entries = []
+        for seg_path in glob.glob(os.path.join(self.directory, f"{self.stem}.*{self.ext}*")):
+            name = os.path.basename(seg_path)
+            stamp = name[len(self.stem) + 1:].split(".", 1)[0]
+            try:
+                start = datetime.strptime(stamp, SEGMENT_TIME_FORMAT).timestamp()
+            except ValueError:
+                continue
+            entries.append({"file": name, "start": start, "end": os.path.getmtime(seg_path),
+                            "bytes": os.path.getsize(seg_path)})
+        entries.sort(key=lambda e: e["start"])
+        return entries
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        payload = json.dumps(self._index, separators=(",", ":"))
+        with open(tmp_path, "w") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.index_path)
+        io_accounting.record_write(self.index_path, len(payload))
+
+    # --- ROTATION (called by the writer) ---
+    def should_rotate(self, size, segment_start, now=None):
+        now = time.time() if now is None else now
+        policy = self.policy
+        if policy.max_bytes and size >= policy.max_bytes:
+            return True
+        return bool(policy.max_age_s and segment_start and now - segment_start >= policy.max_age_s)
+
+    def rotate(self, segment_start, segment_end=None):
+        """
+        Renames the (closed) active file to a segment and queues compression
+        and retention. The caller must have closed its handle first.
+        """
+        if not os.path.exists(self.path):
+            return None
+        segment_end = time.time() if segment_end is None else segment_end
+        segment_start = segment_start or os.path.getmtime(self.path)
+        stamp = datetime.fromtimestamp(segment_start).strftime(SEGMENT_TIME_FORMAT)
+        name = f"{self.stem}.{stamp}{self.ext}"
+        seg_path = os.path.join(self.directory, name)
+        suffix = 1
+        while os.path.exists(seg_path) or glob.glob(seg_path + ".*"):
+            name = f"{self.stem}.{stamp}-{suffix}{self.ext}"
+            seg_path = os.path.join(self.directory, name)
+            suffix += 1
+        os.replace(self.path, seg_path)
+        entry = {"file": name, "start": segment_start, "end": segment_end, "bytes": os.path.getsize(seg_path)}
+        with self._lock:
+            self._index.append(entry)
+            self._save_index()
+        print(f"[LogRotation] Rotated {os.path.basename(self.path)} -> {name}")
+        threading.Thread(target=self._maintain, args=(entry,), daemon=True, name="log-rotation").start()
+        return seg_path
+
+    def _maintain(self, entry):
+        try:
+            self._compress(entry)
+        except Exception as e:
+            print(f"[LogRotation] Compression of {entry['file']} failed: {e}")
+        try:
+            self.apply_retention()
+        except Exception as e:
+            print(f"[LogRotation] Retention cleanup failed: {e}")
+
+    def _compress(self, entry):
+        suffix, open_compressed = _compressor(self.policy.compression)
+        if not suffix:
+            return
+        src = os.path.join(self.directory, entry["file"])
+        dst = src + suffix
+        with open(src, "rb") as f_in, open_compressed(dst + ".tmp", "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out, 256 * 1024)
+        os.replace(dst + ".tmp", dst)
+        io_accounting.record_write(dst, os.path.getsize(dst))
+        with self._lock:
+            entry["file"] = os.path.basename(dst)
+            entry["bytes"] = os.path.getsize(dst)
+            self._save_index()
+        os.remove(src)
+
+    def apply_retention(self, now=None):
+        """Deletes segments that ended more than retention_s ago."""
+        if not self.policy.retention_s:
+            return
+        cutoff = (time.time() if now is None else now) - self.policy.retention_s
+        with self._lock:
+            expired = [e for e in self._index if e["end"] < cutoff]
+            if not expired:
+                return
+            self._index = [e for e in self._index if e["end"] >= cutoff]
+            self._save_index()
+        for entry in expired:
+            try:
+                os.remove(os.path.join(self.directory, entry["file"]))
+                print(f"[LogRotation] Deleted expired segment {entry['file']}")
+            except OSError:
+                pass
+
+    # --- RANGE READS ---
+    def segments(self, start=None, end=None, active_start=None):
+        """
+        Paths of the segments overlapping [start, end), oldest first, plus the
+        active file (whose start is active_start if known).
+        """
+        with self._lock:
+            entries = list(self._index)
+        paths = [os.path.join(self.directory, e["file"]) for e in entries
+                 if (start is None or e["end"] >= start) and (end is None or e["start"] < end)]
+        if os.path.exists(self.path) and (end is None or active_start is None or active_start < end):
+            paths.append(self.path)
+        return paths
+
+
+def parse_csv_time(text):
+    try:
+        return datetime.strptime(text, CSV_TIME_FORMAT).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def csv_first_timestamp(path):
+    """Timestamp of the first data row of a CSV log, or None if it has none."""
+    try:
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None) # Header
+            row = next(reader, None)
+    except OSError:
+        return None
+    return parse_csv_time(row[0]) if row else None
+
+
+def read_csv_range(path, start=None, end=None, policy=None):
+    """
+    Yields the data rows (lists) of a rotated CSV log with start <= time < end,
+    oldest first. Only segments whose indexed range overlaps are opened.
+    """
+    rotator = LogRotator(path, policy or RotationPolicy())
+    for seg_path in rotator.segments(start, end):
+        try:
+            f = io.TextIOWrapper(open_segment(seg_path), encoding="utf-8", newline="")
+        except OSError:
+            continue # Deleted by retention since the index was read
+        with f:
+            reader = csv.reader(f)
+            next(reader, None) # Header
+            for row in reader:
+                ts = parse_csv_time(row[0]) if row else None
+                if ts is None:
+                    continue
+                if end is not None and ts >= end:
+                    break
+                if start is None or ts >= start:
+                    yield row
@@ -46,6 +46,8 @@ from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.properties import StringProperty, ListProperty, BooleanProperty
 from kivy.uix.popup import Popup
 from kivy.clock import Clock, mainthread
+from history_chart import HistoryChart, RANGES_H
+from log_buffer import LogBuffer
 
 # --- 2. BACKEND IMPORTS ---
 try:
@@ -55,6 +57,11 @@ try:
     from api_manager import APIManager
     from notification_manager import NotificationManager
     from fg_calculator import FGCalculator
+    import io_accounting
+    from history_db import HistoryDB, HISTORY_DB_NAME
+    from system_log_writer import SystemLogWriter
+    import export
+    from sessions import SessionManager
 except ImportError as e:
     print(f"CRITICAL IMPORT ERROR: {e}")
     SettingsManager = None
@@ -117,6 +124,20 @@ def handle_signal(signum, frame):
     # 2. Execute Cleanup
     failsafe_cleanup()
     
+    # 2b. Write any coalesced (not yet persisted) settings
+    try:
+        app = App.get_running_app()
+        if app and getattr(app, 'settings_manager', None):
+            app.settings_manager.flush()
+        if app and getattr(app, 'temp_controller', None):
+            app.temp_controller.pid_logger.close(timeout=1.0)
+        if app and getattr(app, 'system_log_writer', None):
+            app.system_log_writer.close(timeout=1.0)
+        if app and getattr(app, 'history', None):
+            app.history.close(timeout=1.0)
+    except Exception:
+        pass
+    
     # 3. Force Exit (Prevents Kivy/Python from hanging)
     os._exit(0)
 
@@ -166,13 +187,19 @@ class KivyUIManagerAdapter:
     def temp_controller(self): return self.app.temp_controller
     @property
     def fg_calculator_instance(self): return self.app.fg_calculator_instance
+    @property
+    def relay_control(self): return getattr(self.app, 'relay_control', None)
 
 # --- 5. SCREEN CLASSES & POPUP ---
 class DashboardScreen(Screen): pass
 class LogScreen(Screen): pass
 class SettingsScreen(Screen): pass
+class DiagnosticsScreen(Screen): pass
+class HistoryScreen(Screen): pass
 class DirtyPopup(Popup): pass
 class PIDWarningPopup(Popup): pass  # <--- NEW
+class RelayStatsPopup(Popup):
+    stats_text = StringProperty("")
 
 # --- 6. MAIN APP CLASS ---
 class FermVaultApp(App):
@@ -192,6 +219,7 @@ class FermVaultApp(App):
     col_theme_blue = ListProperty([0.2, 0.8, 1, 1])
     
     beer_target = StringProperty("--.-")
+    beer_eta_text = StringProperty("")
     ambient_actual = StringProperty("--.-")
     ambient_target = StringProperty("--.-")
     ambient_range = StringProperty("--.-")
@@ -199,7 +227,9 @@ class FermVaultApp(App):
     cooler_color = ListProperty([0.2, 0.2, 0.2, 1])
     control_mode_display = StringProperty("AMBIENT")
     monitoring_state = StringProperty("OFF")
-    log_text = StringProperty("[System] UI Initialized.\n")
+    log_severity_filter = StringProperty("ALL")
+    log_search_text = StringProperty("")
+    log_buffer = None
     warning_message = StringProperty("")
     
     # --- Functional Display Colors (Target/Range) ---
@@ -248,7 +278,25 @@ class FermVaultApp(App):
     ds18b20_ambient_sensor = StringProperty("unassigned")
     relay_active_high = BooleanProperty(False)
     pid_logging_enabled = BooleanProperty(False) # Renamed from log_csv_enabled
+    pid_log_format = StringProperty("binary")
     system_logging_enabled = BooleanProperty(False) # <--- NEW
+    io_write_budget_mb_day = StringProperty("0")
+    log_rotate_max_mb = StringProperty("5")
+    log_rotate_max_age_h = StringProperty("24")
+    log_retention_days = StringProperty("90")
+    io_report_text = StringProperty("")
+    history_range = StringProperty("24H")
+    export_source = StringProperty("pid")
+    export_format = StringProperty("csv")
+    export_range = StringProperty("7D")
+    export_step = StringProperty("RAW")
+    export_target = StringProperty("")
+    export_targets = ListProperty([])
+    export_status_text = StringProperty("Insert a USB drive, then press REFRESH USB.")
+    export_running = BooleanProperty(False)
+    session_archive_list = ListProperty([])
+    session_archive_choice = StringProperty("")
+    history_info_text = StringProperty("")
     
     # SOURCE OF TRUTH: settings_manager.py -> control_settings
     ambient_hold_f = StringProperty("0.0")
@@ -325,51 +373,98 @@ class FermVaultApp(App):
         if hasattr(self, 'splash_queue') and self.splash_queue:
             self.splash_queue.put("STOP")
 
+    system_log_writer = None
+
+    def log_system_message(self, message, severity=None):
+        """
+        Any thread. File and history writes are only queued here; the UI row
+        is added on the main thread.
+        """
+        timestamp = time.time()
+        
+        # 1. File Write (If Enabled) - written by SystemLogWriter's thread
+        if getattr(self, 'history', None):
+            self.history.add_log(message, timestamp=timestamp)
+        
+        if self.system_logging_enabled and self.system_log_writer is not None:
+            self.system_log_writer.write(message, timestamp)
+        
+        # 2. UI Update
+        self._add_log_entry(message, severity, timestamp)
+
     @mainthread
-    def log_system_message(self, message):
-        # 1. UI Update
-        # MODIFIED: Added date to timestamp [%Y-%m-%d %H:%M:%S]
-        timestamp = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-        self.log_text += f"{timestamp} {message}\n"
-        if len(self.log_text) > 5000: self.log_text = self.log_text[-4000:]
-        
-        # 2. File Write (If Enabled)
-        if self.system_logging_enabled and hasattr(self, 'settings_manager'):
-            try:
-                # Use same data_dir as SettingsManager
-                data_dir = self.settings_manager.data_dir
-                log_path = os.path.join(data_dir, "system_log.csv")
-                
-                # Full Date+Time for CSV (Verified: Already includes Date)
-                csv_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                
-                file_exists = os.path.isfile(log_path)
-                
-                with open(log_path, 'a', newline='', encoding='utf-8') as f:
-                    # Simple manual CSV write to avoid overhead
-                    if not file_exists:
-                        f.write("Timestamp,Action\n")
-                    
-                    # Escape quotes in message just in case
-                    clean_msg = message.replace('"', '""')
-                    f.write(f'"{csv_timestamp}","{clean_msg}"\n')
-                    
-            except Exception as e:
-                print(f"Error writing to system log: {e}")
+    def _add_log_entry(self, message, severity, timestamp):
+        # One row appended to the RecycleView; cost does not grow with the log
+        entry = self.log_buffer.append(message, severity, timestamp)
+        self._append_log_row(entry)
+
+    # --- NEW: Log screen view over the bounded log buffer ---
+    LOG_SEVERITY_COLORS = {
+        "INFO": [0.8, 0.8, 0.8, 1],
+        "WARNING": [1.0, 0.8, 0.2, 1],
+        "ERROR": [1.0, 0.35, 0.3, 1],
+        "CRITICAL": [1.0, 0.2, 0.2, 1],
+    }
+
+    def _log_row(self, entry):
+        return {"text": entry.text(), "color": self.LOG_SEVERITY_COLORS[entry.severity], "seq": entry.seq}
+
+    def _log_filter_args(self):
+        min_severity = "INFO" if self.log_severity_filter == "ALL" else self.log_severity_filter
+        return min_severity, self.log_search_text.strip()
+
+    def _append_log_row(self, entry):
+        log_screen = getattr(self, 'log_screen', None)
+        if log_screen is None:
+            return
+        view = log_screen.ids.log_view
+        data = view.data
+        # Drop rows whose entries have fallen out of the buffer
+        oldest = self.log_buffer.oldest_seq
+        while data and data[0]["seq"] < oldest:
+            del data[0]
+        if entry.matches(*self._log_filter_args()):
+            at_bottom = view.scroll_y <= 0.01
+            data.append(self._log_row(entry))
+            if at_bottom:
+                view.scroll_y = 0
+
+    def refresh_log_view(self, *args):
+        """Rebuilds the log rows for the current severity filter and search text."""
+        if getattr(self, 'log_screen', None) is None:
+            return # Filter widgets fire on_text while the screen is still being built
+        view = self.log_screen.ids.log_view
+        view.data = [self._log_row(entry) for entry in self.log_buffer.filter(*self._log_filter_args())]
+        view.scroll_y = 0
+
+    def set_log_severity_filter(self, value):
+        self.log_severity_filter = value
+        self.refresh_log_view()
+
+    def set_log_search(self, text):
+        self.log_search_text = text
+        self.refresh_log_view()
 
     def build(self):
         self.title = "FermVault Lite"
+        self.log_buffer = LogBuffer()
+        self.log_buffer.append("[System] UI Initialized.")
         self.sm = ScreenManager()
         self.dashboard_screen = DashboardScreen(name='dashboard')
         self.log_screen = LogScreen(name='log')
         self.settings_screen = SettingsScreen(name='settings')
+        self.diagnostics_screen = DiagnosticsScreen(name='diagnostics')
+        self.history_screen = HistoryScreen(name='history')
         # self.info_screen = InfoScreen(name='info')
         
         self.sm.add_widget(self.dashboard_screen)
         self.sm.add_widget(self.log_screen)
         self.sm.add_widget(self.settings_screen)
+        self.sm.add_widget(self.diagnostics_screen)
+        self.sm.add_widget(self.history_screen)
         # self.sm.add_widget(self.info_screen)
         self.sm.current = 'dashboard'
+        self.refresh_log_view()
 
         Clock.schedule_once(self.start_backend, 0.2)
         return self.sm
@@ -398,7 +493,13 @@ class FermVaultApp(App):
             self.api_manager = APIManager(self.settings_manager, scan_directory=app_dir)
             
             self.relay_control = RelayControl(self.settings_manager, RELAY_PINS)
+            if not self.relay_control.gpio.is_hardware:
+                self.log_system_message(f"WARNING: GPIO backend '{self.relay_control.gpio.name}' - relays are NOT driven.")
             self.temp_controller = TemperatureController(self.settings_manager, self.relay_control)
+            self.system_log_writer = SystemLogWriter(
+                os.path.join(self.settings_manager.data_dir, "system_log.csv"),
+                rotation=self.temp_controller.log_rotation,
+            )
             
             # 3. Variable Wrappers
             self.monitoring_var = KivyVarWrapper(lambda v: setattr(self, 'monitoring_state', v))
@@ -416,11 +517,25 @@ class FermVaultApp(App):
             self.fg_calculator_instance = FGCalculator(self.settings_manager, self.api_manager)
             self.notification_manager = NotificationManager(self.settings_manager, self.ui_adapter)
             
+            # --- NEW: Shared SQLite history (samples, relays, gravity, FG, log) ---
+            self.history = HistoryDB(os.path.join(self.settings_manager.data_dir, HISTORY_DB_NAME))
+            self.temp_controller.history = self.history
+            self.notification_manager.history = self.history
+            self.fg_calculator_instance.history = self.history
+            self.relay_control.add_transition_listener(self.history.add_relay_transition)
+            
+            # --- NEW: Brew session lifecycle (record tagging + archive bundles) ---
+            self.session_manager = SessionManager(
+                self.settings_manager, history=self.history, pid_logger=self.temp_controller.pid_logger
+            )
+            self.session_manager.logger = self.log_system_message
+            
             # 4. Wiring
             self.temp_controller.notification_manager = self.notification_manager
             self.notification_manager.ui = self.ui_adapter
             self.notification_manager.ui.app = self
             self.relay_control.set_logger(self.log_system_message)
+            self.relay_control.subscribe_status(self._on_relay_status)
             
             # Populate API list from the manager
             self.api_service_list = self.api_manager.get_service_list()
@@ -428,7 +543,15 @@ class FermVaultApp(App):
             self.notification_manager.start_scheduler()
             
             self._refresh_all_settings_from_manager()
-            Clock.schedule_interval(self.tick, 1.0)
+            # SD-card write budget (diagnostics screen); follows the setting live
+            self._apply_io_budget({"io_write_budget_mb_day": self.settings_manager.get("io_write_budget_mb_day", 0.0)})
+            self.settings_manager.subscribe(self._apply_io_budget, keys=("io_write_budget_mb_day",))
+            
+            # Sensor errors reach the warning bar by notification instead of a 1 s poll
+            self.settings_manager.subscribe(
+                self._on_sensor_error_changed, keys=("sensor_error_message",),
+                executor=lambda callback, changes: Clock.schedule_once(lambda dt: callback(changes))
+            )
             
             self.log_system_message("Backend initialized successfully.")
             
@@ -582,7 +705,12 @@ class FermVaultApp(App):
         
         # LOGGING (Separated)
         self.pid_logging_enabled = self.settings_manager.get("pid_logging_enabled", False)
+        self.pid_log_format = self.settings_manager.get("pid_log_format", "binary")
         self.system_logging_enabled = self.settings_manager.get("system_logging_enabled", False)
+        self.io_write_budget_mb_day = f"{float(self.settings_manager.get('io_write_budget_mb_day', 0.0)):.0f}"
+        self.log_rotate_max_mb = f"{float(self.settings_manager.get('log_rotate_max_mb', 5.0)):.0f}"
+        self.log_rotate_max_age_h = f"{float(self.settings_manager.get('log_rotate_max_age_h', 24.0)):.0f}"
+        self.log_retention_days = f"{float(self.settings_manager.get('log_retention_days', 90)):.0f}"
         
         # Compressor Protection (Source of Truth Keys)
         comp = self.settings_manager.get_all_compressor_protection_settings()
@@ -638,7 +766,14 @@ class FermVaultApp(App):
         
         self.is_settings_dirty = False
 
-    def tick(self, dt):
+    @mainthread
+    def _on_relay_status(self, status):
+        """RelayStatus subscriber: refresh the warning bar as soon as a restriction changes."""
+        self._update_warning_status()
+
+    def _on_sensor_error_changed(self, changes):
+        """SettingsManager subscriber (UI thread)."""
+        self.current_sensor_error = changes["sensor_error_message"] or ""
         self._update_warning_status()
 
     def _update_warning_status(self):
@@ -648,8 +783,8 @@ class FermVaultApp(App):
             self.warning_bg_color = [0.9, 0, 0, 1] # Red
             return
 
-        if hasattr(self, 'relay_control'):
-            restriction = self.settings_manager.get("cool_restriction_status", "")
+        if getattr(self, 'relay_control', None):
+            restriction = self.relay_control.status.restriction_message
             if restriction:
                 self.warning_message = f"Protection: {restriction}"
                 self.warning_bg_color = [1, 0.6, 0, 1] # Orange
@@ -711,16 +846,15 @@ class FermVaultApp(App):
         else:
             self.ambient_range = "--.- - --.-"
             
-        h_state = str(kwargs.get('heat_state', 'OFF'))
-        c_state = str(kwargs.get('cool_state', 'OFF'))
-        
         # --- COLOR LOGIC UPDATE ---
-        self.heater_color = [0.8, 0, 0, 1] if "HEATING" in h_state else [0.2, 0.2, 0.2, 1]
-        self.cooler_color = self.col_theme_blue if "COOLING" in c_state else [0.2, 0.2, 0.2, 1]
+        self.heater_color = [0.8, 0, 0, 1] if kwargs.get('heat_on', False) else [0.2, 0.2, 0.2, 1]
+        self.cooler_color = self.col_theme_blue if kwargs.get('cool_on', False) else [0.2, 0.2, 0.2, 1]
 
         mode_internal = kwargs.get('current_mode', 'Ambient Hold')
         self._sync_control_mode_from_backend(mode_internal)
         
+        self.beer_eta_text = kwargs.get('eta_message', "") or ""
+        
         self.current_sensor_error = kwargs.get('sensor_error_message', "")
         self._update_warning_status()
 
@@ -926,6 +1060,16 @@ class FermVaultApp(App):
         cond_keys = ["conditional_enabled", "cond_amb_min", "cond_amb_max", "cond_beer_min", "cond_beer_max"]
         # ------------------------------
         
+        # UI properties whose backend key has a different name
+        renamed_keys = {
+            "ambient_mode_deadband_f": "ambient_deadband",
+            "pid_envelope_f": "beer_pid_envelope_width",
+            "crash_mode_envelope_f": "crash_pid_envelope_width",
+            "ramp_pre_ramp_tolerance_f": "ramp_pre_ramp_tolerance",
+            "ramp_thermostatic_deadband_f": "ramp_thermo_deadband",
+            "ramp_pid_landing_zone_f": "ramp_pid_landing_zone",
+        }
+        
         cooling_update = {}
         api_update = {}
         
@@ -937,71 +1081,64 @@ class FermVaultApp(App):
         # Capture old frequency for rescheduling
         old_freq = int(self.settings_manager.get("frequency_hours", 0))
 
-        for key, val in self.staged_changes.items():
-            if key in cooling_keys:
-                cooling_update[key] = float(val) * 60.0
-            
-            elif key == "api_call_frequency_m":
-                api_update["api_call_frequency_s"] = int(float(val) * 60)
-            
-            elif key in ["window_size", "max_outliers", "fg_check_frequency_h"]:
-                 api_update[key] = int(float(val))
-            
-            elif key == "tolerance":
-                 api_update[key] = float(val)
-                 
-            elif key == "api_key":
-                 api_update[key] = str(val)
-
-            # --- NOTIFICATIONS HANDLING ---
-            elif key == "notif_frequency_hours":
-                new_freq = int(float(val))
-                self.settings_manager.set("frequency_hours", new_freq)
-                notif_update_freq = new_freq
-            
-            elif key in smtp_keys:
-                # Map Property Key -> Backend Key
-                if key == "smtp_recipient": smtp_update["email_recipient"] = str(val)
-                elif key == "smtp_sender": smtp_update["server_email"] = str(val)
-                elif key == "smtp_password": smtp_update["server_password"] = str(val)
-                elif key == "smtp_server": smtp_update["smtp_server"] = str(val)
-                elif key == "smtp_port": smtp_update["smtp_port"] = int(val)
-            
-            elif key in cond_keys:
-                # Map properties to backend keys
-                if key == "conditional_enabled": cond_update["conditional_enabled"] = bool(val)
-                elif key == "cond_amb_min": cond_update["conditional_amb_min"] = float(val)
-                elif key == "cond_amb_max": cond_update["conditional_amb_max"] = float(val)
-                elif key == "cond_beer_min": cond_update["conditional_beer_min"] = float(val)
-                elif key == "cond_beer_max": cond_update["conditional_beer_max"] = float(val)
+        # --- One transaction: validated together, saved once, one change notification ---
+        try:
+            with self.settings_manager.transaction() as txn:
+                for key, val in self.staged_changes.items():
+                    if key in cooling_keys:
+                        cooling_update[key] = float(val) * 60.0
+                    
+                    elif key == "api_call_frequency_m":
+                        api_update["api_call_frequency_s"] = int(float(val) * 60)
+                    
+                    elif key in ["window_size", "max_outliers", "fg_check_frequency_h"]:
+                         api_update[key] = int(float(val))
+                    
+                    elif key == "tolerance":
+                         api_update[key] = float(val)
+                         
+                    elif key == "api_key":
+                         api_update[key] = str(val)
+
+                    # --- NOTIFICATIONS HANDLING ---
+                    elif key == "notif_frequency_hours":
+                        new_freq = int(float(val))
+                        txn.set("frequency_hours", new_freq)
+                        notif_update_freq = new_freq
+                    
+                    elif key in smtp_keys:
+                        # Map Property Key -> Backend Key
+                        if key == "smtp_recipient": smtp_update["email_recipient"] = str(val)
+                        elif key == "smtp_sender": smtp_update["server_email"] = str(val)
+                        elif key == "smtp_password": smtp_update["server_password"] = str(val)
+                        elif key == "smtp_server": smtp_update["smtp_server"] = str(val)
+                        elif key == "smtp_port": smtp_update["smtp_port"] = int(val)
+                    
+                    elif key in cond_keys:
+                        # Map properties to backend keys
+                        if key == "conditional_enabled": cond_update["conditional_enabled"] = bool(val)
+                        elif key == "cond_amb_min": cond_update["conditional_amb_min"] = float(val)
+                        elif key == "cond_amb_max": cond_update["conditional_amb_max"] = float(val)
+                        elif key == "cond_beer_min": cond_update["conditional_beer_min"] = float(val)
+                        elif key == "cond_beer_max": cond_update["conditional_beer_max"] = float(val)
 
-            else:
-                self.settings_manager.set(key, val)
-                
-        if cooling_update:
-            current = self.settings_manager.get_all_compressor_protection_settings()
-            current.update(cooling_update)
-            self.settings_manager.save_compressor_protection_settings(current)
-
-        if api_update:
-             current_api = self.settings_manager.get_all_api_settings()
-             current_api.update(api_update)
-             self.settings_manager.save_api_settings(current_api)
-        
-        # --- SAVE SMTP ---
-        if smtp_update:
-            current_smtp = self.settings_manager.get_all_smtp_settings()
-            current_smtp.update(smtp_update)
-            # We must set this directly back to the main settings dict
-            self.settings_manager.settings['smtp_settings'] = current_smtp
-            self.settings_manager._save_all_settings() # Force save
-            
-        # --- SAVE CONDITIONAL ---
-        if cond_update:
-            current_notif = self.settings_manager.settings.get('notification_settings', {})
-            current_notif.update(cond_update)
-            self.settings_manager.settings['notification_settings'] = current_notif
-            self.settings_manager._save_all_settings()
+                    else:
+                        txn.set(renamed_keys.get(key, key), val)
+                        
+                if cooling_update:
+                    txn.update_category('compressor_protection_settings', cooling_update)
+                if api_update:
+                    txn.update_category('api_settings', api_update)
+                if smtp_update:
+                    txn.update_category('smtp_settings', smtp_update)
+                if cond_update:
+                    txn.update_category('notification_settings', cond_update)
+                if "relay_active_high" in self.staged_changes:
+                    txn.set("relay_logic_configured", True)
+        except ValueError as e:
+            # Nothing was applied; keep the staged changes so the user can correct them
+            self.log_system_message(f"Settings NOT saved: {e}")
+            return
 
         # --- RESCHEDULE IF FREQ CHANGED ---
         if notif_update_freq is not None:
@@ -1014,7 +1151,6 @@ class FermVaultApp(App):
             self.temp_controller.pid.Kd = float(self.settings_manager.get("pid_kd", 20.0))
 
         if "relay_active_high" in self.staged_changes:
-            self.settings_manager.set("relay_logic_configured", True)
             self.relay_control.update_relay_logic()
             
         self.staged_changes.clear()
@@ -1062,6 +1198,179 @@ class FermVaultApp(App):
         """Triggers the specific PID Safety Popup."""
         PIDWarningPopup().open()
 
+    # --- DIAGNOSTICS (SD-card write accounting) ---
+    def _apply_io_budget(self, changes):
+        try:
+            budget_mb = float(changes["io_write_budget_mb_day"] or 0.0)
+        except (TypeError, ValueError):
+            budget_mb = 0.0
+        io_accounting.set_budget(int(budget_mb * 1024 * 1024), self.log_system_message)
+
+    def refresh_diagnostics(self, dt=None):
+        self.io_report_text = "\n".join(io_accounting.format_report())
+
+    def start_diagnostics_refresh(self):
+        self.refresh_diagnostics()
+        self._diagnostics_event = Clock.schedule_interval(self.refresh_diagnostics, 5.0)
+
+    def stop_diagnostics_refresh(self):
+        event = getattr(self, '_diagnostics_event', None)
+        if event is not None:
+            event.cancel()
+            self._diagnostics_event = None
+
+    # --- NEW: History chart screen ---
+    def select_history_range(self, label):
+        self.history_range = label
+        self.load_history()
+
+    def load_history(self, dt=None):
+        """Queries the history DB off the UI thread; the chart is updated on the main thread."""
+        history = getattr(self, 'history', None)
+        if history is None or not history.available:
+            self.history_info_text = "History database not available."
+            return
+        hours = dict(RANGES_H).get(self.history_range, 24)
+        chart = self.history_screen.ids.history_chart
+        pixels = max(100, int(chart.width))
+        end = time.time()
+        start = end - hours * 3600
+
+        def worker():
+            history.flush(timeout=2.0) # Include the rows still waiting in the writer's batch
+            resolution, rows = history.series(start, end, points=pixels)
+            self._show_history(rows, start, end, resolution)
+
+        threading.Thread(target=worker, daemon=True, name="history-query").start()
+
+    @mainthread
+    def _show_history(self, rows, start, end, resolution):
+        chart = self.history_screen.ids.history_chart
+        chart.set_rows(rows, start, end)
+        if not chart.rows:
+            self.history_info_text = f"No data in the last {self.history_range}."
+            return
+        source = "raw samples" if resolution is None else f"{resolution // 60} min data"
+        # The chart plots stored (F) values; only the label follows the display unit
+        y_min, y_max = chart.y_min, chart.y_max
+        if self.temp_units == "C":
+            y_min, y_max = (y_min - 32.0) * 5.0 / 9.0, (y_max - 32.0) * 5.0 / 9.0
+        self.history_info_text = (
+            f"{y_min:.1f} - {y_max:.1f} {self.temp_units}   |   {source}   |   "
+            f"{datetime.fromtimestamp(start):%m-%d %H:%M} to {datetime.fromtimestamp(end):%m-%d %H:%M}"
+        )
+
+    def start_history_refresh(self):
+        self.load_history()
+        self._history_event = Clock.schedule_interval(self.load_history, 60.0)
+
+    def stop_history_refresh(self):
+        event = getattr(self, '_history_event', None)
+        if event is not None:
+            event.cancel()
+            self._history_event = None
+
+    # --- NEW: Settings DATA tab (streaming export to USB) ---
+    EXPORT_RANGES_H = {"24H": 24, "7D": 168, "30D": 720, "ALL": None}
+    EXPORT_STEPS_S = {"RAW": 0, "1 MIN": 60, "15 MIN": 900, "1 H": 3600}
+
+    def refresh_export_targets(self):
+        self.export_targets = export.find_usb_targets()
+        if self.export_target not in self.export_targets:
+            self.export_target = self.export_targets[0] if self.export_targets else ""
+        if not self.export_targets:
+            self.export_status_text = "No USB drive found."
+        elif not self.export_running:
+            self.export_status_text = f"Ready to export to {self.export_target}."
+
+    def refresh_session_archives(self):
+        """Fills the DATA tab session list from sessions/index.json."""
+        manager = getattr(self, 'session_manager', None)
+        if manager is None:
+            return
+        labels = []
+        for entry in manager.list_sessions():
+            started = datetime.fromtimestamp(entry["started"]).strftime("%m-%d")
+            labels.append(f"#{entry['session_no']} {entry['title']} ({started}, {entry['status']})")
+        self.session_archive_list = labels
+        if self.session_archive_choice not in labels:
+            self.session_archive_choice = labels[0] if labels else ""
+
+    def end_current_session(self):
+        entry = self.session_manager.end_session() if getattr(self, 'session_manager', None) else None
+        self.export_status_text = f"Archiving {entry['title']} ..." if entry else "No active session."
+        self.refresh_session_archives()
+
+    def copy_session_archive(self):
+        """Copies the selected session bundle to the selected USB drive."""
+        if not self.session_archive_choice or not self.export_target:
+            self.export_status_text = "Select a session and a USB drive."
+            return
+        session_no = int(self.session_archive_choice.split()[0].lstrip("#"))
+        src = self.session_manager.archive_path(session_no)
+        if src is None:
+            self.export_status_text = "That session has no archive yet."
+            return
+        dest = os.path.join(self.export_target, os.path.basename(src))
+        self.export_running = True
+        self.export_status_text = f"Copying {os.path.basename(src)} ..."
+
+        def worker():
+            try:
+                shutil.copyfile(src, dest)
+                message = f"Copied session archive to {dest}."
+            except OSError as e:
+                message = f"Copy failed: {e}"
+            self.log_system_message(message)
+            self._finish_export(message)
+
+        threading.Thread(target=worker, daemon=True, name="export").start()
+
+    def start_export(self):
+        if self.export_running:
+            return
+        if not self.export_target:
+            self.export_status_text = "No USB drive selected."
+            return
+        hours = self.EXPORT_RANGES_H.get(self.export_range)
+        end = time.time()
+        start = end - hours * 3600 if hours else None
+        step_s = self.EXPORT_STEPS_S.get(self.export_step, 0)
+        source, fmt = self.export_source, self.export_format
+        dest = os.path.join(self.export_target, export.export_filename(source, fmt, end))
+        data_dir = self.settings_manager.data_dir
+        self.export_running = True
+        self.export_status_text = f"Exporting {source} ({self.export_range}) ..."
+
+        def worker():
+            # Push queued rows to disk so the export includes the last few minutes
+            if self.temp_controller:
+                self.temp_controller.pid_logger.flush()
+            if getattr(self, 'history', None):
+                self.history.flush()
+            try:
+                rows = export.export(source, fmt, dest, start, end, step_s, data_dir)
+                message = f"Exported {rows} rows to {dest}."
+            except Exception as e:
+                message = f"Export failed: {e}"
+            self.log_system_message(message)
+            self._finish_export(message)
+
+        threading.Thread(target=worker, daemon=True, name="export").start()
+
+    @mainthread
+    def _finish_export(self, message):
+        self.export_running = False
+        self.export_status_text = message
+
+    def show_relay_stats(self):
+        """Opens the relay runtime / duty-cycle summary from the transition journal."""
+        if getattr(self, 'relay_control', None):
+            lines = self.relay_control.get_runtime_summary()
+        else:
+            lines = ["Relay control not initialized."]
+        RelayStatsPopup(stats_text="\n".join(lines)).open()
+
     def discard_changes(self):
         """
         Reverts changes and returns to Dashboard.
@@ -1195,12 +1504,20 @@ class FermVaultApp(App):
             # 2. Stop Monitoring Thread (Logic)
             if self.temp_controller:
                 self.temp_controller.stop_monitoring()
+                self.temp_controller.pid_logger.close()
+            if self.system_log_writer is not None:
+                self.system_log_writer.close()
+            if getattr(self, 'history', None):
+                self.history.close()
             
             # 3. Stop Standby Thread
             self.stop_standby_loop()
 
             # 4. Hardware Safety (Relays OFF)
             if self.relay_control:
+                # The monitor thread (daemon) may never reach its disarm; close /dev/watchdog
+                # with the magic character now, or the Pi reboots after we exit
+                self.relay_control.stop_watchdog()
                 self.relay_control.turn_off_all_relays()
 
             # 5. Flag as Controlled Shutdown
@@ -1317,6 +1634,11 @@ class FermVaultApp(App):
         try:
             if hasattr(self, 'temp_controller') and self.temp_controller:
                 self.temp_controller.stop_monitoring()
+                self.temp_controller.pid_logger.close()
+            if self.system_log_writer is not None:
+                self.system_log_writer.close()
+            if getattr(self, 'history', None):
+                self.history.close()
                 
             if hasattr(self, 'relay_control') and self.relay_control:
                 self.relay_control.cleanup_gpio()
@@ -18,11 +18,23 @@ MINUTES_TO_SECONDS = 60
 HOURS_TO_SECONDS = 3600
 STATUS_REQUEST_SUBJECT = "STATUS"
 ERROR_DEBOUNCE_INTERVAL_SECONDS = 3600
+CONDITIONAL_CHECK_INTERVAL_S = 60
+SCHEDULER_RETRY_S = 10 # Pause before retrying a task that is still due (e.g. a failed send)
+
+# Settings the scheduler and the conditional alerts work from. They are cached
+# and refreshed by a SettingsManager subscription instead of being re-read.
+SCHEDULE_KEYS = ("api_call_frequency_s", "active_api_service", "fg_check_frequency_h", "frequency_hours")
+CONDITIONAL_KEYS = (
+    "conditional_enabled", "conditional_amb_min", "conditional_amb_max",
+    "conditional_beer_min", "conditional_beer_max", "conditional_fg_stable",
+    "conditional_amb_sensor_lost", "conditional_beer_sensor_lost",
+)
 
 class NotificationManager:
     def __init__(self, settings_manager, ui_manager):
         self.settings_manager = settings_manager
         self.ui = ui_manager  
+        self.history = None # HistoryDB, set by the app
         
         # --- SCHEDULER STATE ---
         self._scheduler_running = False
@@ -55,6 +67,18 @@ class NotificationManager:
         }
         self.ALERT_COOLDOWN_SECONDS = 7200 # 2 Hours
 
+        # --- NEW: Cached settings, kept current by change notifications ---
+        self._cfg = {key: self.settings_manager.get(key) for key in SCHEDULE_KEYS + CONDITIONAL_KEYS}
+        self._settings_subscription = self.settings_manager.subscribe(
+            self._on_settings_changed, keys=SCHEDULE_KEYS + CONDITIONAL_KEYS
+        )
+
+    def _on_settings_changed(self, changes):
+        """SettingsManager subscriber: refresh the cache and let the scheduler re-plan."""
+        self._cfg.update(changes)
+        if any(key in SCHEDULE_KEYS for key in changes):
+            self._scheduler_event.set()
+
     def _get_command_help_text(self):
         """Returns a list of strings for the email command help text."""
         return [
@@ -100,78 +124,90 @@ class NotificationManager:
         if not lines:
             return "No commands found in email body."
 
-        for line in lines:
-            parts = line.split()
-            if not parts:
-                continue
-
-            command_key = " ".join(parts[:-1])
-            value_str = parts[-1] if len(parts) > 1 else None
+        # The whole email is one transaction: applied, saved and announced once
+        mode_label = None
+        reschedule_to = None
+        old_freq = self.settings_manager.get("frequency_hours", 0)
+        try:
+            with self.settings_manager.transaction() as txn:
+                for line in lines:
+                    parts = line.split()
+                    if not parts:
+                        continue
 
-            try:
-                if line == "control mode ambient":
-                    self.settings_manager.set("control_mode", "Ambient Hold")
-                    if self.ui: self.ui.root.after(0, self.ui.control_mode_var.set, "Ambient")
-                    results.append(f"OK: Control Mode set to Ambient.")
-                    commands_processed += 1
-                elif line == "control mode beer":
-                    self.settings_manager.set("control_mode", "Beer Hold")
-                    if self.ui: self.ui.root.after(0, self.ui.control_mode_var.set, "Beer")
-                    results.append(f"OK: Control Mode set to Beer.")
-                    commands_processed += 1
-                elif line == "control mode ramp":
-                    self.settings_manager.set("control_mode", "Ramp-Up")
-                    if self.ui: self.ui.root.after(0, self.ui.control_mode_var.set, "Ramp")
-                    results.append(f"OK: Control Mode set to Ramp.")
-                    commands_processed += 1
-                elif line == "control mode crash":
-                    self.settings_manager.set("control_mode", "Fast Crash")
-                    if self.ui: self.ui.root.after(0, self.ui.control_mode_var.set, "Crash")
-                    results.append(f"OK: Control Mode set to Crash.")
-                    commands_processed += 1
+                    command_key = " ".join(parts[:-1])
+                    value_str = parts[-1] if len(parts) > 1 else None
+
+                    try:
+                        if line == "control mode ambient":
+                            txn.set("control_mode", "Ambient Hold")
+                            mode_label = "Ambient"
+                            results.append(f"OK: Control Mode set to Ambient.")
+                            commands_processed += 1
+                        elif line == "control mode beer":
+                            txn.set("control_mode", "Beer Hold")
+                            mode_label = "Beer"
+                            results.append(f"OK: Control Mode set to Beer.")
+                            commands_processed += 1
+                        elif line == "control mode ramp":
+                            txn.set("control_mode", "Ramp-Up")
+                            mode_label = "Ramp"
+                            results.append(f"OK: Control Mode set to Ramp.")
+                            commands_processed += 1
+                        elif line == "control mode crash":
+                            txn.set("control_mode", "Fast Crash")
+                            mode_label = "Crash"
+                            results.append(f"OK: Control Mode set to Crash.")
+                            commands_processed += 1
                 
-                elif command_key in ["setpoint ambient", "setpoint beer", "setpoint ramp", "setpoint crash", "setpoint duration", "notification frequency"]:
-                    if not value_str:
-                        raise ValueError("missing value")
+                        elif command_key in ["setpoint ambient", "setpoint beer", "setpoint ramp", "setpoint crash", "setpoint duration", "notification frequency"]:
+                            if not value_str:
+                                raise ValueError("missing value")
                     
-                    value_f = self._parse_setpoint_value(value_str) 
+                            value_f = self._parse_setpoint_value(value_str) 
                     
-                    # Convert input C to F for storage, unless it's duration or frequency
-                    if command_key not in ["setpoint duration", "notification frequency"] and current_units == "C":
-                        value_f = (value_f * 9/5) + 32
-
-                    if command_key == "setpoint ambient":
-                        self.settings_manager.set("ambient_hold_f", value_f)
-                        results.append(f"OK: Ambient Hold set to {value_f:.1f} F.")
-                    elif command_key == "setpoint beer":
-                        self.settings_manager.set("beer_hold_f", value_f)
-                        results.append(f"OK: Beer Hold set to {value_f:.1f} F.")
-                    elif command_key == "setpoint ramp":
-                        self.settings_manager.set("ramp_up_hold_f", value_f)
-                        results.append(f"OK: Ramp-Up Hold set to {value_f:.1f} F.")
-                    elif command_key == "setpoint crash":
-                        self.settings_manager.set("fast_crash_hold_f", value_f)
-                        results.append(f"OK: Fast Crash Hold set to {value_f:.1f} F.")
-                    elif command_key == "setpoint duration":
-                        self.settings_manager.set("ramp_up_duration_hours", value_f)
-                        results.append(f"OK: Ramp Duration set to {value_f:.1f} hours.")
+                            # Convert input C to F for storage, unless it's duration or frequency
+                            if command_key not in ["setpoint duration", "notification frequency"] and current_units == "C":
+                                value_f = (value_f * 9/5) + 32
+
+                            if command_key == "setpoint ambient":
+                                txn.set("ambient_hold_f", value_f)
+                                results.append(f"OK: Ambient Hold set to {value_f:.1f} F.")
+                            elif command_key == "setpoint beer":
+                                txn.set("beer_hold_f", value_f)
+                                results.append(f"OK: Beer Hold set to {value_f:.1f} F.")
+                            elif command_key == "setpoint ramp":
+                                txn.set("ramp_up_hold_f", value_f)
+                                results.append(f"OK: Ramp-Up Hold set to {value_f:.1f} F.")
+                            elif command_key == "setpoint crash":
+                                txn.set("fast_crash_hold_f", value_f)
+                                results.append(f"OK: Fast Crash Hold set to {value_f:.1f} F.")
+                            elif command_key == "setpoint duration":
+                                txn.set("ramp_up_duration_hours", value_f)
+                                results.append(f"OK: Ramp Duration set to {value_f:.1f} hours.")
                     
-                    elif command_key == "notification frequency":
-                        old_freq = self.settings_manager.get("frequency_hours", 0)
-                        new_freq = int(value_f)
-                        if new_freq < 0: raise ValueError("Frequency cannot be negative.")
-                        self.settings_manager.set("frequency_hours", new_freq)
-                        self.force_reschedule(old_freq, new_freq)
-                        results.append(f"OK: Notification Frequency set to {new_freq} hours.")
-
-                    commands_processed += 1
-                else:
-                    results.append(f"Error: Unknown command '{line}'.")
+                            elif command_key == "notification frequency":
+                                new_freq = int(value_f)
+                                if new_freq < 0: raise ValueError("Frequency cannot be negative.")
+                                txn.set("frequency_hours", new_freq)
+                                reschedule_to = new_freq
+                                results.append(f"OK: Notification Frequency set to {new_freq} hours.")
+
+                            commands_processed += 1
+                        else:
+                            results.append(f"Error: Unknown command '{line}'.")
 
-            except ValueError as e:
-                results.append(f"Error parsing '{line}': {e}.")
-            except Exception as e:
-                results.append(f"Error processing '{line}': {e}.")
+                    except ValueError as e:
+                        results.append(f"Error parsing '{line}': {e}.")
+                    except Exception as e:
+                        results.append(f"Error processing '{line}': {e}.")
+        except ValueError as e:
+            return "\n".join(results + [f"Error: No changes applied ({e})."])
+
+        if reschedule_to is not None:
+            self.force_reschedule(old_freq, reschedule_to)
+        if self.ui and mode_label:
+            self.ui.root.after(0, self.ui.control_mode_var.set, mode_label)
 
         if commands_processed > 0:
             if self.ui and self.ui.temp_controller:
@@ -310,29 +346,34 @@ class NotificationManager:
     def _scheduler_loop(self):
         """The main loop for periodic data fetching, FG calcs, and notifications."""
         while self._scheduler_running:
+            self._scheduler_event.clear() # Wake-ups from here on re-run the plan
             now = time.time()
+            cfg = self._cfg
+            next_due = now + CONDITIONAL_CHECK_INTERVAL_S
+            api_enabled = cfg["active_api_service"] != "OFF"
             
             # --- 1. API DATA FETCH LOGIC ---
-            api_freq_s = self.settings_manager.get("api_call_frequency_s", 1200)
-            if self.settings_manager.get("active_api_service") != "OFF" and api_freq_s > 0:
+            api_freq_s = cfg["api_call_frequency_s"] or 0
+            if api_enabled and api_freq_s > 0:
                 if now >= self.last_api_fetch_time + api_freq_s:
                     print(f"[NotificationManager] Scheduled time reached. Fetching API data.")
                     current_id = self.settings_manager.get("current_brew_session_id")
                     self.fetch_api_data_now(current_id, is_scheduled=True)
                     self.last_api_fetch_time = now
+                next_due = min(next_due, self.last_api_fetch_time + api_freq_s)
             
             # --- 2. FG CALCULATION LOGIC ---
-            fg_freq_h = self.settings_manager.get("fg_check_frequency_h", 24)
+            fg_freq_h = cfg["fg_check_frequency_h"] or 0
             fg_freq_s = fg_freq_h * 3600 
-            if self.settings_manager.get("active_api_service") != "OFF" and fg_freq_s > 0:
+            if api_enabled and fg_freq_s > 0:
                 if now >= self.last_fg_calc_time + fg_freq_s:
                     print(f"[NotificationManager] Scheduled time reached. Running FG Calc.")
                     self._run_scheduled_fg_calc()
                     self.last_fg_calc_time = now
+                next_due = min(next_due, self.last_fg_calc_time + fg_freq_s)
 
             # --- 3. PUSH NOTIFICATION LOGIC ---
-            notif_freq_h = self.settings_manager.get("frequency_hours", 0)
-            notif_freq_s = self._get_interval_seconds(notif_freq_h)
+            notif_freq_s = self._get_interval_seconds(cfg["frequency_hours"])
             
             # GUARD: Only proceed if frequency > 0
             if notif_freq_s > 0:
@@ -340,14 +381,18 @@ class NotificationManager:
                     print(f"[NotificationManager] Scheduled time reached. Sending status report.")
                     if self._send_status_message(is_scheduled=True):
                         self.last_notification_sent_time = now
+                next_due = min(next_due, self.last_notification_sent_time + notif_freq_s)
 
             # --- 4. CONDITIONAL ALERT LOGIC (Every 60 seconds) ---
-            if now >= self.last_conditional_check_time + 60:
+            if now >= self.last_conditional_check_time + CONDITIONAL_CHECK_INTERVAL_S:
                 self._check_conditional_alerts()
                 self.last_conditional_check_time = now
+            next_due = min(next_due, self.last_conditional_check_time + CONDITIONAL_CHECK_INTERVAL_S)
             
             # --- 5. WAIT LOGIC ---
-            self._scheduler_event.wait(timeout=10.0) 
+            # Sleep until the next task is due; settings changes and reschedules wake us early
+            wait_s = next_due - time.time()
+            self._scheduler_event.wait(timeout=wait_s if wait_s > 0 else SCHEDULER_RETRY_S)
             
             if not self._scheduler_running: break
         print("[NotificationManager] Scheduler loop stopped.")
@@ -355,7 +400,8 @@ class NotificationManager:
     def _check_conditional_alerts(self):
         """Checks current conditions against thresholds and sends alerts if needed."""
         
-        if not self.settings_manager.get("conditional_enabled", False):
+        cfg = self._cfg
+        if not cfg["conditional_enabled"]:
             return
 
         now = time.time()
@@ -366,8 +412,8 @@ class NotificationManager:
 
         # --- A. TEMPERATURE CHECKS ---
         amb_actual = get_temp(self.settings_manager.get("amb_temp_actual"))
-        amb_min = self.settings_manager.get("conditional_amb_min")
-        amb_max = self.settings_manager.get("conditional_amb_max")
+        amb_min = cfg["conditional_amb_min"]
+        amb_max = cfg["conditional_amb_max"]
         
         if amb_actual is not None and amb_min is not None and amb_max is not None:
             if amb_actual < amb_min or amb_actual > amb_max:
@@ -377,8 +423,8 @@ class NotificationManager:
                         self._alert_cooldowns["ambient_temp"] = now
 
         beer_actual = get_temp(self.settings_manager.get("beer_temp_actual"))
-        beer_min = self.settings_manager.get("conditional_beer_min")
-        beer_max = self.settings_manager.get("conditional_beer_max")
+        beer_min = cfg["conditional_beer_min"]
+        beer_max = cfg["conditional_beer_max"]
         
         if beer_actual is not None and beer_min is not None and beer_max is not None:
             if beer_actual < beer_min or beer_actual > beer_max:
@@ -390,20 +436,20 @@ class NotificationManager:
         # --- B. SENSOR ERROR CHECKS ---
         error_msg = self.settings_manager.get("sensor_error_message", "")
         
-        if self.settings_manager.get("conditional_amb_sensor_lost", False):
+        if cfg["conditional_amb_sensor_lost"]:
             if "Ambient Sensor" in error_msg:
                 if now - self._alert_cooldowns["sensor_amb"] > self.ALERT_COOLDOWN_SECONDS:
                     if self._send_alert_email("Sensor Failure", f"Critical: {error_msg}"):
                         self._alert_cooldowns["sensor_amb"] = now
 
-        if self.settings_manager.get("conditional_beer_sensor_lost", False):
+        if cfg["conditional_beer_sensor_lost"]:
             if "Beer Sensor" in error_msg:
                 if now - self._alert_cooldowns["sensor_beer"] > self.ALERT_COOLDOWN_SECONDS:
                     if self._send_alert_email("Sensor Failure", f"Critical: {error_msg}"):
                          self._alert_cooldowns["sensor_beer"] = now
 
         # --- C. FG STABLE CHECK ---
-        if self.settings_manager.get("conditional_fg_stable", False):
+        if cfg["conditional_fg_stable"]:
             fg_status = self.settings_manager.get("fg_status_var", "")
             fg_value = self.settings_manager.get("fg_value_var", "")
             
@@ -477,6 +523,21 @@ class NotificationManager:
 
                 self.settings_manager.set("og_timestamp_var", og_time_str)
                 self.settings_manager.set("sg_timestamp_var", sg_time_str)
+                
+                if self.history:
+                    self.history.add_gravity(data.get("sg_timestamp"), data.get("sg_actual"),
+                                             session_id=brew_session_id, temp_f=data.get("beer_temp_f"))
+
+                # --- NEW: Hydrometer temperature feeds the beer-probe-loss estimator ---
+                hydro_temp_f = data.get("beer_temp_f")
+                if hydro_temp_f is not None and self.ui.temp_controller:
+                    try:
+                        measured_at = datetime.strptime(sg_time_str, "%Y-%m-%d %H:%M:%S").timestamp()
+                    except ValueError:
+                        measured_at = None # Placeholder text: a reading of unknown age is never fused
+                    if measured_at is not None:
+                        self.ui.temp_controller.add_hydrometer_temperature(hydro_temp_f, measured_at)
+                # -----------------------------------------------------------------------
 
                 if not is_scheduled:
                     self.ui.log_system_message("API data updated.")
@@ -737,6 +798,7 @@ class NotificationManager:
         sg_val = self.settings_manager.get("sg_display_var", "-.---")
         sg_time = self.settings_manager.get("sg_timestamp_var", "")
         fg_val = self.settings_manager.get("fg_value_var", "-.---")
+        beer_eta = self.settings_manager.get("beer_eta_message", "")
 
         def convert(temp_f):
              try:
@@ -756,8 +818,9 @@ class NotificationManager:
         internal_mode = self.settings_manager.get('control_mode')
         display_mode = INTERNAL_TO_DISPLAY_MAP.get(internal_mode, "Beer")
         
-        heat_state = self.settings_manager.get("heat_state", "Heating OFF")
-        cool_state = self.settings_manager.get("cool_state", "Cooling OFF")
+        relay_control = getattr(self.ui, 'relay_control', None) if self.ui else None
+        heat_state = relay_control.status.heat_text if relay_control else "Heating OFF"
+        cool_state = relay_control.status.cool_text if relay_control else "Cooling OFF"
         
         body_lines = [
             f"Fermentation Vault Status Report ({units})",
@@ -768,6 +831,7 @@ class NotificationManager:
             "--- Beer ---",
             f"Actual: {convert(beer_actual)}",
             f"Target: {convert(beer_set)}",
+            f"ETA: {beer_eta if beer_eta else '--'}",
             "",
             "--- Ambient ---",
             f"Actual: {convert(amb_actual)}",
@@ -785,6 +849,21 @@ class NotificationManager:
             f"Cooling: {cool_state}",
         ]
         
+        # --- NEW: Last 24 h from the history database ---
+        if self.history:
+            since = time.time() - 24 * HOURS_TO_SECONDS
+            beer_24h = self.history.aggregate("samples", "beer_temp", start=since)
+            amb_24h = self.history.aggregate("samples", "amb_temp", start=since)
+            if beer_24h["count"] or amb_24h["count"]:
+                body_lines += ["", "--- Last 24 h (min / avg / max) ---"]
+                for label, agg in (("Beer", beer_24h), ("Ambient", amb_24h)):
+                    if agg["count"]:
+                        body_lines.append(f"{label}: {convert(agg['min'])} / {convert(agg['avg'])} / {convert(agg['max'])}")
+        
+        # --- NEW: Relay runtime / duty cycle from the transition journal ---
+        if self.ui and getattr(self.ui, 'relay_control', None):
+            body_lines += ["", "--- Relay Runtime ---"] + self.ui.relay_control.get_runtime_summary()
+        
         return "\n".join(body_lines)
     
     def _run_scheduled_fg_calc(self):
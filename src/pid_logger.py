@@ -0,0 +1,295 @@
+"""
+fermvault app
+pid_logger.py
+"""
+
+import csv
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import io_accounting
+from log_rotation import LogRotator, csv_first_timestamp
+from telemetry_store import TelemetryWriter
+
+# --- DEFAULTS ---
+PID_LOG_QUEUE_SIZE = 1000        # ~80 min of 5 s samples before anything is dropped
+PID_LOG_FLUSH_ROWS = 60          # Flush after this many buffered rows...
+PID_LOG_FLUSH_INTERVAL_S = 30.0  # ...or this long after the first unflushed row
+PID_LOG_BUFFER_BYTES = 64 * 1024
+# --- END DEFAULTS ---
+
+FIELDNAMES = ['Timestamp', 'ControlMode', 'Setpoint', 'MeasuredTemp', 'PID_Output',
+              'AmbientSetpoint_Min', 'AmbientSetpoint_Max', 'CoolState', 'HeatState']
+
+LOG_FORMATS = ("binary", "csv")
+
+_FLUSH = "flush"
+_STOP = "stop"
+
+
+class CSVSink:
+    """Text sink writing the original pid_log.csv columns."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self._writer = None
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.file = open(self.path, 'a', newline='', buffering=PID_LOG_BUFFER_BYTES)
+        self._writer = csv.writer(self.file)
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self._writer.writerow(FIELDNAMES)
+
+    def write(self, sample):
+        timestamp, control_mode, setpoint, measured_temp, pid_output, amb_min, amb_max, cool_on, heat_on = sample[:9]
+        self._writer.writerow([
+            datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S"),
+            control_mode,
+            f"{setpoint:.2f}",
+            f"{measured_temp:.3f}",
+            f"{pid_output:.4f}",
+            f"{amb_min:.2f}",
+            f"{amb_max:.2f}",
+            "ON" if cool_on else "OFF",
+            "ON" if heat_on else "OFF",
+        ])
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def first_timestamp(self):
+        return csv_first_timestamp(self.path)
+
+
+def create_sink(path_without_ext, log_format):
+    """"binary" -> pid_log.bin (telemetry_store format), "csv" -> pid_log.csv."""
+    if log_format == "csv":
+        return CSVSink(path_without_ext + ".csv")
+    return TelemetryWriter(path_without_ext + ".bin")
+
+
+class PIDLogger:
+    """
+    Appends PID samples to the PID log from a background thread.
+
+    log() only puts a tuple on a bounded queue, so the control tick never
+    waits on the SD card. The writer keeps the file open, formats the rows
+    and flushes in batches. If the queue is full the sample is dropped and
+    counted; the count is reported with the next flush.
+
+    With a rotation policy (log_rotation.RotationPolicy) the file is rotated
+    into segments after a flush once it is too large or too old.
+    """
+
+    def __init__(self, sink, on_error=None, rotation=None, max_queue=PID_LOG_QUEUE_SIZE,
+                 flush_rows=PID_LOG_FLUSH_ROWS, flush_interval_s=PID_LOG_FLUSH_INTERVAL_S):
+        self._sink = sink
+        self._rotation = rotation
+        self._rotator = None
+        self._segment_start = None
+        self._segment_end = None
+        self._new_sink = None
+        self._on_error = on_error
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._flush_rows = flush_rows
+        self._flush_interval_s = flush_interval_s
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._inode = None
+        self._flushed_size = 0
+        self._error_reported = False
+        self.written = 0
+        self.dropped = 0
+        self.session_no = 0 # Tag for new samples; set by sessions.SessionManager
+        self._dropped_reported = 0
+
+    @property
+    def path(self):
+        return self._sink.path
+
+    def set_sink(self, sink):
+        """Switches format/file; the writer thread closes the old sink at its next item."""
+        self._new_sink = sink
+
+    # --- CONTROL THREAD SIDE ---
+    def log(self, setpoint, measured_temp, pid_output, amb_min, amb_max, control_mode, cool_on, heat_on,
+            beer_temp=None, amb_temp=None, aux_on=False, timestamp=None):
+        """Queues one sample. Never blocks; returns False if the sample was dropped."""
+        if self._thread is None:
+            self._start()
+        sample = (timestamp if timestamp is not None else time.time(), control_mode, setpoint,
+                  measured_temp, pid_output, amb_min, amb_max, cool_on, heat_on, beer_temp, amb_temp, aux_on,
+                  self.session_no)
+        try:
+            self._queue.put_nowait(sample)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout=2.0):
+        """Asks the writer to flush now and waits (bounded) until it has."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        try:
+            self._queue.put((_FLUSH, done), timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def close(self, timeout=2.0):
+        """Writes everything queued, closes the file and stops the thread."""
+        with self._thread_lock:
+            thread = self._thread
+            if thread is None:
+                return
+            try:
+                self._queue.put((_STOP, None), timeout=timeout)
+            except queue.Full:
+                print("[PIDLogger] Queue full at shutdown; unwritten samples lost.")
+                return
+            thread.join(timeout)
+            self._thread = None
+
+    def _start(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pid-logger", daemon=True)
+                self._thread.start()
+
+    # --- WRITER THREAD ---
+    def _run(self):
+        pending_rows = 0
+        first_pending = 0.0
+        while True:
+            timeout = None
+            if pending_rows:
+                timeout = max(0.0, first_pending + self._flush_interval_s - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if self._new_sink is not None:
+                self._flush()
+                self._close_file()
+                self._sink, self._new_sink = self._new_sink, None
+                pending_rows = 0
+
+            if item is None:
+                pass # Flush interval reached
+            elif item[0] == _FLUSH:
+                self._flush()
+                pending_rows = 0
+                item[1].set()
+                continue
+            elif item[0] == _STOP:
+                self._flush()
+                self._close_file()
+                return
+            else:
+                if self._write_row(item):
+                    if not pending_rows:
+                        first_pending = time.monotonic()
+                    pending_rows += 1
+                if pending_rows < self._flush_rows:
+                    continue
+
+            if pending_rows:
+                self._flush()
+                pending_rows = 0
+
+    def _open(self):
+        try:
+            # Size before opening, so a new file's header is accounted as written
+            self._flushed_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            self._sink.open()
+            self._inode = os.fstat(self._sink.file.fileno()).st_ino
+            self._segment_start = self._sink.first_timestamp() if self._flushed_size else None
+            self._error_reported = False
+            return True
+        except (PermissionError, IOError) as e:
+            self._sink.close()
+            self._report_error(f"[CRITICAL ERROR] Failed to write PID log to {os.path.dirname(self.path)}: {e}")
+            return False
+
+    def _write_row(self, sample):
+        if self._sink.file is None:
+            if not self._open():
+                return False
+        try:
+            self._sink.write(sample)
+            self.written += 1
+            if self._segment_start is None:
+                self._segment_start = sample[0]
+            self._segment_end = sample[0]
+            return True
+        except Exception as e:
+            self._report_error(f"[ERROR] Failed to write to PID log file: {e}")
+            self._close_file()
+            return False
+
+    def _flush(self):
+        dropped = self.dropped - self._dropped_reported
+        if dropped:
+            self._dropped_reported += dropped
+            print(f"[PIDLogger] Logger queue full: dropped {dropped} samples ({self.dropped} total).")
+        if self._sink.file is None:
+            return
+        try:
+            self._sink.flush()
+            size = os.fstat(self._sink.file.fileno()).st_size
+            io_accounting.record_write(self.path, max(0, size - self._flushed_size))
+            self._flushed_size = size
+        except Exception as e:
+            self._report_error(f"[ERROR] Failed to write to PID log file: {e}")
+            self._close_file()
+            return
+        if self._rotation is not None:
+            self._maybe_rotate(size)
+            if self._sink.file is None:
+                return
+        # The file was deleted or moved away (e.g. by the user): start a new one on the next row
+        try:
+            if os.stat(self.path).st_ino != self._inode:
+                self._close_file()
+        except OSError:
+            self._close_file()
+
+    def _maybe_rotate(self, size):
+        if self._rotator is None or self._rotator.path != self.path:
+            self._rotator = LogRotator(self.path, self._rotation)
+        if not self._rotator.should_rotate(size, self._segment_start):
+            return
+        self._close_file()
+        try:
+            self._rotator.rotate(self._segment_start, self._segment_end)
+        except OSError as e:
+            print(f"[PIDLogger] Log rotation failed: {e}")
+        self._segment_start = None # The next row starts a new file
+
+    def _close_file(self):
+        try:
+            self._sink.close()
+        except Exception:
+            self._sink.file = None
+
+    def _report_error(self, message):
+        print(message)
+        if not self._error_reported and self._on_error is not None:
+            self._error_reported = True # Once per failure, not once per sample
+            try:
+                self._on_error(message)
+            except Exception:
+                pass
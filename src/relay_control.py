@@ -8,24 +8,64 @@ import time
 from datetime import datetime
 import os
 import sys
-import RPi.GPIO as GPIO # Import the real RPi.GPIO library directly
+from gpio_backend import create_backend, HIGH, LOW
+from relay_watchdog import RelayWatchdog
+from relay_journal import (
+    RelayJournal, REASON_DEMAND, REASON_DWELL, REASON_FAIL_SAFE,
+    REASON_AUX, REASON_SHUTDOWN, REASON_MANUAL
+)
 
 # --- GPIO SETUP ---
-# Set BCM mode globally ONCE at import time
-GPIO.setmode(GPIO.BCM) 
+# The hardware library is loaded lazily by the selected backend (gpio_backend.py),
+# so importing this module works on any machine.
 
 # Define Relay States (RELAY_OFF = HIGH, RELAY_ON = LOW)
-RELAY_OFF = GPIO.HIGH
-RELAY_ON = GPIO.LOW
+RELAY_OFF = HIGH
+RELAY_ON = LOW
 # --- END GPIO SETUP ---
 
+RELAY_NAMES = ("Heat", "Cool", "Fan")
+READBACK_INTERVAL_S = 60 # Low-rate check that the pins still match the register
+
+
+class RelayStatus:
+    """
+    Immutable snapshot of the relay outputs. A new object is published on
+    every change, so subscribers can keep the reference without copying.
+    """
+    __slots__ = ("heat_on", "cool_on", "aux_on", "restriction_message", "timestamp")
+
+    def __init__(self, heat_on=False, cool_on=False, aux_on=False, restriction_message="", timestamp=None):
+        self.heat_on = heat_on
+        self.cool_on = cool_on
+        self.aux_on = aux_on
+        self.restriction_message = restriction_message
+        self.timestamp = timestamp if timestamp is not None else time.time()
+
+    def same_as(self, heat_on, cool_on, aux_on, restriction_message):
+        return (self.heat_on == heat_on and self.cool_on == cool_on
+                and self.aux_on == aux_on and self.restriction_message == restriction_message)
+
+    # Display strings (only built when a consumer actually needs text)
+    @property
+    def heat_text(self): return "HEATING" if self.heat_on else "Heating OFF"
+    @property
+    def cool_text(self): return "COOLING" if self.cool_on else "Cooling OFF"
+    @property
+    def aux_text(self): return "Aux ON" if self.aux_on else "Aux OFF"
+
 
 class RelayControl:
     
-    def __init__(self, settings_manager, relay_pins):
+    def __init__(self, settings_manager, relay_pins, backend=None):
         self.settings = settings_manager
         self.pins = relay_pins
-        self.gpio = GPIO # Use the real GPIO library
+        # Backend chosen at runtime: RPi.GPIO/lgpio, libgpiod or in-memory mock
+        self.gpio = backend or create_backend(
+            self.settings.get("gpio_backend", "auto"),
+            self.settings.get("gpio_chip", "/dev/gpiochip0")
+        )
+        print(f"[RelayControl] Using GPIO backend: {self.gpio.name}")
         
         self.last_cool_change = time.time()
         self.cool_start_time = None
@@ -39,6 +79,34 @@ class RelayControl:
         self.relay_state_cache = {"Heat": False, "Cool": False, "Fan": False}
         # --------------------------------------------------------------
         
+        # --- NEW: Shadow register of the level last driven onto each pin ---
+        # Authoritative relay state; only changed through _write_relay().
+        # None = unknown (pin not driven yet / logic changed), forces the next write.
+        self._pin_register = {name: None for name in RELAY_NAMES}
+        self._register_lock = threading.RLock()
+        self._last_readback_time = time.time()
+        self._transition_listeners = []
+        # -------------------------------------------------------------------
+        
+        # --- NEW: Out-of-loop watchdog (created on the first pet) ---
+        self.watchdog = None
+        # ------------------------------------------------------------
+        
+        # --- NEW: Typed relay status, published by reference to subscribers ---
+        self.status = RelayStatus()
+        self._status_subscribers = []
+        # -----------------------------------------------------------------------
+        
+        # --- NEW: Relay transition journal (runtime / duty-cycle accounting) ---
+        self.journal = None
+        try:
+            self.journal = RelayJournal(os.path.join(self.settings.data_dir, "relay_journal.bin"))
+            self.journal.close_open_intervals()
+            self.add_transition_listener(self.journal.record)
+        except Exception as e:
+            print(f"[RelayControl] Relay journal disabled: {e}")
+        # -----------------------------------------------------------------------
+        
         # --- NEW: Initialize Logic Config ---
         self.logic_configured = self.settings.get("relay_logic_configured", False)
         # Load the correct High/Low values (this sets self.RELAY_ON and self.RELAY_OFF)
@@ -52,7 +120,7 @@ class RelayControl:
             
             # Set the initial default message (Demand is OFF at startup)
             startup_msg = f"Demand OFF; DWELL until {dwell_end_time.strftime('%H:%M:%S')}"
-            self.settings.set("cool_restriction_status", startup_msg)
+            self._publish_status(restriction_message=startup_msg)
         except Exception as e:
             print(f"[ERROR] RelayControl init failed to set startup dwell message: {e}")
         # --- END NEW ---
@@ -85,6 +153,13 @@ class RelayControl:
             if not initial_setup:
                  print("[RelayControl] Logic set to ACTIVE LOW")
 
+        # Levels have (possibly) flipped, so the register no longer describes the pins
+        self._invalidate_register()
+
+        # The watchdog's idea of "OFF" changed with the logic; it is recreated on the next pet
+        if not initial_setup:
+            self.stop_watchdog()
+
         # If we are live (not booting) and configured, apply the new OFF state immediately for safety
         if not initial_setup and self.logic_configured:
              self.turn_off_all_relays()
@@ -94,23 +169,30 @@ class RelayControl:
         self.gpio.setwarnings(False)
         # self.gpio.setmode(self.gpio.BCM) # Mode is set at import
 
+        valid_pins = []
         for pin in self.pins.values():
             try:
-                pin_int = int(pin)
+                valid_pins.append(int(pin))
             except ValueError:
                 print(f"[ERROR] GPIO: Skipping pin {pin} as it's not a valid number.")
-                continue
 
-            # --- SAFETY LOGIC ---
-            if not self.logic_configured:
-                # SAFETY MODE: Set to INPUT (High Impedance)
-                # This ensures we don't accidentally trigger a relay until the user confirms logic.
+        # --- SAFETY LOGIC ---
+        if not self.logic_configured:
+            # SAFETY MODE: Set to INPUT (High Impedance)
+            # This ensures we don't accidentally trigger a relay until the user confirms logic.
+            for pin_int in valid_pins:
                 self.gpio.setup(pin_int, self.gpio.IN)
-            else:
-                # OPERATIONAL MODE: Set to OUT and drive to SAFE OFF
-                self.gpio.setup(pin_int, self.gpio.OUT)
-                self.gpio.output(pin_int, self.RELAY_OFF) # Ensure all are OFF initially
-            # --------------------
+        elif valid_pins:
+            # OPERATIONAL MODE: Claim the relay pins as one output group, driven to SAFE OFF
+            # as part of the claim so no pin glitches ON. Backends without grouped
+            # writes fall back to one setup per pin.
+            self.gpio.setup_group(valid_pins, [self.RELAY_OFF] * len(valid_pins))
+        # --------------------
+
+        with self._register_lock:
+            for name in RELAY_NAMES:
+                self._pin_register[name] = self.RELAY_OFF if self.logic_configured else None
+                self.relay_state_cache[name] = False
 
     def run_setup_test(self, state):
         """
@@ -126,18 +208,197 @@ class RelayControl:
             elif state == "RESET":
                 # Revert to Safety Input Mode
                 self.gpio.setup(fan_pin, self.gpio.IN)
+            # Pin was driven outside the register
+            with self._register_lock:
+                self._pin_register["Fan"] = None
         except Exception as e:
             print(f"[RelayControl] Setup test failed: {e}")
 
+    # --- STATUS PUBLISHING ---
+    def subscribe_status(self, callback):
+        """Registers callback(status: RelayStatus), called whenever the relay status changes."""
+        if callback not in self._status_subscribers:
+            self._status_subscribers.append(callback)
+
+    def unsubscribe_status(self, callback):
+        if callback in self._status_subscribers:
+            self._status_subscribers.remove(callback)
+
+    def _publish_status(self, heat_on=None, cool_on=None, aux_on=None, restriction_message=None):
+        """Replaces self.status (only if something changed) and notifies subscribers. None = unchanged."""
+        current = self.status
+        heat_on = current.heat_on if heat_on is None else heat_on
+        cool_on = current.cool_on if cool_on is None else cool_on
+        aux_on = current.aux_on if aux_on is None else aux_on
+        restriction_message = current.restriction_message if restriction_message is None else restriction_message
+        if current.same_as(heat_on, cool_on, aux_on, restriction_message):
+            return current
+
+        status = RelayStatus(heat_on, cool_on, aux_on, restriction_message)
+        self.status = status # Single reference swap; readers never see a half-updated status
+        for callback in list(self._status_subscribers):
+            try:
+                callback(status)
+            except Exception as e:
+                print(f"[RelayControl] Status subscriber error: {e}")
+        return status
+
+    # --- WATCHDOG ---
+    def pet_watchdog(self, tick_interval_s):
+        """
+        Called once per control tick with the tick's actual length (wait plus
+        work). Starts the watchdog on first use; the budget is
+        watchdog_missed_ticks such ticks.
+        """
+        if self.watchdog is None:
+            mode = self.settings.get("watchdog_mode", "hardware")
+            if mode == "off" or not self.logic_configured:
+                return
+            self._start_watchdog(mode, tick_interval_s)
+
+        if not self.watchdog.pet():
+            if self.watchdog.mode == "hardware":
+                # e.g. the device was busy on a re-open after disarm()
+                self.watchdog.stop()
+                self._watchdog_message("WATCHDOG: Hardware watchdog failed. Switching to the watchdog process.")
+                self._start_watchdog("process", tick_interval_s)
+                self.watchdog.pet()
+            else:
+                self._watchdog_message("WATCHDOG: Watchdog process failed. Relays are NOT supervised.")
+                self.watchdog.mode = "off"
+
+    def _start_watchdog(self, mode, tick_interval_s):
+        missed_ticks = max(1, int(self.settings.get("watchdog_missed_ticks", 2)))
+        timeout_s = tick_interval_s * missed_ticks
+        off_levels = []
+        for name in RELAY_NAMES:
+            try:
+                off_levels.append((int(self.pins[name]), self.RELAY_OFF))
+            except (KeyError, ValueError):
+                pass
+        chip_path = self.settings.get("gpio_chip", "/dev/gpiochip0")
+        self.watchdog = RelayWatchdog(off_levels, mode=mode, backend_name=self.gpio.name, chip_path=chip_path)
+        started = self.watchdog.start(timeout_s)
+        if not started and mode == "hardware":
+            # No access (needs root), device busy, or a budget above the hardware limit
+            self._watchdog_message(f"WATCHDOG: Hardware watchdog unavailable for a {timeout_s:.0f} s budget. "
+                                   f"Using the watchdog process.")
+            self.watchdog = RelayWatchdog(off_levels, mode="process", backend_name=self.gpio.name, chip_path=chip_path)
+            started = self.watchdog.start(timeout_s)
+        if not started:
+            self._watchdog_message(f"WATCHDOG: Watchdog mode '{mode}' unavailable. Relays are NOT supervised.")
+            self.watchdog.mode = "off" # Keep the object so we don't retry every tick
+
+    def _watchdog_message(self, message):
+        print(f"[RelayControl] {message}")
+        if self.logger:
+            self.logger(message)
+
+    def disarm_watchdog(self):
+        if self.watchdog:
+            self.watchdog.disarm()
+
+    def stop_watchdog(self):
+        if self.watchdog:
+            self.watchdog.stop()
+            self.watchdog = None
+
+    # --- SHADOW REGISTER ---
+    def add_transition_listener(self, callback):
+        """Registers callback(name, is_on, timestamp, reason), called on every relay transition."""
+        if callback not in self._transition_listeners:
+            self._transition_listeners.append(callback)
+
+    def _invalidate_register(self):
+        with self._register_lock:
+            for name in RELAY_NAMES:
+                self._pin_register[name] = None
+
+    def _write_relay(self, name, is_on, reason=REASON_DEMAND, force=False):
+        self._write_relays({name: (is_on, reason)}, force=force)
+
+    def _write_relays(self, states, force=False):
+        """
+        The only write path to the relay pins. states = {name: (is_on, reason)}.
+        Pins whose level differs from the register (or all, with force=True)
+        are committed in ONE backend call where the backend supports grouped
+        writes; otherwise OFF levels are written before ON levels so heat and
+        cool are never both energised mid-update. Emits transition events for
+        logical state changes.
+        """
+        transitions = []
+        with self._register_lock:
+            if self.logic_configured:
+                pending = []
+                for name, (is_on, _reason) in states.items():
+                    level = self.RELAY_ON if is_on else self.RELAY_OFF
+                    if force or self._pin_register[name] != level:
+                        pending.append((name, is_on, level))
+                if pending:
+                    pending.sort(key=lambda item: item[1]) # OFF first for the fallback path
+                    self.gpio.output_many([(self.pins[name], level) for name, _on, level in pending])
+                    for name, _on, level in pending:
+                        self._pin_register[name] = level
+            
+            for name, (is_on, reason) in states.items():
+                if self.relay_state_cache[name] != is_on:
+                    transitions.append((name, is_on, reason))
+                self.relay_state_cache[name] = is_on
+
+        for name, is_on, reason in transitions:
+            self._on_relay_transition(name, is_on, reason)
+
+    def _on_relay_transition(self, name, is_on, reason):
+        timestamp = time.time()
+        for callback in list(self._transition_listeners):
+            try:
+                callback(name, is_on, timestamp, reason)
+            except Exception as e:
+                print(f"[RelayControl] Transition listener error: {e}")
+
+    def verify_register(self, force=False):
+        """
+        Low-rate readback: compares each driven pin with the register and
+        re-asserts the register value on disagreement. Returns the mismatched names.
+        """
+        now = time.time()
+        if not force and (now - self._last_readback_time) < READBACK_INTERVAL_S:
+            return []
+        self._last_readback_time = now
+        if not self.logic_configured:
+            return []
+
+        mismatched = []
+        with self._register_lock:
+            for name in RELAY_NAMES:
+                expected = self._pin_register[name]
+                if expected is None:
+                    continue
+                try:
+                    actual = self.gpio.input(self.pins[name])
+                except Exception as e:
+                    print(f"[RelayControl] Readback of {name} pin failed: {e}")
+                    continue
+                if actual != expected:
+                    mismatched.append(name)
+                    self.gpio.output(self.pins[name], expected)
+
+        if mismatched:
+            message = f"Relay readback mismatch on {', '.join(mismatched)}. Pin state re-asserted."
+            print(f"[RelayControl] {message}")
+            if self.logger:
+                self.logger(message)
+        return mismatched
+
     # FIXED
     def _is_cooling_on(self):
         if not self.logic_configured: return False
-        return self.gpio.input(self.pins["Cool"]) == self.RELAY_ON
+        return self.relay_state_cache["Cool"]
         
     # FIXED
     def _is_heating_on(self):
         if not self.logic_configured: return False
-        return self.gpio.input(self.pins["Heat"]) == self.RELAY_ON
+        return self.relay_state_cache["Heat"]
 
     # --- RELAY CONTROL AND PROTECTION ENFORCEMENT ---
 
@@ -155,6 +416,7 @@ class RelayControl:
         final_cool_state = desired_cool # Start with the initial intent
         
         restriction_message = "" 
+        cool_reason = REASON_DEMAND
         
         cool_settings = self.settings.get_all_compressor_protection_settings()
         DWELL_TIME_S = cool_settings["cooling_dwell_time_s"]
@@ -172,12 +434,14 @@ class RelayControl:
                 message=f"Cooling restricted by Fail-Safe for {minutes_remaining} min."
             )
             final_cool_state = False # Enforce OFF
+            cool_reason = REASON_FAIL_SAFE
 
         # B. Check Max Run Time (and activate Fail-Safe if exceeded)
         elif final_cool_state and self.cool_start_time and (current_time - self.cool_start_time) >= MAX_RUNTIME_S:
             self.cool_disabled_until = current_time + FAIL_SAFE_SHUTDOWN_S
             restriction_message = f"FAIL-SAFE active until {datetime.fromtimestamp(self.cool_disabled_until).strftime('%H:%M:%S')}"
             final_cool_state = False # Enforce OFF
+            cool_reason = REASON_FAIL_SAFE
             self.cool_start_time = None 
             self._log_restriction_change(
                 key="fail_safe_triggered",
@@ -192,6 +456,7 @@ class RelayControl:
                 demand_status = "ON" if desired_cool else "OFF"
                 restriction_message = f"Demand {demand_status}; DWELL until {datetime.fromtimestamp(current_time + dwell_remaining).strftime('%H:%M:%S')}"
                 final_cool_state = is_currently_on 
+                cool_reason = REASON_DWELL
             else:
                 if final_cool_state != is_currently_on:
                     self.last_cool_change = current_time
@@ -228,26 +493,17 @@ class RelayControl:
             # ON only if mode is Fast Crash AND monitoring (control_mode != OFF)
             aux_state = (control_mode == "Fast Crash")
             
-        # --- SAFETY GUARD: Only write to hardware if configured ---
-        if self.logic_configured:
-            self.gpio.output(self.pins["Heat"], self.RELAY_ON if final_heat_state else self.RELAY_OFF)
-            self.gpio.output(self.pins["Cool"], self.RELAY_ON if final_cool_state else self.RELAY_OFF)
-            self.gpio.output(self.pins["Fan"], self.RELAY_ON if aux_state else self.RELAY_OFF)
-        # ---------------------------------------------------------
-        
-        # --- NEW: Update Cache for UI (No hardware impact) ---
-        self.relay_state_cache["Heat"] = final_heat_state
-        self.relay_state_cache["Cool"] = final_cool_state
-        self.relay_state_cache["Fan"] = aux_state
-        # -----------------------------------------------------
-
-        # --- 4. Update SettingsManager ---
-        self.settings.set("heat_state", "HEATING" if final_heat_state else "Heating OFF")
-        self.settings.set("cool_state", "COOLING" if final_cool_state else "Cooling OFF") 
-        self.settings.set("cool_restriction_status", restriction_message) 
-        
-        # Update transient fan state for UI
-        self.settings.set("fan_state", "Aux ON" if aux_state else "Aux OFF")
+        # --- Write only the pins that change (hardware guard is inside _write_relay) ---
+        self._write_relays({
+            "Heat": (final_heat_state, REASON_DEMAND),
+            "Cool": (final_cool_state, cool_reason),
+            "Fan": (aux_state, REASON_AUX),
+        })
+        self.verify_register()
+        # -------------------------------------------------------------------------------
+
+        # --- 4. Publish Status (no-op when nothing changed) ---
+        self._publish_status(final_heat_state, final_cool_state, aux_state, restriction_message)
         
         return final_heat_state, final_cool_state
         
@@ -256,43 +512,32 @@ class RelayControl:
     def turn_on_fan(self):
         fan_mode = self.settings.get("fan_control_mode", "Auto") 
         if fan_mode in ["Auto", "ON"]:
-            # --- SAFETY GUARD ---
-            if self.logic_configured:
-                self.gpio.output(self.pins["Fan"], self.RELAY_ON)
-            self.settings.set("fan_state", "Fan ON")
+            self._write_relay("Fan", True, reason=REASON_MANUAL)
+            self._publish_status(aux_on=True)
 
     # FIXED
     def turn_off_fan(self):
-        # --- SAFETY GUARD ---
-        if self.logic_configured:
-            self.gpio.output(self.pins["Fan"], self.RELAY_OFF)
-        self.settings.set("fan_state", "Fan OFF")
+        self._write_relay("Fan", False, reason=REASON_MANUAL)
+        self._publish_status(aux_on=False)
         
     # FIXED
     def turn_off_all_relays(self, skip_aux=False): # Renamed parameter for clarity
-        # --- SAFETY GUARD ---
-        if self.logic_configured:
-            self.gpio.output(self.pins["Heat"], self.RELAY_OFF)
-            self.gpio.output(self.pins["Cool"], self.RELAY_OFF)
-            
-            if not skip_aux: 
-                self.gpio.output(self.pins["Fan"], self.RELAY_OFF)
-
-        # --- NEW: Update Cache for UI (No hardware impact) ---
-        self.relay_state_cache["Heat"] = False
-        self.relay_state_cache["Cool"] = False
-        if not skip_aux:
-            self.relay_state_cache["Fan"] = False
-        # -----------------------------------------------------
-
+        # Safety path: always drive the pins, even if the register says OFF
+        states = {"Heat": (False, REASON_SHUTDOWN), "Cool": (False, REASON_SHUTDOWN)}
         if not skip_aux: 
-            self.settings.set("fan_state", "Aux OFF")
-        
-        self.settings.set("heat_state", "Heating OFF")
-        self.settings.set("cool_state", "Cooling OFF")
+            states["Fan"] = (False, REASON_SHUTDOWN)
+        self._write_relays(states, force=True)
+
+        self._publish_status(heat_on=False, cool_on=False, aux_on=None if skip_aux else False)
         
     # --- UI UPDATE HELPERS ---
     
+    def get_runtime_summary(self):
+        """Rolling relay runtime / starts / cycle length lines from the transition journal."""
+        if not self.journal:
+            return ["Relay journal not available."]
+        return self.journal.format_summary()
+    
     def _log_restriction_change(self, key, message):
         """Logs a change in restriction state *only if* the state is new and the message is NOT DWELL."""
         
@@ -350,10 +595,13 @@ class RelayControl:
     def cleanup_gpio(self):
         """Resets all GPIO pins to safe input state. Called on app exit/crash."""
         try:
+            # Stop the watchdog first so it never writes to released pins
+            self.stop_watchdog()
             # Turn everything off logically first
             self.turn_off_all_relays()
             # Tell the kernel to release the pins (resets to INPUT mode)
             self.gpio.cleanup()
+            self._invalidate_register()
             print("[RelayControl] GPIO Cleanup complete. Pins reset to INPUT.")
         except Exception as e:
             print(f"[RelayControl] Error during GPIO cleanup: {e}")
@@ -0,0 +1,207 @@
+"""
+fermvault app
+relay_journal.py
+"""
+
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import io_accounting
+
+# --- FILE FORMAT ---
+# 8 byte header, then fixed 12 byte records:
+#   float64 timestamp | uint8 relay | uint8 state | uint8 reason | pad
+JOURNAL_MAGIC = b"FVRJ"
+JOURNAL_VERSION = 1
+HEADER = JOURNAL_MAGIC + struct.pack("<BBBB", JOURNAL_VERSION, 0, 0, 0)
+RECORD = struct.Struct("<dBBBx")
+
+RELAY_CODES = {"Heat": 0, "Cool": 1, "Fan": 2}
+RELAY_NAMES = {code: name for name, code in RELAY_CODES.items()}
+
+# Transition reasons
+REASON_DEMAND = "demand"
+REASON_DWELL = "dwell"
+REASON_FAIL_SAFE = "fail_safe"
+REASON_AUX = "aux"
+REASON_SHUTDOWN = "shutdown"
+REASON_MANUAL = "manual"
+REASON_CODES = {
+    REASON_DEMAND: 0, REASON_DWELL: 1, REASON_FAIL_SAFE: 2,
+    REASON_AUX: 3, REASON_SHUTDOWN: 4, REASON_MANUAL: 5,
+}
+REASON_NAMES = {code: name for name, code in REASON_CODES.items()}
+# --- END FILE FORMAT ---
+
+HOUR_S = 3600
+DAY_S = 24 * HOUR_S
+RETAIN_IN_MEMORY_S = 7 * DAY_S
+
+
+def read_range(path, start=None, end=None):
+    """Yields raw (timestamp, relay code, state, reason code) records with start <= timestamp < end."""
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return
+    with f:
+        if f.read(len(HEADER))[:4] != JOURNAL_MAGIC:
+            return
+        while True:
+            chunk = f.read(4096 * RECORD.size)
+            usable = len(chunk) - len(chunk) % RECORD.size
+            if not usable:
+                return
+            for record in RECORD.iter_unpack(chunk[:usable]):
+                if (start is None or record[0] >= start) and (end is None or record[0] < end):
+                    yield record
+
+
+class RelayJournal:
+    """
+    Append-only binary log of relay transitions plus rolling aggregates
+    (runtime per hour/day, starts per day, mean cycle length) computed from
+    the last week of transitions kept in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._events = deque()  # (timestamp, relay, is_on, reason)
+        self._load()
+
+    # --- FILE I/O ---
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        cutoff = time.time() - RETAIN_IN_MEMORY_S
+        try:
+            with open(self.path, "rb") as f:
+                header = f.read(len(HEADER))
+                if len(header) < len(HEADER):
+                    data = None
+                elif header[:4] != JOURNAL_MAGIC:
+                    print(f"[RelayJournal] Unknown file format in {self.path}. Ignoring history.")
+                    return
+                else:
+                    data = f.read()
+        except OSError as e:
+            print(f"[RelayJournal] Could not read journal: {e}")
+            return
+
+        # Power cut mid-write: cut the file back to whole records so later appends stay aligned
+        # (a torn header is dropped entirely; record() then starts a fresh file)
+        torn = len(header) if data is None else len(data) % RECORD.size
+        if torn:
+            try:
+                os.truncate(self.path, os.path.getsize(self.path) - torn)
+                print(f"[RelayJournal] Dropped {torn} bytes of a torn write at the end of {self.path}.")
+            except OSError as e:
+                print(f"[RelayJournal] Could not repair journal: {e}")
+        if data is None:
+            return
+
+        for ts, relay, state, reason in RECORD.iter_unpack(data[:len(data) - torn]):
+            if ts >= cutoff and relay in RELAY_NAMES:
+                self._events.append((ts, RELAY_NAMES[relay], bool(state), REASON_NAMES.get(reason, REASON_DEMAND)))
+
+    def record(self, name, is_on, timestamp=None, reason=REASON_DEMAND):
+        """Appends one transition. Signature matches RelayControl transition listeners."""
+        if name not in RELAY_CODES:
+            return
+        timestamp = timestamp if timestamp is not None else time.time()
+        if reason not in REASON_CODES:
+            reason = REASON_DEMAND
+        packed = RECORD.pack(timestamp, RELAY_CODES[name], 1 if is_on else 0, REASON_CODES[reason])
+
+        with self._lock:
+            self._events.append((timestamp, name, bool(is_on), reason))
+            while self._events and self._events[0][0] < timestamp - RETAIN_IN_MEMORY_S:
+                self._events.popleft()
+            try:
+                new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+                with io_accounting.counted_open(self.path, "ab") as f:
+                    if new_file:
+                        f.write(HEADER)
+                    f.write(packed)
+            except OSError as e:
+                print(f"[RelayJournal] Could not append transition: {e}")
+
+    def close_open_intervals(self, reason=REASON_SHUTDOWN):
+        """
+        Records an OFF for every relay whose last journaled state is ON.
+        Called at startup, when the pins have just been driven OFF after a
+        restart or crash that never logged the OFF transition.
+        """
+        last_state = {}
+        with self._lock:
+            for _ts, relay, is_on, _reason in self._events:
+                last_state[relay] = is_on
+        for relay, is_on in last_state.items():
+            if is_on:
+                self.record(relay, False, reason=reason)
+
+    # --- AGGREGATES ---
+    def get_stats(self, now=None):
+        """
+        Returns {relay: {runtime_hour_s, runtime_day_s, duty_day_pct,
+        starts_day, mean_cycle_s, is_on}} for Heat, Cool and Fan.
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            events = list(self._events)
+
+        stats = {}
+        for name in RELAY_CODES:
+            on_since = None
+            runtime_hour = 0.0
+            runtime_day = 0.0
+            starts_day = 0
+            cycles = []
+            for ts, relay, is_on, _reason in events:
+                if relay != name:
+                    continue
+                if is_on:
+                    if on_since is None:
+                        on_since = ts
+                        if ts >= now - DAY_S:
+                            starts_day += 1
+                elif on_since is not None:
+                    runtime_hour += self._overlap(on_since, ts, now - HOUR_S, now)
+                    runtime_day += self._overlap(on_since, ts, now - DAY_S, now)
+                    if ts >= now - DAY_S:
+                        cycles.append(ts - on_since)
+                    on_since = None
+            if on_since is not None:
+                runtime_hour += self._overlap(on_since, now, now - HOUR_S, now)
+                runtime_day += self._overlap(on_since, now, now - DAY_S, now)
+
+            stats[name] = {
+                "runtime_hour_s": runtime_hour,
+                "runtime_day_s": runtime_day,
+                "duty_day_pct": 100.0 * runtime_day / DAY_S,
+                "starts_day": starts_day,
+                "mean_cycle_s": (sum(cycles) / len(cycles)) if cycles else None,
+                "is_on": on_since is not None,
+            }
+        return stats
+
+    @staticmethod
+    def _overlap(start, end, window_start, window_end):
+        return max(0.0, min(end, window_end) - max(start, window_start))
+
+    def format_summary(self, now=None):
+        """Returns a list of text lines for the UI and status emails."""
+        lines = []
+        for name, s in self.get_stats(now).items():
+            label = "Aux" if name == "Fan" else name
+            cycle = f"{s['mean_cycle_s'] / 60.0:.0f} min" if s["mean_cycle_s"] is not None else "--"
+            lines.append(
+                f"{label}: {s['runtime_hour_s'] / 60.0:.0f} min/h, "
+                f"{s['runtime_day_s'] / 3600.0:.1f} h/day ({s['duty_day_pct']:.0f}%), "
+                f"{s['starts_day']} starts/day, avg cycle {cycle}"
+            )
+        return lines
@@ -0,0 +1,215 @@
+"""
+fermvault app
+relay_watchdog.py
+"""
+
+import fcntl
+import math
+import os
+import select
+import signal
+import struct
+import subprocess
+import sys
+import time
+
+# --- DEFAULTS ---
+HARDWARE_WATCHDOG_DEVICE = "/dev/watchdog"
+HARDWARE_MAX_TIMEOUT_S = 15         # bcm2835 watchdog limit
+WDIOC_SETTIMEOUT = 0xC0045706
+PARENT_EXIT_WAIT_S = 5.0            # How long the helper waits for the app to exit (and release its pins)
+# --- END DEFAULTS ---
+
+WATCHDOG_MODES = ("hardware", "process", "off")
+
+# Helper protocol: one byte per message on the helper's stdin
+_PET = b"P"
+_DISARM = b"D"
+_QUIT = b"Q"
+
+
+class RelayWatchdog:
+    """
+    Forces every relay OFF if the control loop stops petting.
+
+    mode "hardware" (default): /dev/watchdog is petted; a stall reboots the Pi
+    (the pins come back as inputs, i.e. relays off). It is closed with the
+    magic character while the control loop is intentionally idle.
+    mode "process": a separately started helper (this file run as a script,
+    sharing only a pipe with the app) is petted through that pipe. On a stall
+    it kills the app; once the app is gone, and the kernel has released its GPIO
+    lines, the helper claims the relay pins itself and drives them OFF.
+    """
+
+    def __init__(self, off_levels, mode="hardware", backend_name="auto", chip_path="/dev/gpiochip0"):
+        self.mode = mode
+        self._off_levels = list(off_levels)
+        self._backend_name = backend_name
+        self._chip_path = chip_path
+        self._timeout_s = 30.0
+        self._process = None
+        self._device = None
+
+    def start(self, timeout_s):
+        """Starts (disarmed) supervision. Returns True if the watchdog is running."""
+        self._timeout_s = float(timeout_s)
+        if self.mode == "hardware":
+            if self._timeout_s > HARDWARE_MAX_TIMEOUT_S:
+                print(f"[RelayWatchdog] {self._timeout_s:.0f} s budget exceeds the hardware limit "
+                      f"({HARDWARE_MAX_TIMEOUT_S} s).")
+                return False
+            # Opening arms the device; disarm() closes it and the next pet re-opens it
+            return self._open_hardware()
+        if self.mode != "process":
+            return False
+
+        args = [sys.executable, os.path.abspath(__file__), str(os.getpid()), str(self._timeout_s),
+                self._backend_name, self._chip_path]
+        args += [f"{pin}={level}" for pin, level in self._off_levels]
+        try:
+            # Own session: a Ctrl-C or SIGTERM aimed at the app must not take the helper with it
+            self._process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                             close_fds=True, start_new_session=True)
+        except OSError as e:
+            print(f"[RelayWatchdog] Could not start the watchdog process: {e}")
+            self._process = None
+            return False
+        print(f"[RelayWatchdog] Started (pid {self._process.pid}, timeout {self._timeout_s:.0f} s).")
+        return True
+
+    def _open_hardware(self):
+        try:
+            self._device = os.open(HARDWARE_WATCHDOG_DEVICE, os.O_WRONLY)
+        except OSError as e:
+            print(f"[RelayWatchdog] Cannot open {HARDWARE_WATCHDOG_DEVICE}: {e}")
+            self._device = None
+            return False
+        timeout = max(1, math.ceil(self._timeout_s))
+        try:
+            fcntl.ioctl(self._device, WDIOC_SETTIMEOUT, struct.pack("I", timeout))
+        except OSError as e:
+            print(f"[RelayWatchdog] Could not set hardware timeout: {e}")
+        print(f"[RelayWatchdog] Hardware watchdog armed ({timeout} s).")
+        return True
+
+    def _send(self, message):
+        try:
+            self._process.stdin.write(message)
+            self._process.stdin.flush()
+            return True
+        except (OSError, ValueError):
+            print("[RelayWatchdog] Watchdog process is gone.")
+            self._process = None
+            return False
+
+    def pet(self):
+        """
+        Called on every control tick. Cheap: one pipe or device write.
+        Returns False if supervision failed (the caller decides what replaces it).
+        """
+        if self._process is not None:
+            return self._send(_PET)
+        if self.mode == "hardware":
+            if self._device is None and not self._open_hardware():
+                return False
+            try:
+                os.write(self._device, b"\0")
+            except OSError as e:
+                print(f"[RelayWatchdog] Hardware watchdog write failed: {e}")
+                self._close_hardware()
+                return False
+            return True
+        return self.mode == "off"
+
+    def disarm(self):
+        """Stops supervision while the control loop is intentionally idle."""
+        if self._process is not None:
+            self._send(_DISARM)
+        self._close_hardware()
+
+    def _close_hardware(self):
+        if self._device is not None:
+            try:
+                os.write(self._device, b"V") # Magic close: the timer stops instead of rebooting
+            except OSError:
+                pass
+            os.close(self._device)
+            self._device = None
+
+    def stop(self):
+        if self._process is not None:
+            process, self._process = self._process, None
+            try:
+                process.stdin.write(_QUIT)
+                process.stdin.close()
+                process.wait(timeout=2.0)
+            except (OSError, ValueError, subprocess.TimeoutExpired):
+                process.kill()
+        self._close_hardware()
+
+
+# --- HELPER PROCESS ---
+def _log(message):
+    print(f"[RelayWatchdog] {message}", file=sys.stderr, flush=True)
+
+
+def _wait_for_parent_exit(parent_pid):
+    """True once the app has exited (we were re-parented), i.e. its GPIO lines are free."""
+    deadline = time.monotonic() + PARENT_EXIT_WAIT_S
+    while os.getppid() == parent_pid:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.1)
+    return True
+
+
+def _force_off(backend_name, chip_path, off_levels):
+    from gpio_backend import create_backend, OUT
+    backend = create_backend(backend_name, chip_path)
+    for pin, level in off_levels:
+        backend.setup(pin, OUT, initial=level)
+    backend.output_many(off_levels)
+    # Same as the app's own shutdown: relays OFF, then return the pins to the kernel
+    backend.cleanup()
+
+
+def _helper_main(argv):
+    parent_pid, timeout_s, backend_name, chip_path = int(argv[0]), float(argv[1]), argv[2], argv[3]
+    off_levels = [tuple(int(v) for v in item.split("=")) for item in argv[4:]]
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    deadline = None # None = disarmed
+    while True:
+        wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+        ready, _, _ = select.select([0], [], [], wait)
+        if ready:
+            data = os.read(0, 64)
+            if not data:
+                reason = "controller process exited"
+                break
+            if _QUIT in data:
+                return 0
+            deadline = time.monotonic() + timeout_s if data[-1:] == _PET else None
+        elif deadline is not None and time.monotonic() >= deadline:
+            reason = "control loop stalled"
+            try:
+                os.kill(parent_pid, signal.SIGKILL)
+            except OSError:
+                pass
+            break
+
+    if not _wait_for_parent_exit(parent_pid):
+        _log(f"{reason}, but the app still holds the relay pins. Relays NOT forced OFF.")
+        return 1
+    try:
+        _force_off(backend_name, chip_path, off_levels)
+    except Exception as e:
+        _log(f"{reason}. Failed to force relays OFF: {e}")
+        return 1
+    _log(f"{reason}: relays forced OFF.")
+    return 0
+
+
+if __name__ == "__main__":
+    # Started by RelayWatchdog(mode="process"): PARENT_PID TIMEOUT_S BACKEND CHIP PIN=LEVEL ...
+    sys.exit(_helper_main(sys.argv[1:]))
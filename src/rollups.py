@@ -0,0 +1,127 @@
+"""
+fermvault app
+rollups.py
+"""
+
+import threading
+
+# --- DEFAULTS ---
+RESOLUTIONS = (60, 900, 3600)   # 1 min, 15 min, 1 h windows (seconds)
+DEFAULT_SERIES_POINTS = 500
+# --- END DEFAULTS ---
+
+# Rolled-up metrics: (name, index in a history_db 'samples' row)
+METRICS = (("beer", 1), ("amb", 2), ("env_low", 3), ("env_high", 4), ("setpoint", 5))
+DUTY = (("heat", 7), ("cool", 8), ("aux", 9))
+STATS = ("min", "max", "mean", "last")
+
+COLUMNS = (("ts", "n") + tuple(f"{name}_{stat}" for name, _ in METRICS for stat in STATS)
+           + tuple(f"{name}_duty" for name, _ in DUTY))
+
+
+def table_name(resolution):
+    return f"rollup_{resolution}"
+
+
+def schema_sql():
+    """CREATE statements for one table per resolution (ts = window start)."""
+    value_columns = ", ".join(f"{column} REAL" for column in COLUMNS[2:])
+    return "".join(
+        f"CREATE TABLE IF NOT EXISTS {table_name(res)} (ts REAL PRIMARY KEY, n INTEGER, {value_columns});\n"
+        for res in RESOLUTIONS
+    )
+
+
+def pick_resolution(start, end, points=DEFAULT_SERIES_POINTS):
+    """The coarsest resolution that still gives at least `points` windows, or None for raw samples."""
+    span = max(0.0, end - start)
+    for res in sorted(RESOLUTIONS, reverse=True):
+        if span / res >= points:
+            return res
+    return None
+
+
+def sample_as_window(sample):
+    """A raw 'samples' row (dict) in rollup shape, so charts can treat both alike."""
+    row = {"ts": sample["ts"], "n": 1}
+    for (name, _), key in zip(METRICS, ("beer_temp", "amb_temp", "amb_min", "amb_max", "beer_setpoint")):
+        for stat in STATS:
+            row[f"{name}_{stat}"] = sample[key]
+    for name, _ in DUTY:
+        row[f"{name}_duty"] = float(sample[name] or 0)
+    return row
+
+
+class _Window:
+    __slots__ = ("start", "n", "stats", "on_counts")
+
+    def __init__(self, start):
+        self.start = start
+        self.n = 0
+        self.stats = [[None, None, 0.0, 0, None] for _ in METRICS] # min, max, sum, count, last
+        self.on_counts = [0] * len(DUTY)
+
+    def add(self, sample):
+        self.n += 1
+        for stat, (_, index) in zip(self.stats, METRICS):
+            value = sample[index]
+            if value is None:
+                continue
+            if stat[0] is None or value < stat[0]:
+                stat[0] = value
+            if stat[1] is None or value > stat[1]:
+                stat[1] = value
+            stat[2] += value
+            stat[3] += 1
+            stat[4] = value
+        for i, (_, index) in enumerate(DUTY):
+            if sample[index]:
+                self.on_counts[i] += 1
+
+    def row(self):
+        values = [self.start, self.n]
+        for low, high, total, count, last in self.stats:
+            values += [low, high, total / count if count else None, last]
+        values += [on / self.n for on in self.on_counts]
+        return tuple(values)
+
+
+class RollupAggregator:
+    """
+    Incrementally maintains min/max/mean/last (and relay duty) per window at
+    each resolution. add() is O(resolutions) per sample and returns the rows
+    to upsert: windows that just closed, plus the still-open ones via
+    open_rows(), so the tables are current after every history batch.
+    """
+
+    def __init__(self, resolutions=RESOLUTIONS):
+        self.resolutions = tuple(resolutions)
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def add(self, sample):
+        """sample: a history_db 'samples' row tuple. Returns [(table, row)] for closed windows."""
+        closed = []
+        ts = sample[0]
+        with self._lock:
+            for res in self.resolutions:
+                start = ts - ts % res
+                window = self._open.get(res)
+                if window is not None and window.start != start:
+                    if start < window.start:
+                        continue # Clock stepped back: keep the raw sample, skip the rollup
+                    closed.append((table_name(res), window.row()))
+                    window = None
+                if window is None:
+                    window = self._open[res] = _Window(start)
+                window.add(sample)
+        return closed
+
+    def open_rows(self):
+        with self._lock:
+            return [(table_name(res), window.row()) for res, window in self._open.items() if window.n]
+
+    def restore(self, samples):
+        """Rebuilds the open windows after a restart from the samples they cover."""
+        for sample in samples:
+            self.add(sample)
@@ -0,0 +1,49 @@
+"""
+fermvault app
+runtime_state.py
+"""
+
+import threading
+from types import MappingProxyType
+
+
+class RuntimeState:
+    """
+    In-memory store for live values (temperatures, setpoints in use, status
+    messages). Never persisted.
+
+    Copy-on-write: writers build a new dict and swap the reference, so reads
+    and snapshots take no lock and can never block behind a writer or a
+    settings save. Writers are serialised by a small lock of their own.
+    """
+
+    def __init__(self, defaults):
+        self._state = dict(defaults)
+        self._write_lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._state
+
+    def get(self, key, default=None):
+        return self._state.get(key, default)
+
+    def set(self, key, value):
+        """Returns True if the value changed."""
+        with self._write_lock:
+            if key in self._state and self._state[key] == value:
+                return False # Unchanged: keep the current dict
+            new_state = dict(self._state)
+            new_state[key] = value
+            self._state = new_state
+            return True
+
+    def update(self, values):
+        """Applies several values as one atomic swap."""
+        with self._write_lock:
+            new_state = dict(self._state)
+            new_state.update(values)
+            self._state = new_state
+
+    def snapshot(self):
+        """Consistent read-only view of every value at one instant."""
+        return MappingProxyType(self._state)
@@ -0,0 +1,344 @@
+"""
+fermvault app
+sessions.py
+"""
+
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import tarfile
+import threading
+import time
+
+import export
+import history_db
+import io_accounting
+import relay_journal
+import telemetry_store
+from log_rotation import read_csv_range
+from pid_logger import FIELDNAMES as PID_CSV_FIELDNAMES
+
+# --- DEFAULTS ---
+SESSIONS_DIR_NAME = "sessions"
+SESSION_INDEX_NAME = "index.json"
+SESSION_NO_MAX = 65535 # Telemetry stores the session number as uint16; 0 = no session
+# --- END DEFAULTS ---
+
+# Never copied into a bundle (bundles are meant to be handed around)
+SECRET_KEYS = ("server_password", "rpi_email_password", "api_key")
+
+# Archive members from the history DB: (member name, table, selection)
+#   "time": rows inside the session's time range
+#   "session+time": ...that are also tagged with its session_id
+#   "session": all rows tagged with its session_id (gravity readings carry the
+#              API's reading time, which can predate the session on this device)
+ARCHIVE_TABLES = (
+    ("samples.csv", "samples", "session+time"),
+    ("relay_events.csv", "relay_events", "session+time"),
+    ("gravity.csv", "gravity", "session"),
+    ("fg_results.csv", "fg_results", "time"),
+    ("system_log.csv", "system_log", "time"),
+)
+
+STATUS_ACTIVE = "active"
+STATUS_ARCHIVING = "archiving"
+STATUS_ARCHIVED = "archived"
+STATUS_FAILED = "failed"
+
+
+class SessionManager:
+    """
+    Tracks brew session lifecycle from current_brew_session_id.
+
+    Selecting a session starts it: it gets a local session number, and the
+    PID logger (telemetry schema 2) and history DB tag every new record with
+    it. Selecting another session (or end_session()) closes it and packs
+    its data into sessions/<no>_<title>.tar.gz on a background thread.
+    sessions/index.json lists every session without opening any log.
+    """
+
+    def __init__(self, settings_manager, history=None, pid_logger=None, relay_journal_path=None):
+        self.settings_manager = settings_manager
+        self.data_dir = settings_manager.data_dir
+        self.sessions_dir = os.path.join(self.data_dir, SESSIONS_DIR_NAME)
+        self.index_path = os.path.join(self.sessions_dir, SESSION_INDEX_NAME)
+        self.history = history
+        self.pid_logger = pid_logger
+        self.relay_journal_path = relay_journal_path or os.path.join(self.data_dir, "relay_journal.bin")
+        self.logger = print
+        self._lock = threading.Lock()
+        self._index = load_index(self.index_path)
+        self._current = None
+
+        self._resume(settings_manager.get("current_brew_session_id"))
+        for entry in self._index:
+            if entry["status"] == STATUS_ARCHIVING:
+                self._close(entry) # Interrupted by a restart
+        settings_manager.subscribe(self._on_session_changed, keys=("current_brew_session_id",))
+
+    # --- LIFECYCLE ---
+    def _resume(self, session_id):
+        with self._lock:
+            stale = [e for e in self._index if e["status"] == STATUS_ACTIVE and e["session_id"] != session_id]
+            current = next((e for e in self._index if e["status"] == STATUS_ACTIVE and e["session_id"] == session_id), None)
+        for entry in stale:
+            self._close(entry)
+        if current is not None:
+            self._set_current(current)
+        elif session_id:
+            self.start(session_id)
+
+    def _on_session_changed(self, changes):
+        session_id = changes["current_brew_session_id"]
+        if self._current is not None and self._current["session_id"] == session_id:
+            return
+        self.end_session()
+        if session_id:
+            self.start(session_id)
+
+    def start(self, session_id, title=None):
+        with self._lock:
+            entry = {
+                "session_no": self._next_session_no(),
+                "session_id": session_id,
+                "title": title or self.settings_manager.get("brew_session_title", "") or str(session_id),
+                "started": time.time(),
+                "ended": None,
+                "status": STATUS_ACTIVE,
+                "archive": None,
+                "bytes": 0,
+            }
+            self._index.append(entry)
+            self._save_index()
+        self._set_current(entry)
+        self.logger(f"Session started: {entry['title']} (#{entry['session_no']})")
+        return entry
+
+    def _next_session_no(self):
+        """The number after the newest session's, skipping numbers still in the index. Caller holds self._lock."""
+        used = {e["session_no"] for e in self._index}
+        session_no = self._index[-1]["session_no"] if self._index else 0
+        for _ in range(SESSION_NO_MAX):
+            session_no = session_no % SESSION_NO_MAX + 1
+            if session_no not in used:
+                return session_no
+        raise RuntimeError("all session numbers are in use")
+
+    def end_session(self):
+        """Closes the current session (if any) and archives it in the background."""
+        entry = self._current
+        if entry is None:
+            return None
+        self._set_current(None)
+        self._close(entry)
+        return entry
+
+    def _set_current(self, entry):
+        self._current = entry
+        if self.pid_logger is not None:
+            self.pid_logger.session_no = entry["session_no"] if entry else 0
+        if self.history is not None:
+            self.history.session_id = entry["session_id"] if entry else None
+
+    def _close(self, entry):
+        with self._lock:
+            entry["ended"] = entry["ended"] or time.time()
+            entry["status"] = STATUS_ARCHIVING
+            self._save_index()
+        threading.Thread(target=self._archive, args=(entry,), daemon=True, name="session-archive").start()
+
+    @property
+    def current(self):
+        return self._current
+
+    def list_sessions(self):
+        """Index entries, newest first."""
+        with self._lock:
+            return [dict(e) for e in reversed(self._index)]
+
+    def archive_path(self, session_no):
+        with self._lock:
+            for entry in reversed(self._index): # Newest first (indexes from older versions may repeat numbers)
+                if entry["session_no"] == session_no and entry["archive"]:
+                    return os.path.join(self.sessions_dir, entry["archive"])
+        return None
+
+    # --- ARCHIVING (background thread) ---
+    def _archive(self, entry):
+        # Rows still queued in the writers belong in the archive
+        if self.pid_logger is not None:
+            self.pid_logger.flush()
+        if self.history is not None:
+            self.history.flush()
+        try:
+            name, size = self._write_archive(entry)
+        except Exception as e:
+            self.logger(f"Session archive failed for {entry['title']}: {e}")
+            with self._lock:
+                entry["status"] = STATUS_FAILED
+                self._save_index()
+            return
+        with self._lock:
+            entry["status"], entry["archive"], entry["bytes"] = STATUS_ARCHIVED, name, size
+            self._save_index()
+        self.logger(f"Session archived: {entry['title']} -> {SESSIONS_DIR_NAME}/{name}")
+
+    def _write_archive(self, entry):
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        safe_title = re.sub(r"[^A-Za-z0-9_-]+", "_", entry["title"]).strip("_")[:40] or "session"
+        name = f"{entry['session_no']:04d}_{safe_title}.tar.gz"
+        staging = os.path.join(self.sessions_dir, f".staging_{entry['session_no']}")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        try:
+            members = self._stage_members(entry, staging)
+            tmp_path = os.path.join(self.sessions_dir, name + ".part")
+            with io_accounting.counted_open(tmp_path, "wb") as raw, tarfile.open(fileobj=raw, mode="w:gz") as tar:
+                for member in members:
+                    tar.add(os.path.join(staging, member), arcname=member)
+            os.replace(tmp_path, os.path.join(self.sessions_dir, name))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return name, os.path.getsize(os.path.join(self.sessions_dir, name))
+
+    def _stage_members(self, entry, staging):
+        """Writes each archive member to the staging dir by streaming; returns member names."""
+        start, end = int(entry["started"]), entry["ended"] + 1 # Telemetry and CSV logs store whole seconds
+        counts = {}
+
+        # Telemetry: this session's records only (schema 2 session number)
+        with io_accounting.counted_open(os.path.join(staging, "telemetry.bin"), "wb") as f:
+            f.write(telemetry_store.HEADER.pack(telemetry_store.TELEMETRY_MAGIC, telemetry_store.TELEMETRY_VERSION,
+                                                telemetry_store.RECORD.size, int(start), 0))
+            count = 0
+            for record in telemetry_store.read_range(os.path.join(self.data_dir, "pid_log.bin"), start, end):
+                if record[-1] == entry["session_no"]:
+                    f.write(telemetry_store.RECORD.pack(*record))
+                    count += 1
+            counts["telemetry.bin"] = count
+
+        # CSV PID log (pid_log_format "csv" has no session column): rows in the session's time range
+        csv_path = os.path.join(self.data_dir, "pid_log.csv")
+        if os.path.exists(csv_path) or os.path.exists(csv_path + ".segments.json"):
+            with io_accounting.counted_open(os.path.join(staging, "pid_log.csv"), "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(PID_CSV_FIELDNAMES)
+                count = 0
+                for row in read_csv_range(csv_path, start, end):
+                    writer.writerow(row)
+                    count += 1
+                counts["pid_log.csv"] = count
+        if not counts["telemetry.bin"] and not counts.get("pid_log.csv"):
+            self.logger(f"Session archive for {entry['title']}: no PID log data in the session (is PID logging enabled?).")
+
+        # Relay journal slice (same file format as relay_journal.bin)
+        with io_accounting.counted_open(os.path.join(staging, "relay_journal.bin"), "wb") as f:
+            f.write(relay_journal.HEADER)
+            count = 0
+            for record in relay_journal.read_range(self.relay_journal_path, start, end):
+                f.write(relay_journal.RECORD.pack(*record))
+                count += 1
+            counts["relay_journal.bin"] = count
+
+        # History tables (gravity readings, FG results, samples, ...)
+        if os.path.exists(os.path.join(self.data_dir, history_db.HISTORY_DB_NAME)):
+            for member, table, selection in ARCHIVE_TABLES:
+                if selection == "session":
+                    columns, rows = export.open_source(table, data_dir=self.data_dir)
+                else:
+                    columns, rows = export.open_source(table, start, end, self.data_dir)
+                if selection != "time":
+                    column = [c for c, _ in columns].index("session_id")
+                    rows = (row for row in rows if row[column] == entry["session_id"])
+                with io_accounting.counted_open(os.path.join(staging, member), "w", newline="", encoding="utf-8") as f:
+                    counts[member] = export.write_csv(rows, columns, f)
+
+        with io_accounting.counted_open(os.path.join(staging, "settings.json"), "w") as f:
+            json.dump(_redact(self.settings_manager.settings), f, indent=2, default=str)
+
+        manifest = dict(entry, status=STATUS_ARCHIVED, rows=counts, created=time.time())
+        with io_accounting.counted_open(os.path.join(staging, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+        return ["manifest.json", "settings.json"] + list(counts)
+
+    def _save_index(self):
+        """Caller holds self._lock."""
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with io_accounting.counted_open(tmp_path, "w") as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+
+def _redact(value):
+    if isinstance(value, dict):
+        return {k: "" if k in SECRET_KEYS else _redact(v) for k, v in value.items()}
+    return value
+
+
+def load_index(index_path):
+    try:
+        with open(index_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+class SessionArchive:
+    """Read access to one session bundle without unpacking it."""
+
+    def __init__(self, path):
+        self.path = path
+        self._tar = tarfile.open(path, "r:gz")
+        self.manifest = json.loads(self.read("manifest.json"))
+
+    def members(self):
+        return self._tar.getnames()
+
+    def read(self, member):
+        return self._tar.extractfile(member).read()
+
+    def open_text(self, member):
+        return io.TextIOWrapper(self._tar.extractfile(member), encoding="utf-8", newline="")
+
+    def telemetry_records(self):
+        """Streams the session's telemetry records (telemetry_store.FIELDS order)."""
+        return telemetry_store.stream_records(self._tar.extractfile("telemetry.bin"), self.path)
+
+    def close(self):
+        self._tar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    # python3 sessions.py list | python3 sessions.py extract SESSION_NO DEST_DIR
+    sessions_dir = os.path.join(export.DEFAULT_DATA_DIR, SESSIONS_DIR_NAME)
+    if len(sys.argv) >= 2 and sys.argv[1] == "list":
+        for entry in reversed(load_index(os.path.join(sessions_dir, SESSION_INDEX_NAME))):
+            ended = time.strftime("%Y-%m-%d", time.localtime(entry["ended"])) if entry["ended"] else "now"
+            print(f"#{entry['session_no']:<4} {time.strftime('%Y-%m-%d', time.localtime(entry['started']))} - {ended:<10} "
+                  f"{entry['status']:<9} {entry['title']}  {entry['archive'] or ''}")
+    elif len(sys.argv) == 4 and sys.argv[1] == "extract":
+        matches = [e for e in load_index(os.path.join(sessions_dir, SESSION_INDEX_NAME))
+                   if e["session_no"] == int(sys.argv[2]) and e["archive"]]
+        if not matches:
+            print(f"No archive for session {sys.argv[2]}.")
+            sys.exit(1)
+        with tarfile.open(os.path.join(sessions_dir, matches[-1]["archive"]), "r:gz") as tar:
+            if hasattr(tarfile, "data_filter"):
+                tar.extractall(sys.argv[3], filter="data")
+            else:
+                tar.extractall(sys.argv[3])
+        print(f"Extracted {matches[-1]['archive']} to {sys.argv[3]}.")
+    else:
+        print("usage: sessions.py list | sessions.py extract SESSION_NO DEST_DIR")
+        sys.exit(2)
@@ -13,11 +13,48 @@ import hashlib
 from datetime import datetime, timedelta
 from pathlib import Path
 import threading 
+from runtime_state import RuntimeState
+import io_accounting
 
 # --- MODIFIED: Use the filename from our plan ---
 SETTINGS_FILE = "fermvault_settings.json"
 # --- MODIFIED: Removed BREW_SESSIONS_FILE (it's saved in the main settings) ---
 
+# Runtime values updated by the monitor loop. They live in a separate
+# RuntimeState store (runtime_state.py), never in the persisted categories.
+TRANSIENT_DEFAULTS = {
+    "beer_temp_actual": "--.-",
+    "amb_temp_actual": "--.-",
+    "beer_temp_timestamp": "--:--:--",
+    "amb_temp_timestamp": "--:--:--",
+    "og_timestamp_var": "--:--:--",
+    "sg_timestamp_var": "--:--:--",
+    
+    "amb_min_setpoint": 0.0,
+    "amb_max_setpoint": 0.0,
+    "beer_setpoint_current": 0.0,
+    "amb_target_setpoint": 0.0,
+    
+    # Relay states are published by RelayControl.status (RelayStatus), not stored here
+    "sensor_error_message": "",
+    
+    "cooling_delay_message": "init", 
+    "monitoring_state": "OFF",
+    
+    "og_display_var": "-.---",
+    "sg_display_var": "-.---",
+    
+    "fg_status_var": "", 
+    "fg_value_var": "-.---",
+    
+    "beer_eta_message": "",
+}
+TRANSIENT_KEYS = frozenset(TRANSIENT_DEFAULTS)
+
+RUNTIME_CATEGORY = "runtime" # Category name used by subscribe() for TRANSIENT_KEYS
+SAVE_COALESCE_S = 1.0 # Persistent changes within this window are written to disk once
+CHECKSUM_KEY = "_checksum" # Embedded in the file; SHA-256 of the canonical JSON of everything else
+
 # --- CONTROL MODE DEFAULTS ---
 DEFAULT_CONTROL_MODE = "Beer Hold"
 DEFAULT_AMBIENT_HOLD_F = 68.0
@@ -28,6 +65,35 @@ DEFAULT_FAST_CRASH_HOLD_F = 34.0
 # --- END CONTROL MODE DEFAULTS ---
 
 
+class SettingsTransaction:
+    """
+    Collects changes across categories and applies them in one step when the
+    with-block exits: everything is validated first (nothing is applied if any
+    change is invalid), then applied under one lock, persisted once and
+    announced to subscribers in a single notification.
+    """
+
+    def __init__(self, manager):
+        self._manager = manager
+        self._values = {}      # key -> value (key must already exist)
+        self._categories = {}  # category -> {key: value} (new keys allowed, like the save_* helpers)
+        self.changes = {}      # What actually changed, filled in on commit
+
+    def set(self, key, value):
+        self._values[key] = value
+
+    def update_category(self, category_name, values):
+        self._categories.setdefault(category_name, {}).update(values)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.changes = self._manager._apply_transaction(self._values, self._categories)
+        return False
+
+
 class SettingsManager:
     
     # --- DEFAULT STRUCTURES ---
@@ -80,6 +146,12 @@ class SettingsManager:
             "pid_logging_enabled": False,       # High-freq PID data
             "system_logging_enabled": False,    # Audit/Action text log
             # --------------------------------------------
+            "io_write_budget_mb_day": 0.0,      # SD-card write budget for the diagnostics warning (0 = off)
+            "pid_log_format": "binary",         # "binary" (pid_log.bin, see telemetry_store) or "csv"
+            "log_rotate_max_mb": 5.0,           # Rotate pid/system logs at this size (0 = no size limit)
+            "log_rotate_max_age_h": 24.0,       # ...or when the current segment is this old (0 = no age limit)
+            "log_retention_days": 90,           # Delete rotated segments older than this (0 = keep forever)
+            "log_compression": "gzip",          # Compression of rotated segments: "gzip", "zstd" or "none"
             
             "pid_kp": 2.0,
             "pid_ki": 0.03,
@@ -93,39 +165,31 @@ class SettingsManager:
             "ramp_pid_landing_zone": 0.5,
             "crash_pid_envelope_width": 2.0,
             
-            "show_eula_on_launch": True,
-            "eula_agreed": False, 
-            
-            # Transient Keys
-            "beer_temp_actual": "--.-",
-            "amb_temp_actual": "--.-",
-            "beer_temp_timestamp": "--:--:--",
-            "amb_temp_timestamp": "--:--:--",
-            "og_timestamp_var": "--:--:--",
-            "sg_timestamp_var": "--:--:--",
-            
-            "amb_min_setpoint": 0.0,
-            "amb_max_setpoint": 0.0,
-            "beer_setpoint_current": 0.0,
-            "amb_target_setpoint": 0.0,
+            # --- NEW: Beer Probe Loss Estimator ---
+            "beer_estimator_enabled": True,
+            "beer_estimator_max_age_s": 14400,          # 4 hours of blind control max
+            "beer_estimator_max_sigma_f": 2.0,          # Give up once +/- 2F uncertain
+            "beer_estimator_hydrometer_sigma_f": 1.0,   # Trust in hydrometer temperature
+            # --------------------------------------
             
-            "heat_state": "Heating OFF",
-            "cool_state": "Cooling OFF",
+            "ramp_lag_warning_f": 1.0, # Warn when beer trails the ramp target by this much
             
-            "cool_restriction_status": "",
-            "sensor_error_message": "",
+            # --- NEW: GPIO backend ("auto", "rpi", "gpiod" or "mock") ---
+            "gpio_backend": "auto",
+            "gpio_chip": "/dev/gpiochip0",
+            # -------------------------------------------------------------
             
-            "cooling_delay_message": "init", 
-            "monitoring_state": "OFF",
+            # --- NEW: Relay watchdog ("hardware", "process" or "off") ---
+            "watchdog_mode": "hardware", # Falls back to "process" when /dev/watchdog is not accessible
+            "watchdog_missed_ticks": 2, # Control ticks without a pet before relays are forced OFF (fits the 15 s hardware limit)
+            # -------------------------------------------------------------
             
-            "og_display_var": "-.---",
-            "sg_display_var": "-.---",
+            "show_eula_on_launch": True,
+            "eula_agreed": False, 
             
-            "fg_status_var": "", 
-            "fg_value_var": "-.---",
+            # (Transient keys live in TRANSIENT_DEFAULTS / self.runtime)
             
             "aux_relay_mode": "MONITORING",
-            "fan_state": "Fan OFF", 
         }
             
     def _get_default_compressor_protection_settings(self):
@@ -214,33 +278,49 @@ class SettingsManager:
         # --- MODIFICATION: Set the settings file path to be *inside* the data_dir ---
         self.settings_file = settings_file_path or os.path.join(self.data_dir, SETTINGS_FILE)
         # --- END MODIFICATIONS ---
+        self.backup_file = self.settings_file + ".bak" # Last-known-good generation
         
         self.settings = {}
         self._data_lock = threading.RLock()
+        self._key_index = {} # key -> category name (first category that holds the key)
+        
+        # --- NEW: Live values, separate from the persisted configuration ---
+        self.runtime = RuntimeState(TRANSIENT_DEFAULTS)
+        
+        # --- NEW: Change subscribers (tuple, replaced on (un)subscribe) ---
+        self._subscribers = ()
         
         self.brew_sessions = [""] * 10
         
         self.was_controlled_shutdown = False
+        
+        # --- NEW: Coalescing persistence writer ---
+        self._dirty = False
+        self._io_lock = threading.Lock() # Serialises file writes (writer thread vs flush())
+        self._save_requested = threading.Event()
+        self._writer_thread = threading.Thread(target=self._persistence_loop, name="SettingsWriter", daemon=True)
+        # ------------------------------------------
 
         # Load all settings
         self._load_settings()
+        self._writer_thread.start()
 
 
     # FIXED
     def _load_settings(self):
         try:
             with self._data_lock:
-                # 1. Check if the file exists in the desired new location
-                if not os.path.exists(self.settings_file):
+                # 1. Check if the file (or its last-known-good copy) exists in the desired new location
+                if not os.path.exists(self.settings_file) and not os.path.exists(self.backup_file):
                     # 2. If not, create the entire directory structure *before* writing
                     os.makedirs(self.data_dir, exist_ok=True) 
 
                     print(f"[SettingsManager] No settings file found at {self.settings_file}. Creating new one with defaults.")
                     self.settings = self._get_default_settings()
-                    self._save_all_settings() # This performs the first write to the correct path
+                    self._save_all_settings()
+                    self.flush() # This performs the first write to the correct path
                 else:
-                    with open(self.settings_file, 'r') as f:
-                        self.settings = json.load(f)
+                    self.settings = self._read_first_valid_generation()
                     
                     # --- FIX: Ensure all default categories exist ---
                     default_settings = self._get_default_settings()
@@ -259,6 +339,10 @@ class SettingsManager:
                                     if sub_key == "relay_logic_configured":
                                         print("[SettingsManager] Migrating legacy user: Defaulting to Active Low logic.")
                                         self.settings[key][sub_key] = True # Force 'Configured' to skip wizard
+                                    elif sub_key == "pid_log_format":
+                                        # Older versions wrote pid_log.csv; keep writing it (binary is for new installs)
+                                        print("[SettingsManager] Migrating legacy user: Keeping the CSV PID log format.")
+                                        self.settings[key][sub_key] = "csv"
                                     else:
                                         # For all other missing keys (including relay_active_high), use the default.
                                         # Default for relay_active_high is False (Active Low), which is correct.
@@ -269,6 +353,14 @@ class SettingsManager:
                 self.brew_sessions = self.settings['system_settings'].get('brew_sessions_list', [""] * 10)
                 # --- MODIFICATION END ---
                 
+                # Files written by older versions still carry runtime values; drop them
+                for category_data in self.settings.values():
+                    if isinstance(category_data, dict):
+                        for key in TRANSIENT_KEYS.intersection(category_data):
+                            del category_data[key]
+                
+                self._rebuild_key_index()
+                
                 # --- MODIFICATION: Capture shutdown state *before* resetting it ---
                 # 1. Read the value that was loaded from the JSON file
                 self.was_controlled_shutdown = self.settings.get('system_settings', {}).get('controlled_shutdown', False)
@@ -278,7 +370,8 @@ class SettingsManager:
 
         except Exception as e:
             # --- MODIFICATION: Updated error message ---
-            print(f"[ERROR] Critical error loading {self.settings_file}; default settings loaded")
+            print(f"[ERROR] Critical error loading {self.settings_file} ({e}); default settings loaded")
+            self._quarantine(self.settings_file)
             # --- END MODIFICATION ---
             self.settings = self._get_default_settings()
             # --- MODIFICATION START: Load default brew sessions ---
@@ -288,18 +381,146 @@ class SettingsManager:
             self.was_controlled_shutdown = False
             self.settings['system_settings']['controlled_shutdown'] = False
             # --- END MODIFICATION ---
+            self._rebuild_key_index()
 
-    def _save_all_settings(self):
+    # --- CRASH-CONSISTENT STORAGE ---
+    @staticmethod
+    def _checksum(settings):
+        canonical = json.dumps(settings, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _read_verified(self, path):
+        """Returns the settings dict from path, or None if missing, unparsable or failing its checksum."""
         try:
-            with self._data_lock:
-                # --- MODIFICATION: File path is now correct from __init__ ---
-                with open(self.settings_file, 'w') as f:
-                    json.dump(self.settings, f, indent=4)
-            # --- MODIFICATION START: Remove comment ---
-            # (Brew sessions are now saved with all settings)
-            # --- MODIFICATION END ---
-        except Exception as e:
-            print(f"[ERROR] Failed to save settings to {self.settings_file}: {e}")
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict):
+            return None
+        stored = data.pop(CHECKSUM_KEY, None)
+        # Files written before checksums were added are accepted as-is
+        if stored is not None and stored != self._checksum(data):
+            print(f"[SettingsManager] Checksum mismatch in {path}.")
+            return None
+        return data
+
+    def _read_first_valid_generation(self):
+        settings = self._read_verified(self.settings_file)
+        if settings is not None:
+            return settings
+        settings = self._read_verified(self.backup_file)
+        if settings is None:
+            raise ValueError("settings file and backup are both missing or damaged")
+        print(f"[SettingsManager] {self.settings_file} is damaged or missing. Recovered last-known-good copy.")
+        self._quarantine(self.settings_file)
+        self._dirty = True # Rewrite a good primary file on the first save
+        return settings
+
+    def _quarantine(self, path):
+        """Keeps a damaged file for inspection instead of letting the next save overwrite it."""
+        if os.path.exists(path):
+            try:
+                os.replace(path, f"{path}.corrupt-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+            except OSError as e:
+                print(f"[SettingsManager] Could not quarantine {path}: {e}")
+
+    def _atomic_write(self, payload):
+        """
+        tmp file + fsync, current file -> .bak, tmp -> current, fsync the directory.
+        A power cut at any point leaves either the new file or the previous
+        good one (as the primary or .bak) on disk.
+        """
+        tmp_path = self.settings_file + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(payload)
+            f.flush()
+            io_accounting.fsync(f, self.settings_file)
+        if os.path.exists(self.settings_file):
+            os.replace(self.settings_file, self.backup_file)
+        os.replace(tmp_path, self.settings_file)
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.settings_file)), os.O_RDONLY)
+        try:
+            io_accounting.fsync(dir_fd, self.settings_file)
+        finally:
+            os.close(dir_fd)
+        io_accounting.record_write(self.settings_file, len(payload.encode('utf-8')))
+
+    def _rebuild_key_index(self):
+        """Maps every key to the first category holding it (same result as the old linear scan)."""
+        with self._data_lock:
+            index = {}
+            for category_name, category_data in self.settings.items():
+                if isinstance(category_data, dict):
+                    for key in category_data:
+                        index.setdefault(key, category_name)
+            self._key_index = index
+
+    def _find_category(self, key):
+        """
+        O(1) lookup of the category dict holding key (caller holds the lock).
+        Falls back to a scan if the index is stale (e.g. a category dict was
+        replaced from outside) and repairs the entry.
+        """
+        category_name = self._key_index.get(key)
+        if category_name is not None:
+            category_data = self.settings.get(category_name)
+            if isinstance(category_data, dict) and key in category_data:
+                return category_data
+
+        for category_name, category_data in self.settings.items():
+            if isinstance(category_data, dict) and key in category_data:
+                self._key_index[key] = category_name
+                return category_data
+        return None
+
+    def _save_all_settings(self):
+        """
+        Marks the settings dirty. The writer thread persists them once the
+        coalescing window has passed, so a burst of set() calls costs one write.
+        Use flush() where the data must be on disk before continuing.
+        """
+        with self._data_lock:
+            self._dirty = True
+        self._save_requested.set()
+
+    def _persistence_loop(self):
+        while True:
+            self._save_requested.wait()
+            time.sleep(SAVE_COALESCE_S) # Let the rest of the burst arrive
+            self._save_requested.clear()
+            self._write_if_dirty()
+
+    def _snapshot_if_dirty(self):
+        """Shallow-copies the settings tree under the lock (cheap) and clears the dirty flag."""
+        with self._data_lock:
+            if not self._dirty:
+                return None
+            self._dirty = False
+            return {
+                name: ({k: (list(v) if isinstance(v, list) else v) for k, v in data.items()}
+                       if isinstance(data, dict) else data)
+                for name, data in self.settings.items()
+            }
+
+    def _write_if_dirty(self):
+        with self._io_lock:
+            snapshot = self._snapshot_if_dirty()
+            if snapshot is None:
+                return
+            try:
+                # Serialisation and disk I/O happen outside the data lock
+                snapshot[CHECKSUM_KEY] = self._checksum(snapshot)
+                payload = json.dumps(snapshot, separators=(",", ":"))
+                self._atomic_write(payload)
+            except Exception as e:
+                with self._data_lock:
+                    self._dirty = True # Retry on the next save request / flush
+                print(f"[ERROR] Failed to save settings to {self.settings_file}: {e}")
+
+    def flush(self):
+        """Writes pending changes to disk now (shutdown, controlled exit)."""
+        self._write_if_dirty()
 
     # ... (rest of the file is unchanged and correct) ...
     
@@ -338,11 +559,144 @@ class SettingsManager:
         # --- MODIFICATION: Call _get_default_settings() directly ---
         self.settings = self._get_default_settings()
         # --- END MODIFICATION ---
+        self._rebuild_key_index()
         self.brew_sessions = self._get_default_brew_session_settings()
         self._save_all_settings()
         self.save_brew_sessions(self.brew_sessions)
         print("SettingsManager: All settings reset to defaults.")
 
+    # --- CHANGE SUBSCRIPTIONS ---
+    def subscribe(self, callback, keys=None, category=None, executor=None):
+        """
+        Calls callback(changes) with a {key: new_value} dict whenever a matching
+        key changes. keys: iterable of keys; category: e.g. "notification_settings"
+        or "runtime" (no filter = everything).
+        executor decides where the callback runs: None = the thread that made
+        the change; an object with .submit() (ThreadPoolExecutor); or a
+        callable executor(callback, changes), e.g. to hop onto the UI thread.
+        Returns a token for unsubscribe().
+        """
+        token = (callback, frozenset(keys) if keys is not None else None, category, executor)
+        with self._data_lock:
+            self._subscribers = self._subscribers + (token,)
+        return token
+
+    def unsubscribe(self, token):
+        with self._data_lock:
+            self._subscribers = tuple(sub for sub in self._subscribers if sub is not token)
+
+    def _category_of(self, key):
+        if key in TRANSIENT_KEYS:
+            return RUNTIME_CATEGORY
+        return self._key_index.get(key)
+
+    def _notify(self, changes):
+        """Delivers changes to matching subscribers. Never called with the data lock held."""
+        subscribers = self._subscribers
+        if not subscribers or not changes:
+            return
+        for callback, keys, category, executor in subscribers:
+            matched = {
+                key: value for key, value in changes.items()
+                if (keys is None or key in keys) and (category is None or self._category_of(key) == category)
+            }
+            if not matched:
+                continue
+            try:
+                if executor is None:
+                    callback(matched)
+                elif hasattr(executor, "submit"):
+                    executor.submit(callback, matched)
+                else:
+                    executor(callback, matched)
+            except Exception as e:
+                print(f"[SettingsManager] Subscriber error: {e}")
+
+    def _update_category(self, category_name, new_settings):
+        """Updates one category under the lock, persists, and notifies the keys that changed."""
+        with self._data_lock:
+            category_data = self.settings[category_name]
+            changes = {k: v for k, v in new_settings.items() if category_data.get(k) != v or k not in category_data}
+            category_data.update(new_settings)
+            if any(k not in self._key_index for k in new_settings):
+                self._rebuild_key_index()
+            self._save_all_settings()
+        self._notify(changes)
+
+    # --- TRANSACTIONS ---
+    def transaction(self):
+        """
+        with settings_manager.transaction() as txn:
+            txn.set("frequency_hours", 4)
+            txn.update_category("smtp_settings", {...})
+        Raises ValueError on exit (and applies nothing) if any change is invalid.
+        """
+        return SettingsTransaction(self)
+
+    def _apply_transaction(self, values, categories):
+        runtime_values = {k: v for k, v in values.items() if k in TRANSIENT_KEYS}
+        with self._data_lock:
+            # 1. Validate everything before touching anything
+            errors = []
+            for category_name, category_values in categories.items():
+                if not isinstance(self.settings.get(category_name), dict):
+                    errors.append(f"unknown category '{category_name}'")
+                    continue
+                for key, value in category_values.items():
+                    errors.extend(self._validate_value(key, value))
+            for key, value in values.items():
+                if key in runtime_values:
+                    continue
+                if self._find_category(key) is None:
+                    errors.append(f"unknown setting '{key}'")
+                else:
+                    errors.extend(self._validate_value(key, value))
+            if errors:
+                raise ValueError("; ".join(errors))
+
+            # 2. Apply
+            changes = {}
+            new_keys = False
+            for category_name, category_values in categories.items():
+                category_data = self.settings[category_name]
+                for key, value in category_values.items():
+                    if key not in category_data:
+                        new_keys = True
+                    elif category_data[key] == value:
+                        continue
+                    category_data[key] = value
+                    changes[key] = value
+            if new_keys:
+                self._rebuild_key_index()
+            for key, value in values.items():
+                if key in runtime_values:
+                    continue
+                category_data = self.settings[self._key_index[key]]
+                if category_data[key] != value:
+                    category_data[key] = value
+                    changes[key] = value
+
+            # 3. Persist once
+            if changes:
+                self._save_all_settings()
+
+        runtime_changes = {k: v for k, v in runtime_values.items() if self.runtime.get(k) != v}
+        if runtime_changes:
+            self.runtime.update(runtime_changes)
+            changes.update(runtime_changes)
+
+        # 4. Notify once
+        self._notify(changes)
+        return changes
+
+    @staticmethod
+    def _validate_value(key, value):
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            return [f"'{key}' has a value that cannot be saved ({type(value).__name__})"]
+        return []
+
     # --- GENERAL SETTERS/GETTERS ---
     
     # --- MODIFICATION: Add new getter ---
@@ -353,48 +707,46 @@ class SettingsManager:
     
     def get(self, key, default=None):
         # A simplified getter that flattens the nested dictionaries for easy access
-        # --- FIX: Acquire lock for safe read from multiple threads ---
+        # Runtime values: lock-free read from the runtime store
+        if key in TRANSIENT_KEYS:
+            return self.runtime.get(key, default)
+        
+        # Fast path: indexed and lock-free. A single key's value is replaced by one
+        # dict store, so an unlocked read sees either the old or the new value.
+        try:
+            return self.settings[self._key_index[key]][key]
+        except (KeyError, TypeError):
+            pass
+        
+        # Stale index (e.g. the settings were just replaced): scan under the lock
         with self._data_lock:
-            for category in self.settings.values():
-                if isinstance(category, dict) and key in category:
-                    return category[key]
+            category = self._find_category(key)
+            if category is not None:
+                return category[key]
         return default
 
     def set(self, key, value):
         # A simplified setter that finds the key in nested dictionaries and updates it
+        # Runtime values never touch the config lock or the disk
+        if key in TRANSIENT_KEYS:
+            if self.runtime.set(key, value) and self._subscribers:
+                self._notify({key: value})
+            return True
+        
         # --- FIX: Acquire lock for safe write from multiple threads ---
         with self._data_lock:
-            for category_name, category_data in self.settings.items():
-                if isinstance(category_data, dict) and key in category_data:
+            category_data = self.settings.get(self._key_index.get(key))
+            if not (isinstance(category_data, dict) and key in category_data):
+                category_data = self._find_category(key)
+            if category_data is not None:
+                changed = category_data[key] != value
+                if changed:
                     category_data[key] = value
-                    
-                    # --- CRITICAL FIX: Only save persistent settings to disk (avoiding disk I/O in the monitor loop) ---
-                    transient_keys = [
-                        "beer_temp_actual", "amb_temp_actual", "beer_temp_timestamp", "amb_temp_timestamp", 
-                        "og_timestamp_var", "sg_timestamp_var",
-                        "amb_min_setpoint", "amb_max_setpoint", "beer_setpoint_current", "amb_target_setpoint",
-                        "heat_state", "cool_state", 
-                        
-                        # --- NEW KEY: Add the restriction status key ---
-                        "cool_restriction_status", 
-                        # --- END NEW KEY ---
-                        
-                        # --- NEW KEY: Add sensor error message ---
-                        "sensor_error_message",
-                        # --- END NEW KEY ---
-
-                        "cooling_delay_message", "fan_state", "monitoring_state",
-                        "og_display_var", "sg_display_var", 
-                        
-                        # --- MODIFICATION: Added FG vars ---
-                        "fg_status_var", "fg_value_var"
-                        # --- END MODIFICATION ---
-                    ]
-                    
-                    if key not in transient_keys:
-                         self._save_all_settings() # Save persistent data to disk
-                    # Transient data is only updated in memory, which is what the monitoring loop needs.
-                    return True
+                    self._save_all_settings() # Persisted by the coalescing writer
+        if category_data is not None:
+            if changed:
+                self._notify({key: value})
+            return True
         
         # If key was not found, log an error
         print(f"[ERROR] SettingsManager: Key '{key}' not found in any category. Set failed.")
@@ -416,9 +768,7 @@ class SettingsManager:
 
     def save_control_settings(self, new_settings):
         # Assumes new_settings contains all keys from _get_default_control_settings
-        with self._data_lock: # FIX: Acquire lock
-            self.settings['control_settings'].update(new_settings)
-            self._save_all_settings()
+        self._update_category('control_settings', new_settings)
 
     def get_all_smtp_settings(self):
         with self._data_lock: # FIX: Acquire lock
@@ -431,10 +781,12 @@ class SettingsManager:
     def save_status_request_settings(self, new_settings):
         # Assumes new_settings contains all keys from _get_default_status_request_settings
         with self._data_lock: # FIX: Acquire lock
-            self.settings['status_request_settings'].update(new_settings)
-            self.settings['smtp_settings']['smtp_server'] = new_settings.get('smtp_server', self.settings['smtp_settings']['smtp_server'])
-            self.settings['smtp_settings']['smtp_port'] = new_settings.get('smtp_port', self.settings['smtp_settings']['smtp_port'])
-            self._save_all_settings()
+            smtp_update = {
+                'smtp_server': new_settings.get('smtp_server', self.settings['smtp_settings']['smtp_server']),
+                'smtp_port': new_settings.get('smtp_port', self.settings['smtp_settings']['smtp_port']),
+            }
+        self._update_category('status_request_settings', new_settings)
+        self._update_category('smtp_settings', smtp_update)
 
     def get_all_api_settings(self):
         with self._data_lock: # FIX: Acquire lock
@@ -442,27 +794,28 @@ class SettingsManager:
         
     def save_api_settings(self, new_settings):
         # Assumes new_settings contains all keys from _get_default_api_settings
-        with self._data_lock: # FIX: Acquire lock
-            self.settings['api_settings'].update(new_settings)
-            self._save_all_settings()
+        self._update_category('api_settings', new_settings)
 
     def get_all_compressor_protection_settings(self):
         with self._data_lock: # FIX: Acquire lock
             return self.settings['compressor_protection_settings'].copy()
         
     def save_compressor_protection_settings(self, new_settings):
-        with self._data_lock: # FIX: Acquire lock
-            self.settings['compressor_protection_settings'].update(new_settings)
-            self._save_all_settings()
+        self._update_category('compressor_protection_settings', new_settings)
         
     def set_controlled_shutdown(self, is_controlled):
         with self._data_lock: # FIX: Acquire lock
             self.settings['system_settings']['controlled_shutdown'] = is_controlled
             self._save_all_settings()
+        # The app exits right after this; the flag (and anything pending) must be on disk
+        self.flush()
 
     def set_temp_for_mode_override(self, key, value):
         """Used by Ramp-Up logic to update the PID target temporarily without saving."""
         with self._data_lock: # FIX: Acquire lock
+            changed = key in self.settings['control_settings'] and self.settings['control_settings'][key] != value
             if key in self.settings['control_settings']:
                  self.settings['control_settings'][key] = value
             # Note: No save to disk is performed here.
+        if changed:
+            self._notify({key: value})
@@ -0,0 +1,188 @@
+"""
+fermvault app
+system_log_writer.py
+"""
+
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import io_accounting
+from log_rotation import LogRotator, csv_first_timestamp, CSV_TIME_FORMAT
+
+# --- DEFAULTS ---
+SYSTEM_LOG_QUEUE_SIZE = 2000
+SYSTEM_LOG_FLUSH_ROWS = 50         # Flush after this many buffered messages...
+SYSTEM_LOG_FLUSH_INTERVAL_S = 5.0  # ...or this long after the first unflushed one
+SYSTEM_LOG_HEADER = "Timestamp,Action\n"
+# --- END DEFAULTS ---
+
+_FLUSH = "flush"
+_STOP = "stop"
+
+
+class SystemLogWriter:
+    """
+    Appends system log messages to system_log.csv from a background thread.
+
+    write() only queues (any thread, never blocks). The writer keeps the file
+    open, flushes in batches, reopens it if it was moved or deleted, and
+    rotates it with the shared log_rotation policy.
+    """
+
+    def __init__(self, path, rotation=None, max_queue=SYSTEM_LOG_QUEUE_SIZE,
+                 flush_rows=SYSTEM_LOG_FLUSH_ROWS, flush_interval_s=SYSTEM_LOG_FLUSH_INTERVAL_S):
+        self.path = path
+        self._rotator = LogRotator(path, rotation) if rotation is not None else None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._flush_rows = flush_rows
+        self._flush_interval_s = flush_interval_s
+        self._file = None
+        self._inode = None
+        self._flushed_size = 0
+        self._segment_start = None
+        self._error_reported = False
+        self.dropped = 0
+        self._dropped_reported = 0
+        self._thread = threading.Thread(target=self._run, name="system-log", daemon=True)
+        self._thread.start()
+
+    # --- CALLER SIDE ---
+    def write(self, message, timestamp=None):
+        try:
+            self._queue.put_nowait((timestamp or time.time(), message))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout=2.0):
+        done = threading.Event()
+        try:
+            self._queue.put((_FLUSH, done), timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def close(self, timeout=2.0):
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put((_STOP, None), timeout=timeout)
+        except queue.Full:
+            print("[SystemLogWriter] Queue full at shutdown; unwritten messages lost.")
+            return
+        self._thread.join(timeout)
+
+    # --- WRITER THREAD ---
+    def _run(self):
+        pending_rows = 0
+        first_pending = 0.0
+        while True:
+            timeout = None
+            if pending_rows:
+                timeout = max(0.0, first_pending + self._flush_interval_s - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is None:
+                pass # Flush interval reached
+            elif item[0] == _FLUSH:
+                self._flush()
+                pending_rows = 0
+                item[1].set()
+                continue
+            elif item[0] == _STOP:
+                self._flush()
+                self._close_file()
+                return
+            else:
+                if self._write_row(*item):
+                    if not pending_rows:
+                        first_pending = time.monotonic()
+                    pending_rows += 1
+                if pending_rows < self._flush_rows:
+                    continue
+
+            if pending_rows:
+                self._flush()
+                pending_rows = 0
+
+    def _open(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._flushed_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            self._file = open(self.path, 'a', newline='', encoding='utf-8')
+            self._inode = os.fstat(self._file.fileno()).st_ino
+            if self._flushed_size == 0:
+                self._file.write(SYSTEM_LOG_HEADER)
+            self._segment_start = csv_first_timestamp(self.path) if self._flushed_size else None
+            self._error_reported = False
+            return True
+        except OSError as e:
+            self._close_file()
+            self._report_error(f"Error writing to system log: {e}")
+            return False
+
+    def _write_row(self, timestamp, message):
+        if self._file is None and not self._open():
+            return False
+        try:
+            # Escape quotes in message just in case
+            clean_msg = message.replace('"', '""')
+            self._file.write(f'"{datetime.fromtimestamp(timestamp).strftime(CSV_TIME_FORMAT)}","{clean_msg}"\n')
+        except OSError as e:
+            self._report_error(f"Error writing to system log: {e}")
+            self._close_file()
+            return False
+        if self._segment_start is None:
+            self._segment_start = timestamp
+        return True
+
+    def _flush(self):
+        dropped = self.dropped - self._dropped_reported
+        if dropped:
+            self._dropped_reported += dropped
+            print(f"[SystemLogWriter] Queue full: dropped {dropped} messages ({self.dropped} total).")
+        if self._file is None:
+            return
+        try:
+            self._file.flush()
+            size = os.fstat(self._file.fileno()).st_size
+            io_accounting.record_write(self.path, max(0, size - self._flushed_size))
+            self._flushed_size = size
+        except OSError as e:
+            self._report_error(f"Error writing to system log: {e}")
+            self._close_file()
+            return
+        if self._rotator is not None and self._rotator.should_rotate(size, self._segment_start):
+            self._close_file()
+            try:
+                self._rotator.rotate(self._segment_start)
+            except OSError as e:
+                print(f"[SystemLogWriter] Log rotation failed: {e}")
+            self._segment_start = None
+            return
+        # The file was deleted or moved away: start a new one on the next message
+        try:
+            if os.stat(self.path).st_ino != self._inode:
+                self._close_file()
+        except OSError:
+            self._close_file()
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _report_error(self, message):
+        if not self._error_reported:
+            self._error_reported = True # Once per failure, not once per message
+            print(message)
@@ -0,0 +1,249 @@
+"""
+fermvault app
+telemetry_store.py
+"""
+
+import csv
+import os
+import struct
+import sys
+import time
+from datetime import datetime
+
+from log_rotation import LogRotator, RotationPolicy, open_segment
+
+# --- FILE FORMAT ---
+# 16 byte header: magic | uint16 schema version | uint16 record size | uint32 created | uint32 reserved
+# then fixed-width little-endian records (36 bytes):
+#   uint32 epoch seconds | int32 x7 millidegrees F (setpoint, measured, PID output x1000,
+#   ambient min, ambient max, beer, ambient) | uint8 relay bits | uint8 mode | uint16 session
+# Schema 2 added the session number (see sessions.py) in what were 2 zero pad bytes in
+# schema 1, so schema 1 records read as schema 2 records with session 0 (= none).
+TELEMETRY_MAGIC = b"FVTS"
+TELEMETRY_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+HEADER = struct.Struct("<4sHHII")
+RECORD = struct.Struct("<IiiiiiiiBBH")
+MISSING = -2 ** 31 # int32 sentinel for "no reading"
+
+FIELDS = ("timestamp", "setpoint_mdeg", "measured_mdeg", "pid_output_milli", "amb_min_mdeg",
+          "amb_max_mdeg", "beer_mdeg", "amb_mdeg", "relays", "mode", "session")
+_NUMPY_FORMATS = ("<u4", "<i4", "<i4", "<i4", "<i4", "<i4", "<i4", "<i4", "u1", "u1", "<u2")
+_NUMPY_OFFSETS = (0, 4, 8, 12, 16, 20, 24, 28, 32, 33, 34)
+
+RELAY_HEAT = 1
+RELAY_COOL = 2
+RELAY_AUX = 4
+
+MODE_CODES = {"Ambient Hold": 1, "Beer Hold": 2, "Ramp-Up": 3, "Fast Crash": 4}
+MODE_NAMES = {code: name for name, code in MODE_CODES.items()}
+# --- END FILE FORMAT ---
+
+CSV_FIELDNAMES = ['Timestamp', 'ControlMode', 'Setpoint', 'MeasuredTemp', 'PID_Output',
+                  'AmbientSetpoint_Min', 'AmbientSetpoint_Max', 'CoolState', 'HeatState',
+                  'BeerTemp', 'AmbientTemp', 'AuxState', 'Session']
+
+
+def to_milli(value):
+    """Float degrees -> int32 millidegrees (MISSING for None or out of range)."""
+    if value is None:
+        return MISSING
+    try:
+        milli = int(round(float(value) * 1000.0))
+    except (TypeError, ValueError):
+        return MISSING
+    return milli if MISSING < milli < 2 ** 31 else MISSING
+
+
+def from_milli(value):
+    return None if value == MISSING else value / 1000.0
+
+
+class TelemetryWriter:
+    """
+    Append-only writer. Same sink interface as the CSV sink in pid_logger:
+    open(), write(sample), flush(), close(), and .file while open.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path):
+            size = os.path.getsize(self.path)
+            # Power cut mid-write: drop a partial record so later ones stay aligned,
+            # or a partial header so a fresh one is written below
+            torn = (size - HEADER.size) % RECORD.size if size >= HEADER.size else size
+            if torn:
+                os.truncate(self.path, size - torn)
+            if size >= HEADER.size:
+                self._upgrade_header()
+        self.file = open(self.path, "ab")
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.write(HEADER.pack(TELEMETRY_MAGIC, TELEMETRY_VERSION, RECORD.size, int(time.time()), 0))
+
+    def _upgrade_header(self):
+        """Schema 1 files continue as schema 2 (same record layout, pad bytes = session 0)."""
+        with open(self.path, "r+b") as f:
+            magic, version, record_size, created, reserved = HEADER.unpack(f.read(HEADER.size))
+            if magic == TELEMETRY_MAGIC and version == 1 and record_size == RECORD.size:
+                f.seek(0)
+                f.write(HEADER.pack(magic, TELEMETRY_VERSION, record_size, created, reserved))
+
+    def write(self, sample):
+        """sample: the PIDLogger tuple (see pid_logger.PIDLogger.log)."""
+        (timestamp, control_mode, setpoint, measured_temp, pid_output, amb_min, amb_max,
+         cool_on, heat_on, beer_temp, amb_temp, aux_on, session_no) = sample
+        relays = (RELAY_HEAT if heat_on else 0) | (RELAY_COOL if cool_on else 0) | (RELAY_AUX if aux_on else 0)
+        self.file.write(RECORD.pack(
+            int(timestamp), to_milli(setpoint), to_milli(measured_temp), to_milli(pid_output),
+            to_milli(amb_min), to_milli(amb_max), to_milli(beer_temp), to_milli(amb_temp),
+            relays, MODE_CODES.get(control_mode, 0), session_no or 0,
+        ))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def first_timestamp(self):
+        """Timestamp of the file's first record, or None (used for rotation by age)."""
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(HEADER.size)
+                data = f.read(RECORD.size)
+        except OSError:
+            return None
+        return RECORD.unpack(data)[0] if len(data) == RECORD.size else None
+
+
+def _check_header(header, name):
+    if len(header) < HEADER.size:
+        raise ValueError(f"{name}: not a telemetry file (too short)")
+    magic, version, record_size, created, _reserved = HEADER.unpack(header)
+    if magic != TELEMETRY_MAGIC:
+        raise ValueError(f"{name}: not a telemetry file")
+    if version not in SUPPORTED_VERSIONS or record_size != RECORD.size:
+        raise ValueError(f"{name}: unsupported telemetry schema {version}")
+    return version, record_size, created
+
+
+def stream_records(f, name="<stream>"):
+    """Yields the records of an open telemetry stream (e.g. a gzip segment)."""
+    _check_header(f.read(HEADER.size), name)
+    carry = b""
+    while True:
+        data = f.read(4096 * RECORD.size)
+        if not data:
+            return # A torn final record (in carry) is ignored
+        chunk = carry + data
+        usable = len(chunk) - len(chunk) % RECORD.size
+        carry = chunk[usable:]
+        for record in RECORD.iter_unpack(chunk[:usable]):
+            yield record
+
+
+def read_range(path, start=None, end=None, policy=None):
+    """
+    Yields records with start <= timestamp < end across the rotated segments
+    of path (see log_rotation), oldest first. Only overlapping segments are opened.
+    """
+    rotator = LogRotator(path, policy or RotationPolicy())
+    for seg_path in rotator.segments(start, end):
+        try:
+            f = open_segment(seg_path)
+        except OSError:
+            continue # Deleted by retention since the index was read
+        with f:
+            for record in stream_records(f, seg_path):
+                if end is not None and record[0] >= end:
+                    break
+                if start is None or record[0] >= start:
+                    yield record
+
+
+class TelemetryReader:
+    """Reads a telemetry file. records() needs nothing extra; columns() needs NumPy."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+        self.version, self.record_size, self.created = _check_header(header, path)
+
+    def __len__(self):
+        return max(0, os.path.getsize(self.path) - HEADER.size) // self.record_size
+
+    def records(self):
+        """Yields one tuple per record, in FIELDS order."""
+        count = len(self)
+        with open(self.path, "rb") as f:
+            f.seek(HEADER.size)
+            remaining = count
+            while remaining:
+                chunk = f.read(min(remaining, 4096) * RECORD.size)
+                if not chunk:
+                    break
+                usable = len(chunk) - len(chunk) % RECORD.size
+                for record in RECORD.iter_unpack(chunk[:usable]):
+                    yield record
+                remaining -= usable // RECORD.size
+
+    def columns(self):
+        """
+        Returns a read-only NumPy structured memmap over the records: each
+        column (e.g. arr["beer_mdeg"]) is a strided view of the file, nothing
+        is copied. Raises ImportError if NumPy is not installed.
+        """
+        import numpy as np
+        dtype = np.dtype({"names": list(FIELDS), "formats": list(_NUMPY_FORMATS),
+                          "offsets": list(_NUMPY_OFFSETS), "itemsize": RECORD.size})
+        count = len(self)
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=HEADER.size, shape=(count,))
+
+
+def record_to_csv_row(record):
+    timestamp, setpoint, measured, pid_output, amb_min, amb_max, beer, amb, relays, mode, session_no = record
+
+    def fmt(value, digits):
+        value = from_milli(value)
+        return "" if value is None else f"{value:.{digits}f}"
+
+    return [
+        datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S"),
+        MODE_NAMES.get(mode, "Unknown"),
+        fmt(setpoint, 2), fmt(measured, 3), fmt(pid_output, 3), fmt(amb_min, 2), fmt(amb_max, 2),
+        "ON" if relays & RELAY_COOL else "OFF",
+        "ON" if relays & RELAY_HEAT else "OFF",
+        fmt(beer, 3), fmt(amb, 3),
+        "ON" if relays & RELAY_AUX else "OFF",
+        session_no or "",
+    ]
+
+
+def export_csv(source_path, dest_path):
+    """Converts a telemetry file to the pid_log.csv layout (plus beer/ambient/aux). Returns rows written."""
+    reader = TelemetryReader(source_path)
+    rows = 0
+    with open(dest_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDNAMES)
+        for record in reader.records():
+            writer.writerow(record_to_csv_row(record))
+            rows += 1
+    return rows
+
+
+if __name__ == "__main__":
+    # python3 telemetry_store.py pid_log.bin pid_log.csv
+    if len(sys.argv) != 3:
+        print("usage: telemetry_store.py SOURCE.bin DEST.csv")
+        sys.exit(2)
+    print(f"Exported {export_csv(sys.argv[1], sys.argv[2])} records to {sys.argv[2]}.")
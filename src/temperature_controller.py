@@ -10,7 +10,17 @@ import time
 from datetime import datetime
 import glob
 import os
-import csv
+
+from pid_logger import PIDLogger, create_sink
+from log_rotation import RotationPolicy, ROTATION_SETTING_KEYS
+from beer_estimator import BeerTempEstimator
+from eta_predictor import TempTrendEstimator, format_duration
+
+# --- DEFAULTS ---
+CONTROL_TICK_S = 5.0               # Monitor loop wait between control ticks
+HISTORY_STANDBY_INTERVAL_S = 60.0  # History sample interval while monitoring is off
+STANDBY_MODE = "Standby"           # Mode recorded for those samples
+# --- END DEFAULTS ---
 
 # --- PID CLASS DEFINITION ---
 class PID:
@@ -40,6 +50,8 @@ class TemperatureController:
         self.settings_manager = settings_manager
         self.relay_control = relay_control
         self.notification_manager = None
+        self.history = None # HistoryDB, set by the app
+        self._last_standby_sample = 0.0
         
         # Read PID values from settings
         kp = self.settings_manager.get("pid_kp", 2.0)
@@ -59,6 +71,17 @@ class TemperatureController:
         self._beer_sensor_ok = True
         self._amb_sensor_ok = True
         self._fail_safe_logged = False
+        self._fail_safe_mode = None # "estimate" or "ambient" while fail-safe is active
+        
+        # --- NEW: Model-based beer estimate for probe loss ---
+        self.beer_estimator = BeerTempEstimator()
+        # -----------------------------------------------------
+        
+        # --- NEW: Beer trajectory fit for ETA and ramp lag warnings ---
+        self.beer_trend = TempTrendEstimator()
+        self._eta_short = ""
+        self._ramp_lag_logged = False
+        # --------------------------------------------------------------
         
         # Ramp state
         self.ramp_state = {
@@ -78,59 +101,167 @@ class TemperatureController:
             self.data_dir = os.path.join(os.path.expanduser('~'), 'fermvault_lite-data')
         # ----------------------------------------------------------------
 
+        # --- NEW: PID CSV written off the control thread ---
+        self._pid_log_base = os.path.join(self.data_dir, "pid_log")
+        self.log_rotation = RotationPolicy.from_settings(self.settings_manager)
+        self.pid_logger = PIDLogger(
+            create_sink(self._pid_log_base, self.settings_manager.get("pid_log_format", "binary")),
+            on_error=self._report_log_error,
+            rotation=self.log_rotation,
+        )
+        self.settings_manager.subscribe(self._on_pid_log_format_changed, keys=("pid_log_format",))
+        self.settings_manager.subscribe(
+            lambda changes: self.log_rotation.apply_settings(self.settings_manager), keys=ROTATION_SETTING_KEYS
+        )
+
     def _log_pid_data(self, setpoint, measured_temp, pid_output, amb_min, amb_max):
-        """Logs temperature data to a CSV file if enabled in settings."""
+        """Queues a PID sample for pid_log.csv if enabled in settings (written by PIDLogger's thread)."""
         
         # Guard clause: Check if logging is enabled
         if not self.settings_manager.get("pid_logging_enabled", False):
             return
             
-        try:
-            # 1. Ensure data directory exists
-            os.makedirs(self.data_dir, exist_ok=True)
-            
-            # 2. Define the log file path (MATCHING UI LABEL)
-            log_file_path = os.path.join(self.data_dir, "pid_log.csv") 
+        relay_status = self.relay_control.status
+        self.pid_logger.log(
+            setpoint, measured_temp, pid_output, amb_min, amb_max,
+            self.settings_manager.get("control_mode", "Unknown"),
+            relay_status.cool_on, relay_status.heat_on,
+            beer_temp=self.settings_manager.get("beer_temp_actual"),
+            amb_temp=self.settings_manager.get("amb_temp_actual"),
+            aux_on=relay_status.aux_on,
+        )
 
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            file_exists = os.path.isfile(log_file_path)
-            
-            # Get relay states and control mode
-            cool_state = "ON" if "COOLING" in self.settings_manager.get("cool_state") else "OFF"
-            heat_state = "ON" if "HEATING" in self.settings_manager.get("heat_state") else "OFF"
-            control_mode = self.settings_manager.get("control_mode", "Unknown")
+    def _on_pid_log_format_changed(self, changes):
+        self.pid_logger.set_sink(create_sink(self._pid_log_base, changes["pid_log_format"]))
 
-            # 3. Write Data
-            with open(log_file_path, 'a', newline='') as csvfile:
-                fieldnames = ['Timestamp', 'ControlMode', 'Setpoint', 'MeasuredTemp', 'PID_Output', 'AmbientSetpoint_Min', 'AmbientSetpoint_Max', 'CoolState', 'HeatState']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    def _report_log_error(self, log_msg):
+        if self.notification_manager and self.notification_manager.ui:
+            self.notification_manager.ui.log_system_message(log_msg)
 
-                if not file_exists:
-                    writer.writeheader()
-                
-                writer.writerow({
-                    'Timestamp': timestamp,
-                    'ControlMode': control_mode,
-                    'Setpoint': f"{setpoint:.2f}",
-                    'MeasuredTemp': f"{measured_temp:.3f}",
-                    'PID_Output': f"{pid_output:.4f}",
-                    'AmbientSetpoint_Min': f"{amb_min:.2f}",
-                    'AmbientSetpoint_Max': f"{amb_max:.2f}",
-                    'CoolState': cool_state,
-                    'HeatState': heat_state
-                })
-        
-        except (PermissionError, IOError) as e:
-            log_msg = f"[CRITICAL ERROR] Failed to write PID log to {self.data_dir}: {e}"
-            print(log_msg)
+    def _step_beer_estimator(self, beer_temp, amb_temp):
+        """Feeds this tick's readings plus the relay states applied since the last tick."""
+        cache = self.relay_control.relay_state_cache
+        self.beer_estimator.step(beer_temp, amb_temp, cache.get("Heat", False), cache.get("Cool", False))
+
+    def _get_beer_estimate(self):
+        """Returns (temp_f, sigma_f) if control may run on the estimate, else None."""
+        if not self.settings_manager.get("beer_estimator_enabled", True):
+            return None
+        return self.beer_estimator.get_estimate(
+            self.settings_manager.get("beer_estimator_max_age_s", 14400),
+            self.settings_manager.get("beer_estimator_max_sigma_f", 2.0)
+        )
+
+    def add_hydrometer_temperature(self, temp_f, measured_at):
+        """Fuses a hydrometer beer temperature (F) into the estimate while the probe is lost."""
+        sigma_f = self.settings_manager.get("beer_estimator_hydrometer_sigma_f", 1.0)
+        if self.beer_estimator.add_external_measurement(temp_f, sigma_f, measured_at):
             if self.notification_manager and self.notification_manager.ui:
-                self.notification_manager.ui.log_system_message(log_msg)
+                self.notification_manager.ui.log_system_message(f"FAIL-SAFE: Beer estimate corrected with hydrometer reading ({temp_f:.1f} F).")
+            return True
+        return False
+
+    # --- ETA PREDICTION ---
+    def _update_eta(self, beer_value, current_mode, beer_setpoint_current, ramp_end_target, ramp_start_time, ramp_is_finished):
+        """
+        Feeds the beer trajectory fit and returns a short ETA for the dashboard.
+        The long form is published for status emails; a latched warning is
+        logged when the beer falls behind the moving ramp target.
+        """
+        now = time.time()
+        try:
+            beer_f = float(beer_value)
+        except (TypeError, ValueError):
+            beer_f = None
+            
+        if beer_f is not None:
+            self.beer_trend.add(now, beer_f)
+        
+        short_msg = ""
+        long_msg = ""
+        
+        ramp_running = (current_mode == "Ramp-Up" and not self.ramp_state["is_in_pre_ramp"] and not ramp_is_finished)
+        
+        # Control runs in F; the text is shown in the selected unit (deltas scale by 5/9)
+        units = self.settings_manager.get("temp_units", "F")
+        
+        if beer_f is not None and current_mode in ["Beer Hold", "Ramp-Up", "Fast Crash"]:
+            target = ramp_end_target if ramp_running else beer_setpoint_current
+            seconds = self.beer_trend.seconds_to_target(target, now, tolerance=0.3)
+            
+            if seconds is None:
+                short_msg = "ETA --"
+                long_msg = "Not converging on target yet"
+            elif seconds == 0:
+                short_msg = "ON TARGET"
+                long_msg = "At target"
+            else:
+                eta_str = datetime.fromtimestamp(now + seconds).strftime("%m-%d %H:%M")
+                short_msg = f"ETA {format_duration(seconds)}"
+                display_target = target if units == "F" else ((target - 32) * 5/9)
+                long_msg = f"{display_target:.1f} {units} in {format_duration(seconds)} ({eta_str})"
+            
+            if ramp_running:
+                duration_hours = self.settings_manager.get("ramp_up_duration_hours", 30.0)
+                scheduled_end = ramp_start_time + duration_hours * 3600
+                if seconds:
+                    late_s = (now + seconds) - scheduled_end
+                    if late_s > 0:
+                        long_msg += f", {format_duration(late_s)} behind schedule"
                 
-        except Exception as e:
-            log_msg = f"[ERROR] Failed to write to PID log file: {e}"
-            print(log_msg)
-            if self.notification_manager and self.notification_manager.ui:
-                self.notification_manager.ui.log_system_message(log_msg)
+                # Lag = how far the beer trails the moving target, in the ramp direction
+                direction = 1.0 if ramp_end_target >= self.settings_manager.get("beer_hold_f", 55.0) else -1.0
+                lag_f = (beer_setpoint_current - beer_f) * direction
+                LAG_LIMIT = self.settings_manager.get("ramp_lag_warning_f", 1.0)
+                
+                if lag_f > LAG_LIMIT:
+                    display_lag = lag_f if units == "F" else (lag_f * 5/9)
+                    short_msg = f"LAG {display_lag:.1f}{units}"
+                    if not self._ramp_lag_logged:
+                        if self.notification_manager and self.notification_manager.ui:
+                            self.notification_manager.ui.log_system_message(f"Ramp-Up: Beer is {display_lag:.1f} {units} behind the ramp target. {long_msg}.")
+                        self._ramp_lag_logged = True
+                elif lag_f < LAG_LIMIT / 2.0:
+                    self._ramp_lag_logged = False
+        
+        self._eta_short = short_msg
+        self.settings_manager.set("beer_eta_message", long_msg)
+        return short_msg
+
+    def _run_mode_logic(self, current_mode, beer_temp, amb_temp, beer_setpoint_current):
+        """
+        Runs the normal control logic for the active mode and derives relay demand.
+        Returns (amb_min, amb_max, ramp_target_message, desired_heat, desired_cool).
+        """
+        amb_min, amb_max = 0.0, 0.0
+        ramp_target_message = ""
+        desired_heat = False
+        desired_cool = False
+        
+        if current_mode == "Ambient Hold": amb_min, amb_max = self.ambient_hold_logic(amb_temp)
+        elif current_mode == "Beer Hold": amb_min, amb_max = self.beer_hold_logic(beer_temp, amb_temp)
+        elif current_mode == "Ramp-Up": amb_min, amb_max, ramp_target_message = self.ramp_up_logic(beer_temp, amb_temp)
+        elif current_mode == "Fast Crash": amb_min, amb_max = self.fast_crash_logic(beer_temp, amb_temp)
+
+        # --- DETERMINE RELAY ACTIONS ---
+        if current_mode == "Ramp-Up" and amb_min is None:
+            # STATE 2: We are in the Main Ramp (Thermostatic) phase
+            THERMOSTAT_DEADBAND = self.settings_manager.get("ramp_thermo_deadband", 0.1) 
+            target = beer_setpoint_current # The moving target
+            
+            if beer_temp < (target - THERMOSTAT_DEADBAND):
+                desired_heat = True
+                desired_cool = False
+            elif beer_temp > (target + THERMOSTAT_DEADBAND):
+                desired_heat = False
+                desired_cool = True
+        
+        else:
+            # All other modes (PID-driven ambient envelope)
+            desired_heat = amb_temp < amb_min
+            desired_cool = amb_temp > amb_max
+            
+        return amb_min, amb_max, ramp_target_message, desired_heat, desired_cool
 
     def ambient_hold_logic(self, amb_temp):
         """Controls Ambient Temp to the Ambient Hold Setpoint (Simple Thermostat)."""
@@ -484,6 +615,8 @@ class TemperatureController:
         self._beer_sensor_ok = current_beer_ok
         self._amb_sensor_ok = current_amb_ok
         
+        self._step_beer_estimator(beer_temp, amb_temp)
+        
         # --- Update timestamps in settings ---
         current_time_str = datetime.now().strftime("%H:%M:%S")
         if current_beer_ok:
@@ -569,6 +702,7 @@ class TemperatureController:
                 if self.notification_manager and self.notification_manager.ui:
                     self.notification_manager.ui.log_system_message("FAIL-SAFE: Beer sensor re-connected. Resuming normal control.")
                 self._fail_safe_logged = False
+                self._fail_safe_mode = None
             
             if current_mode == "Ambient Hold": amb_min, amb_max = self.ambient_hold_logic(amb_temp)
             elif current_mode == "Beer Hold": amb_min, amb_max = self.beer_hold_logic(beer_temp, amb_temp)
@@ -581,6 +715,7 @@ class TemperatureController:
                 if self.notification_manager and self.notification_manager.ui:
                     self.notification_manager.ui.log_system_message("FAIL-SAFE: Resuming normal shutdown (other sensor failed).")
                 self._fail_safe_logged = False
+                self._fail_safe_mode = None
             
             # amb_min/max are already 0.0 (shutdown state)
             pass 
@@ -595,6 +730,17 @@ class TemperatureController:
             ambient_target_setpoint 
         )
         
+        # Standby only (the monitor loop records its own samples): relays are held OFF,
+        # so a sample per minute is enough to keep the temperature history going
+        now = time.time()
+        if self.history and not self._monitoring and now - self._last_standby_sample >= HISTORY_STANDBY_INTERVAL_S:
+            self._last_standby_sample = now
+            self.history.add_sample(
+                beer_temp if current_beer_ok else None, amb_temp if current_amb_ok else None,
+                None, None, beer_setpoint_current, STANDBY_MODE,
+                False, False, False, timestamp=now,
+            )
+        
         if self.notification_manager and self.notification_manager.ui:
             # FIX: Read the LIVE hardware state directly from the Relay Controller's cache
             # This prevents "stale" settings text from causing a flash.
@@ -609,8 +755,8 @@ class TemperatureController:
                 beer_setpoint=beer_setpoint_current,
                 
                 # DIRECT SIGNAL MAPPING
-                heat_state="HEATING" if real_heat else "Heating OFF",
-                cool_state="COOLING" if real_cool else "Cooling OFF",
+                heat_on=real_heat,
+                cool_on=real_cool,
                 
                 amb_target=ambient_target_setpoint,
                 current_mode=current_mode,
@@ -618,7 +764,8 @@ class TemperatureController:
                 ramp_start_time=ramp_start_time,
                 ramp_is_finished=ramp_is_finished,
                 ramp_target_message=ramp_target_message,
-                sensor_error_message=sensor_error_message
+                sensor_error_message=sensor_error_message,
+                eta_message=self._eta_short if self._monitoring else ""
             )
         
     # --- MONITORING THREAD ---
@@ -627,6 +774,10 @@ class TemperatureController:
             self._monitoring = True
             self.settings_manager.set("monitoring_state", "ON")
             
+            # Stale samples from a previous session would skew the trajectory fit
+            self.beer_trend.clear()
+            self._ramp_lag_logged = False
+            
             # --- MODIFICATION: Removed explicit fan ON call ---
             # self.relay_control.turn_on_fan() 
             # -------------------------------------------------
@@ -653,6 +804,7 @@ class TemperatureController:
 
     def _monitor_loop(self):
         while True:
+            tick_started = time.monotonic()
             # --- 1. READ SENSORS AND MANAGE LATCHED LOGGING ---
             beer_temp = self.read_beer_temperature()
             amb_temp = self.read_ambient_temperature()
@@ -684,6 +836,9 @@ class TemperatureController:
             self._beer_sensor_ok = current_beer_ok
             self._amb_sensor_ok = current_amb_ok
             
+            # --- NEW: Keep the beer model running (learns while the probe is healthy) ---
+            self._step_beer_estimator(beer_temp, amb_temp)
+            
             # --- Update timestamps in settings ---
             current_time_str = datetime.now().strftime("%H:%M:%S")
             if current_beer_ok:
@@ -716,6 +871,18 @@ class TemperatureController:
                     else:
                         sensor_error_message = "FAIL: Ambient Sensor Missing"
             
+            # --- NEW: Beer estimate is only usable while ambient is still measured ---
+            beer_estimate = None
+            if "FAIL: Beer Sensor" in sensor_error_message and current_amb_ok:
+                beer_estimate = self._get_beer_estimate()
+                if beer_estimate is not None:
+                    sensor_error_message += " (Estimating)"
+            
+            # Value shown as "beer actual" (probe, estimate, or no data)
+            if current_beer_ok: beer_display = beer_temp
+            elif beer_estimate is not None: beer_display = beer_estimate[0]
+            else: beer_display = "--.-"
+            
             self.settings_manager.set("sensor_error_message", sensor_error_message)
 
             # --- 3. DETERMINE LOGIC & SETPOINTS ---
@@ -749,19 +916,37 @@ class TemperatureController:
             fail_safe_active = ("FAIL: Beer Sensor" in sensor_error_message) and current_amb_ok
             
             if fail_safe_active:
-                if not self._fail_safe_logged:
+                fail_safe_mode = "estimate" if beer_estimate is not None else "ambient"
+                
+                if not self._fail_safe_logged or self._fail_safe_mode != fail_safe_mode:
                     if self.notification_manager and self.notification_manager.ui:
-                        self.notification_manager.ui.log_system_message(f"FAIL-SAFE: Beer sensor failed. Holding chamber at {beer_setpoint_current:.1f} F.")
+                        if fail_safe_mode == "estimate":
+                            est_temp, est_sigma = beer_estimate
+                            self.notification_manager.ui.log_system_message(
+                                f"FAIL-SAFE: Beer sensor failed. Controlling on estimated beer temp "
+                                f"{est_temp:.1f} F (+/- {est_sigma:.1f} F; {self.beer_estimator.get_model_summary()})."
+                            )
+                        elif self._fail_safe_mode == "estimate":
+                            self.notification_manager.ui.log_system_message(f"FAIL-SAFE: Beer estimate expired or too uncertain. Holding chamber at {beer_setpoint_current:.1f} F.")
+                        else:
+                            self.notification_manager.ui.log_system_message(f"FAIL-SAFE: Beer sensor failed. Holding chamber at {beer_setpoint_current:.1f} F.")
                     self._fail_safe_logged = True
+                    self._fail_safe_mode = fail_safe_mode
                 
-                # Override: Use simple thermostatic control on AMBIENT
-                target_amb_temp = beer_setpoint_current
-                DEADBAND = self.settings_manager.get("ambient_deadband", 1.0) 
-                amb_min = target_amb_temp - DEADBAND
-                amb_max = target_amb_temp + DEADBAND
-                
-                desired_heat = amb_temp < amb_min
-                desired_cool = amb_temp > amb_max
+                if fail_safe_mode == "estimate":
+                    # Closed-loop control continues on the model estimate
+                    amb_min, amb_max, ramp_target_message, desired_heat, desired_cool = self._run_mode_logic(
+                        current_mode, beer_estimate[0], amb_temp, beer_setpoint_current
+                    )
+                else:
+                    # Override: Use simple thermostatic control on AMBIENT
+                    target_amb_temp = beer_setpoint_current
+                    DEADBAND = self.settings_manager.get("ambient_deadband", 1.0) 
+                    amb_min = target_amb_temp - DEADBAND
+                    amb_max = target_amb_temp + DEADBAND
+                    
+                    desired_heat = amb_temp < amb_min
+                    desired_cool = amb_temp > amb_max
 
             # Condition 2: Other Critical Sensor Error (Shutdown)
             elif sensor_error_message:
@@ -769,6 +954,7 @@ class TemperatureController:
                     if self.notification_manager and self.notification_manager.ui:
                         self.notification_manager.ui.log_system_message("FAIL-SAFE: Resuming normal shutdown (other sensor failed).")
                     self._fail_safe_logged = False
+                    self._fail_safe_mode = None
                 
                 desired_heat = False
                 desired_cool = False
@@ -779,30 +965,12 @@ class TemperatureController:
                     if self.notification_manager and self.notification_manager.ui:
                         self.notification_manager.ui.log_system_message("FAIL-SAFE: Beer sensor re-connected. Resuming normal control.")
                     self._fail_safe_logged = False
+                    self._fail_safe_mode = None
                 
                 # --- RUN NORMAL LOGIC FUNCTION ---
-                if current_mode == "Ambient Hold": amb_min, amb_max = self.ambient_hold_logic(amb_temp)
-                elif current_mode == "Beer Hold": amb_min, amb_max = self.beer_hold_logic(beer_temp, amb_temp)
-                elif current_mode == "Ramp-Up": amb_min, amb_max, ramp_target_message = self.ramp_up_logic(beer_temp, amb_temp)
-                elif current_mode == "Fast Crash": amb_min, amb_max = self.fast_crash_logic(beer_temp, amb_temp)
-
-                # --- DETERMINE RELAY ACTIONS ---
-                if current_mode == "Ramp-Up" and amb_min is None:
-                    # STATE 2: We are in the Main Ramp (Thermostatic) phase
-                    THERMOSTAT_DEADBAND = self.settings_manager.get("ramp_thermo_deadband", 0.1) 
-                    target = beer_setpoint_current # The moving target
-                    
-                    if beer_temp < (target - THERMOSTAT_DEADBAND):
-                        desired_heat = True
-                        desired_cool = False
-                    elif beer_temp > (target + THERMOSTAT_DEADBAND):
-                        desired_heat = False
-                        desired_cool = True
-                
-                else:
-                    # All other modes (PID-driven ambient envelope)
-                    desired_heat = amb_temp < amb_min
-                    desired_cool = amb_temp > amb_max
+                amb_min, amb_max, ramp_target_message, desired_heat, desired_cool = self._run_mode_logic(
+                    current_mode, beer_temp, amb_temp, beer_setpoint_current
+                )
             
             # --- 5. CHECK MONITORING STATE (THE SHUTDOWN OVERRIDE) ---
             if not self._monitoring:
@@ -815,6 +983,13 @@ class TemperatureController:
                     if self.notification_manager and self.notification_manager.ui:
                         self.notification_manager.ui.log_system_message("FAIL-SAFE: Monitoring stopped. Resuming normal shutdown.")
                     self._fail_safe_logged = False
+                    self._fail_safe_mode = None
+            
+            # --- 5b. TRAJECTORY / ETA ---
+            eta_message = self._update_eta(
+                beer_display, current_mode, beer_setpoint_current,
+                ramp_end_target, ramp_start_time, ramp_is_finished
+            )
             
             # --- 6. APPLY STATES (This section runs in ALL modes) ---
             # The relay_control now handles the Aux relay automatically here
@@ -822,8 +997,16 @@ class TemperatureController:
                 desired_heat, desired_cool, current_mode
             )
 
+            # --- 6b. RECORD HISTORY (the relay states actually applied) ---
+            if self.history:
+                self.history.add_sample(
+                    beer_temp if current_beer_ok else None, amb_temp if current_amb_ok else None,
+                    amb_min, amb_max, beer_setpoint_current, current_mode,
+                    final_heat, final_cool, self.relay_control.status.aux_on,
+                )
+
             self.relay_control.update_ui_data(
-                beer_temp if current_beer_ok else "--.-",
+                beer_display,
                 amb_temp if current_amb_ok else "--.-",
                 amb_min if amb_min is not None else 0.0, 
                 amb_max if amb_max is not None else 0.0, 
@@ -834,7 +1017,7 @@ class TemperatureController:
             # --- 7. PUSH DATA TO UI (ALWAYS) ---
             if self.notification_manager and self.notification_manager.ui:
                  self.notification_manager.ui.push_data_update(
-                    beer_temp=beer_temp if current_beer_ok else "--.-",
+                    beer_temp=beer_display,
                     amb_temp=amb_temp if current_amb_ok else "--.-",
                     amb_min=amb_min if amb_min is not None else 0.0, 
                     amb_max=amb_max if amb_max is not None else 0.0,
@@ -842,8 +1025,8 @@ class TemperatureController:
                     
                     # DIRECT SIGNAL: Use the exact variables (final_heat/final_cool) 
                     # that were calculated in this loop to drive the hardware.
-                    heat_state="HEATING" if final_heat else "Heating OFF",
-                    cool_state="COOLING" if final_cool else "Cooling OFF",
+                    heat_on=final_heat,
+                    cool_on=final_cool,
                     
                     amb_target=ambient_target_setpoint,
                     current_mode=current_mode,
@@ -851,7 +1034,8 @@ class TemperatureController:
                     ramp_start_time=ramp_start_time,
                     ramp_is_finished=ramp_is_finished,
                     ramp_target_message=ramp_target_message,
-                    sensor_error_message=sensor_error_message
+                    sensor_error_message=sensor_error_message,
+                    eta_message=eta_message
                  )
 
             # --- 8. CHECK FOR SAFE EXIT ---
@@ -864,13 +1048,13 @@ class TemperatureController:
                     # Ensure final OFF state is sent to UI
                     if self.notification_manager and self.notification_manager.ui:
                          self.notification_manager.ui.push_data_update(
-                            beer_temp=beer_temp if current_beer_ok else "--.-",
+                            beer_temp=beer_display,
                             amb_temp=amb_temp if current_amb_ok else "--.-",
                             amb_min=amb_min if amb_min is not None else 0.0,
                             amb_max=amb_max if amb_max is not None else 0.0,
                             beer_setpoint=beer_setpoint_current,
-                            heat_state="Heating OFF",
-                            cool_state="Cooling OFF",
+                            heat_on=False,
+                            cool_on=False,
                             amb_target=ambient_target_setpoint,
                             current_mode="OFF",
                             ramp_end_target=ramp_end_target,
@@ -884,9 +1068,16 @@ class TemperatureController:
                 else:
                     print("[Monitor Loop] Shutdown pending, waiting for compressor dwell time to expire...")
 
+            # --- 9. PET THE RELAY WATCHDOG (forces relays OFF if this loop stalls) ---
+            # Tick length = this tick's work (sensor reads, logging) plus the wait below
+            self.relay_control.pet_watchdog(CONTROL_TICK_S + time.monotonic() - tick_started)
+
             # The loop wait
-            self._stop_event.wait(5)
+            self._stop_event.wait(CONTROL_TICK_S)
             if self._stop_event.is_set():
                 break
+        
+        # Loop exited on purpose: stop supervising until monitoring restarts
+        self.relay_control.disarm_watchdog()
                 
         print("TemperatureController: Monitoring thread stopped.")